@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Compare HDF5 layouts for the augmented image datasets written by
+process_h5.py: chunk length (frames per chunk) × compression filter.
+
+For every layout it reports
+  • write MB/s   – raw uint8 bytes written per second (incl. compression)
+  • file size    – compression ratio vs. raw
+  • read fr/s    – training-loader style access: random (episode, frame)
+                   windows of --window frames (page cache is warm, so
+                   compare layouts with each other, not with NFS numbers)
+
+Frames come from real overlay videos when --videos is given (a folder of
+mp4s), otherwise from a synthetic smooth-noise stream (compresses like
+rendered robot frames, not like white noise).
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/benchmark_h5_layouts.py
+python /home/guanhuaji/mirage/robot2robot/rendering/benchmark_h5_layouts.py --videos paired_images/toto/UR5e_overlay --chunks 1 8 32 --filters gzip lz4 blosc
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from core.ingest import read_video
+from process_h5 import DECODE_BATCH, TARGET_SIZE, compression_kwargs, video_chunks
+
+
+def _synthetic_episodes(n_eps, length, rng):
+    H, W = 84, 84
+    yy, xx = np.mgrid[0:H, 0:W]
+    for e in range(n_eps):
+        t = np.arange(length)[:, None, None]
+        base = (np.sin(xx / 9.0 + t / 7.0 + e) + np.cos(yy / 11.0 - t / 5.0)) * 60 + 128
+        noise = rng.integers(0, 8, size=(length, H, W), dtype=np.int16)
+        gray = np.clip(base + noise, 0, 255).astype(np.uint8)
+        yield np.stack((gray, gray[:, ::-1], gray[:, :, ::-1]), axis=-1)
+
+
+def _load_episodes(args, rng):
+    if args.videos:
+        paths = sorted(Path(args.videos).glob("*.mp4"))[: args.episodes]
+        return [read_video(p, TARGET_SIZE, batch=DECODE_BATCH) for p in paths]
+    return list(_synthetic_episodes(args.episodes, args.length, rng))
+
+
+def bench_layout(episodes, chunk_frames, filter_name, window, reads, rng, tmpdir):
+    filters = compression_kwargs(filter_name)
+    path = Path(tmpdir) / f"bench_{filter_name}_{chunk_frames}.h5"
+    raw_bytes = sum(ep.nbytes for ep in episodes)
+
+    t0 = time.perf_counter()
+    with h5py.File(path, "w") as f:
+        for i, frames in enumerate(episodes):
+            f.create_dataset(f"data/demo_{i}/obs/agentview_image",
+                             data=frames,
+                             chunks=video_chunks(len(frames), chunk_frames, frames.shape[1:]),
+                             **filters)
+    write_s = time.perf_counter() - t0
+    size = path.stat().st_size
+
+    lengths = [len(ep) for ep in episodes]
+    t0 = time.perf_counter()
+    n_frames = 0
+    with h5py.File(path, "r") as f:
+        dsets = [f[f"data/demo_{i}/obs/agentview_image"] for i in range(len(episodes))]
+        for _ in range(reads):
+            e = int(rng.integers(len(dsets)))
+            w = min(window, lengths[e])
+            s = int(rng.integers(lengths[e] - w + 1))
+            n_frames += len(dsets[e][s:s + w])
+    read_s = time.perf_counter() - t0
+    path.unlink()
+
+    return {
+        "filter": filter_name,
+        "chunk": chunk_frames,
+        "write_mb_s": raw_bytes / write_s / 1e6,
+        "ratio": raw_bytes / size,
+        "read_fps": n_frames / read_s,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark HDF5 chunk/filter layouts")
+    ap.add_argument("--videos", default=None, help="folder of overlay mp4s to use as data")
+    ap.add_argument("--episodes", type=int, default=20)
+    ap.add_argument("--length", type=int, default=300, help="frames per synthetic episode")
+    ap.add_argument("--chunks", type=int, nargs="+", default=[1, 8, 16, 32])
+    ap.add_argument("--filters", nargs="+", default=["gzip", "lzf", "lz4", "blosc", "none"])
+    ap.add_argument("--window", type=int, default=10, help="frames per loader read")
+    ap.add_argument("--reads", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    episodes = _load_episodes(args, rng)
+    print(f"{len(episodes)} episodes, {sum(map(len, episodes))} frames, "
+          f"{sum(ep.nbytes for ep in episodes) / 1e6:.1f} MB raw")
+    print(f"{'filter':>7} {'chunk':>5} {'write MB/s':>11} {'ratio':>6} {'read fr/s':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filter_name in args.filters:
+            for chunk in args.chunks:
+                r = bench_layout(episodes, chunk, filter_name, args.window, args.reads, rng, tmpdir)
+                print(f"{r['filter']:>7} {r['chunk']:>5} {r['write_mb_s']:>11.1f} "
+                      f"{r['ratio']:>6.2f} {r['read_fps']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
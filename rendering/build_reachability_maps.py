@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Build the on-disk reachability maps used by
+generate_target_robot_images_new.py --reach_check.
+
+Each map samples the robot's joint space through the NumPy FK chain (no
+renderer, no physics) and stores a packed (voxel × approach-direction)
+grid under reachability_maps/<robot>.npz.
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/build_reachability_maps.py
+python /home/guanhuaji/mirage/robot2robot/rendering/build_reachability_maps.py --robots IIWA Jaco --samples 5000000
+"""
+import argparse
+import time
+from pathlib import Path
+
+from generate_target_robot_images_new import select_gripper
+from sim.kinematics import KinematicChain
+from sim.reachability import REACHABILITY_DIR, ReachabilityMap
+
+TARGET_ROBOTS = ["IIWA", "Sawyer", "Jaco", "Kinova3", "UR5e", "Panda"]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Build per-robot reachability maps")
+    ap.add_argument("--robots", nargs="+", default=TARGET_ROBOTS)
+    ap.add_argument("--samples", type=int, default=2_000_000, help="joint samples per robot")
+    ap.add_argument("--voxel", type=float, default=0.03, help="voxel edge length (m)")
+    ap.add_argument("--num_dirs", type=int, default=64, help="approach-direction bins")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=str(REACHABILITY_DIR))
+    args = ap.parse_args()
+
+    out = Path(args.out)
+    for robot in args.robots:
+        t0 = time.time()
+        chain = KinematicChain.for_robot(robot, select_gripper(robot))
+        rmap = ReachabilityMap.build(
+            chain,
+            num_samples=args.samples,
+            voxel=args.voxel,
+            num_dirs=args.num_dirs,
+            seed=args.seed,
+            robot=robot,
+        )
+        rmap.save(out / f"{robot}.npz")
+        fill = rmap.grid.any(axis=3).mean()
+        print(f"✔ {robot}: {rmap.grid.shape} grid, {fill:.1%} voxels reachable "
+              f"({time.time() - t0:.1f}s) → {out / f'{robot}.npz'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Fold the closed shards of a dataset's robot_states.store into one
+consolidated store.h5 (see core/state_store.py), optionally importing the
+legacy source_robot_states/ and target_robot_states/ npz trees first.
+
+Writers already do this on their own every AUTO_CONSOLIDATE shards; run it
+after a run to fold the last few.  Safe while writers are active.
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/consolidate_states.py --robot_dataset toto
+python /home/guanhuaji/mirage/robot2robot/rendering/consolidate_states.py --robot_dataset toto --import_npz
+"""
+import argparse
+from pathlib import Path
+
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.state_store import StateStore
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Consolidate a dataset's robot state store")
+    ap.add_argument("--robot_dataset", required=True)
+    ap.add_argument("--root", default=None, help="override ROBOT_CAMERA_POSES_DICT[...]['replay_path']")
+    ap.add_argument("--import_npz", action="store_true", help="copy the legacy per-episode npz files in first")
+    args = ap.parse_args()
+
+    root = Path(args.root or ROBOT_CAMERA_POSES_DICT[args.robot_dataset]["replay_path"])
+    store = StateStore(root)
+    if args.import_npz:
+        print(f"imported {store.import_npz()} npz files")
+    store.consolidate()
+    for kind in store.kinds():
+        print(f"✔ {kind}: {len(store.episodes(kind))} episodes")
+    print(f"→ {store.store_path}")
+
+
+if __name__ == "__main__":
+    main()
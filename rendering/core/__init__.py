@@ -17,23 +17,53 @@ Example
 # ──────────────────────────────────────────────────────────
 from .gpu       import pick_best_gpu
 from .physics   import fast_step
-from .geometry  import quat_dist_rad, compute_pose_error
+from .geometry  import quat_dist_rad, compute_pose_error, compute_pose_error_batch
 from .signal import smooth_xyz_spikes, reach_further
-from .io       import locked_json, atomic_write_json
+from .io       import locked_json, atomic_write_json, cache_root, loadtxt_cached, load_episode_text_states
+from .masks    import MaskWriter, MaskReader, read_masks
+from .state_store import StateStore, load_episode_states, list_episodes
+from .result_cache import ResultCache, MemoryLRU, code_fingerprint
+from .h5_loader import AugmentedH5Dataset, H5WindowLoader
+from .pipeline import Pipeline, Stage
+from .scheduler import FrameTimeModel, Job, run_jobs
+from .ledger import JobLedger
+from .lease import LeaseBoard
 
 __all__ = [
     "pick_best_gpu",
     "fast_step",
     "quat_dist_rad",
     "compute_pose_error",
+    "compute_pose_error_batch",
     "load_blacklist",
     "ensure_dir",
     "smooth_xyz_spikes",
     "reach_further",
+    "cache_root",
+    "loadtxt_cached",
+    "load_episode_text_states",
+    "MaskWriter",
+    "MaskReader",
+    "read_masks",
+    "StateStore",
+    "load_episode_states",
+    "list_episodes",
+    "ResultCache",
+    "MemoryLRU",
+    "code_fingerprint",
+    "AugmentedH5Dataset",
+    "H5WindowLoader",
+    "Pipeline",
+    "Stage",
+    "FrameTimeModel",
+    "Job",
+    "run_jobs",
+    "JobLedger",
+    "LeaseBoard",
 ]
 
 # （可选）让 IDE / REPL 补全时能看到子模块本身
 from importlib import import_module as _imp
-for _name in ("gpu", "physics", "geometry", "io"):
+for _name in ("gpu", "physics", "geometry", "io", "masks", "state_store", "result_cache", "h5_loader", "pipeline", "scheduler", "ledger", "lease"):
     globals()[_name] = _imp(f"{__name__}.{_name}")
 del _imp, _name
@@ -24,4 +24,15 @@ def compute_pose_error(current_pose, target_pose,
     q_cur, q_tgt = current_pose[3:], target_pose[3:]
     ori_err = quat_dist_rad(q_cur, q_tgt)
 
-    return pos_w * pos_err + ori_w * ori_err 
\ No newline at end of file
+    return pos_w * pos_err + ori_w * ori_err
+
+def compute_pose_error_batch(current_poses, target_poses,
+                             pos_w=1.0, ori_w=0.1):
+    """
+    compute_pose_error 的批量版本。
+    current_poses / target_poses: shape=(..., 7)，返回 shape=(...)
+    """
+    pos_err = np.linalg.norm(current_poses[..., :3] - target_poses[..., :3], axis=-1)
+    dot = np.abs(np.sum(current_poses[..., 3:] * target_poses[..., 3:], axis=-1))
+    ori_err = 2.0 * np.arccos(np.clip(dot, -1.0, 1.0))
+    return pos_w * pos_err + ori_w * ori_err
@@ -0,0 +1,258 @@
+"""
+Random-access training reads over an augmented image_84.hdf5.
+
+process_h5.py / utils/append_hdf5.py leave, per demo,
+
+    data/demo_N/obs/agentview_image_<ROBOT>   (T, H, W, 3) uint8, chunked in time
+    data/demo_N/obs/<ROBOT>_eef_states        (T, 7) float32
+
+`AugmentedH5Dataset` indexes every (demo, robot, t) window start once and
+serves windows of `window` frames.  Reads are chunk aligned: the chunks a
+window touches are fetched with one contiguous slice and kept in a
+per-process LRU (`cache_mb`), so neighbouring windows – and the frames of
+one window spread over two chunks – cost a single HDF5 read.  The file is
+opened lazily in the process that first reads from it, so the same object
+can be handed to fork/spawn workers (or a torch DataLoader) as is.
+
+    ds = AugmentedH5Dataset("image_84.hdf5", window=10, random_robot=True)
+    for batch in H5WindowLoader(ds, batch_size=64, workers=8, shuffle=True):
+        batch["image"]   # (64, 10, 84, 84, 3) uint8
+        batch["robot"]   # (64,) robot names
+
+With random_robot=True the index is (demo, t) and every sample draws one
+of the demo's robots, so each epoch sees every window once in a random
+embodiment.
+"""
+import multiprocessing as mp
+import os
+
+import h5py
+import numpy as np
+
+from core.result_cache import MemoryLRU
+
+IMAGE_PREFIX = "agentview_image_"
+EEF_SUFFIX = "_eef_states"
+
+
+def _robot_datasets(obs):
+    """robot -> (image dataset name, eef dataset name or None); eef match is case-insensitive."""
+    eef = {k[: -len(EEF_SUFFIX)].lower(): k for k in obs.keys() if k.endswith(EEF_SUFFIX)}
+    out = {}
+    for k in obs.keys():
+        if k.startswith(IMAGE_PREFIX):
+            robot = k[len(IMAGE_PREFIX):]
+            out[robot] = (k, eef.get(robot.lower()))
+    return out
+
+
+class AugmentedH5Dataset:
+    def __init__(self, path, window=1, stride=1, robots=None, random_robot=False,
+                 cache_mb=512, seed=0):
+        self.path = str(path)
+        self.window = int(window)
+        self.stride = int(stride)
+        self.random_robot = random_robot
+        self.cache_mb = cache_mb
+        self.seed = seed
+        self._file = None
+        self._pid = None
+        self._cache = None
+        self._rng = None
+
+        # (demo, robot) -> (image name, eef name, usable length)
+        self.streams = {}
+        with h5py.File(self.path, "r") as f:
+            for demo in sorted(f["data"].keys()):
+                obs = f["data"][demo].get("obs")
+                if obs is None:
+                    continue
+                for robot, (img, eef) in _robot_datasets(obs).items():
+                    if robots is not None and robot not in robots:
+                        continue
+                    T = obs[img].shape[0]
+                    if eef is not None:
+                        T = min(T, obs[eef].shape[0])
+                    if T >= self.window:
+                        self.streams[(demo, robot)] = (img, eef, T)
+
+        self.demo_robots = {}
+        for demo, robot in self.streams:
+            self.demo_robots.setdefault(demo, []).append(robot)
+        self.robots = sorted({r for _, r in self.streams})
+
+        # flat sample index: rows of (demo id, robot id or -1, t)
+        self._demos = sorted(self.demo_robots)
+        demo_id = {d: i for i, d in enumerate(self._demos)}
+        robot_id = {r: i for i, r in enumerate(self.robots)}
+        rows = []
+        if random_robot:
+            for demo, robots_ in self.demo_robots.items():
+                T = min(self.streams[(demo, r)][2] for r in robots_)
+                for t in range(0, T - self.window + 1, self.stride):
+                    rows.append((demo_id[demo], -1, t))
+        else:
+            for (demo, robot), (_, _, T) in self.streams.items():
+                for t in range(0, T - self.window + 1, self.stride):
+                    rows.append((demo_id[demo], robot_id[robot], t))
+        self.index = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+
+    # ------------------------------------------------------------------
+    # per-process state
+    # ------------------------------------------------------------------
+    def _open(self):
+        if self._pid != os.getpid():
+            # first access in this process (or inherited across fork): reopen
+            self._file = h5py.File(self.path, "r")
+            self._pid = os.getpid()
+            self._cache = MemoryLRU(self.cache_mb << 20)
+            self._rng = np.random.default_rng((self.seed, os.getpid()))
+        return self._file
+
+    def close(self):
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._file = self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_file=None, _pid=None, _cache=None, _rng=None)
+        return state
+
+    @property
+    def cache_stats(self):
+        c = self._cache
+        return {"hits": c.hits, "misses": c.misses, "bytes": c.nbytes} if c else {}
+
+    # ------------------------------------------------------------------
+    # reading
+    # ------------------------------------------------------------------
+    def __len__(self):
+        return len(self.index)
+
+    def _read_frames(self, demo, name, start, stop):
+        """frames[start:stop] through the chunk cache, missing chunks in one read."""
+        ds = self._open()["data"][demo]["obs"][name]
+        cf = ds.chunks[0] if ds.chunks else ds.shape[0]
+        c0, c1 = start // cf, (stop - 1) // cf + 1
+        parts = [self._cache.get((demo, name, c)) for c in range(c0, c1)]
+        missing = [c0 + i for i, p in enumerate(parts) if p is None]
+        if missing:
+            m0, m1 = missing[0], missing[-1] + 1
+            block = ds[m0 * cf: min(m1 * cf, ds.shape[0])]
+            for c in range(m0, m1):
+                chunk = block[(c - m0) * cf: (c - m0 + 1) * cf]
+                self._cache.put((demo, name, c), chunk)
+                parts[c - c0] = chunk
+        off = start - c0 * cf
+        if len(parts) == 1:
+            return parts[0][off: off + (stop - start)].copy()    # don't hand out cache views
+        return np.concatenate(parts)[off: off + (stop - start)]
+
+    def sample(self, i):
+        demo_i, robot_i, t = self.index[i]
+        demo = self._demos[demo_i]
+        self._open()
+        if robot_i < 0:
+            robot = self.demo_robots[demo][self._rng.integers(len(self.demo_robots[demo]))]
+        else:
+            robot = self.robots[robot_i]
+        img, eef, _ = self.streams[(demo, robot)]
+        out = {
+            "image": self._read_frames(demo, img, t, t + self.window),
+            "demo": demo,
+            "robot": robot,
+            "t": int(t),
+        }
+        if eef is not None:
+            # eef arrays are tiny and unchunked in older files – cache them whole
+            key = (demo, eef, "all")
+            states = self._cache.get(key)
+            if states is None:
+                states = self._file["data"][demo]["obs"][eef][()]
+                self._cache.put(key, states)
+            out["eef_states"] = states[t: t + self.window].copy()
+        return out
+
+    __getitem__ = sample
+
+    def get_batch(self, indices):
+        """Stacked batch; samples are read in (demo, t) order so chunk reads coalesce."""
+        indices = np.asarray(indices)
+        order = np.lexsort((self.index[indices, 2], self.index[indices, 0]))
+        samples = [None] * len(indices)
+        for j in order:
+            samples[j] = self.sample(int(indices[j]))
+        return collate(samples)
+
+
+def collate(samples):
+    out = {"image": np.stack([s["image"] for s in samples])}
+    for key in ("demo", "robot", "t"):
+        out[key] = np.asarray([s[key] for s in samples])
+    if all("eef_states" in s for s in samples):
+        out["eef_states"] = np.stack([s["eef_states"] for s in samples])
+    return out
+
+
+_worker_ds = None
+
+
+def _worker_init(ds):
+    global _worker_ds
+    _worker_ds = ds
+
+
+def _worker_batch(indices):
+    return _worker_ds.get_batch(indices)
+
+
+class H5WindowLoader:
+    """
+    Batches from an AugmentedH5Dataset on `workers` processes, each holding
+    its own file handle and chunk cache for the whole run.
+    """
+
+    def __init__(self, dataset, batch_size=32, workers=4, shuffle=True, drop_last=False,
+                 seed=0, mp_context="spawn"):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.workers = workers
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self._rng = np.random.default_rng(seed)
+        self._pool = None
+        self._ctx = mp.get_context(mp_context)
+
+    def _batches(self):
+        n = len(self.dataset)
+        order = self._rng.permutation(n) if self.shuffle else np.arange(n)
+        stop = n - n % self.batch_size if self.drop_last else n
+        return [order[i: i + self.batch_size] for i in range(0, stop, self.batch_size)]
+
+    def __len__(self):
+        n = len(self.dataset)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def __iter__(self):
+        batches = self._batches()
+        if self.workers <= 0:
+            for b in batches:
+                yield self.dataset.get_batch(b)
+            return
+        if self._pool is None:
+            self._pool = self._ctx.Pool(self.workers, initializer=_worker_init,
+                                        initargs=(self.dataset,))
+        yield from self._pool.imap(_worker_batch, batches)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,200 @@
+"""
+Batched frame ingestion straight into HDF5.
+
+The old loaders decoded an episode into a Python list (one BGR→RGB
+conversion and one resize allocation per frame), `np.stack`ed it and
+only then handed the whole array to h5py.  Here the target dataset is
+preallocated from the container's frame count and filled batch by batch;
+each frame is decoded, resized and colour-converted into its slot of a
+batch buffer with `dst=`, so at most one batch is in memory:
+
+    n = ingest_video("UR5e_overlay/3.mp4", obs_grp, "agentview_image_UR5e",
+                     size=(84, 84), chunk_frames=16, compression="gzip")
+
+`iter_video_batches` / `iter_image_batches` / `iter_h5_batches` expose
+the batches directly for pipelines that decode on worker threads and
+write on one thread (process_h5.py).  Resizing uses INTER_AREA for both videos and images.
+"""
+import cv2
+import numpy as np
+
+
+def video_frame_count(path):
+    """Frame count from the container header (may be off by a few)."""
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(n, 0)
+
+
+def _to_rgb(frame, out, size):
+    """BGR *frame* -> RGB, resized to size=(W, H), written into *out*."""
+    if size is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+        frame = cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+    if frame.shape[:2] != out.shape[:2]:
+        # cvtColor would silently reallocate dst and leave the slot unwritten
+        raise ValueError(f"frame of shape {frame.shape} does not fit batch slot {out.shape}; "
+                         "pass size= for inputs of mixed resolution")
+    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out)
+
+
+def iter_video_batches(path, size=None, batch=64):
+    """
+    Yield (start, frames) with frames a fresh (n, H, W, 3) uint8 batch.
+    size=(W, H) resizes; None keeps the native resolution.
+    """
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    try:
+        ok, frame = cap.read()
+        if not ok:
+            raise ValueError(f"No frames decoded from {path}")
+        W, H = size if size is not None else (frame.shape[1], frame.shape[0])
+        start = 0
+        while ok:
+            buf = np.empty((batch, H, W, 3), dtype=np.uint8)
+            n = 0
+            while ok and n < batch:
+                _to_rgb(frame, buf[n], size)
+                n += 1
+                ok, frame = cap.read(frame)           # decode into the same buffer
+            yield start, buf[:n]
+            start += n
+    finally:
+        cap.release()
+
+
+def iter_image_batches(paths, size=None, batch=64):
+    """Same as iter_video_batches for a sorted list of image files."""
+    paths = list(paths)
+    if not paths:
+        return
+    first = cv2.imread(str(paths[0]), cv2.IMREAD_COLOR)
+    if first is None:
+        raise IOError(f"Cannot read image {paths[0]}")
+    W, H = size if size is not None else (first.shape[1], first.shape[0])
+    for start in range(0, len(paths), batch):
+        chunk = paths[start:start + batch]
+        buf = np.empty((len(chunk), H, W, 3), dtype=np.uint8)
+        for i, p in enumerate(chunk):
+            img = first if start + i == 0 else cv2.imread(str(p), cv2.IMREAD_COLOR)
+            if img is None:
+                raise IOError(f"Cannot read image {p}")
+            _to_rgb(img, buf[i], size)
+        yield start, buf
+
+
+def iter_h5_batches(path, name="frames", size=None, batch=64):
+    """
+    Same as iter_video_batches for an uint8 (T, H, W, 3) dataset in an
+    HDF5 file (the lossless per-episode sink of the fused pipeline).
+    """
+    import h5py
+
+    with h5py.File(path, "r") as f:
+        ds = f[name]
+        for start in range(0, ds.shape[0], batch):
+            frames = ds[start:start + batch]
+            if size is not None and (frames.shape[2], frames.shape[1]) != tuple(size):
+                frames = np.stack([cv2.resize(fr, tuple(size), interpolation=cv2.INTER_AREA) for fr in frames])
+            yield start, frames
+
+
+def frame_count(path):
+    """Frames in a video container or a fused-pipeline .h5 episode."""
+    if str(path).endswith(".h5"):
+        import h5py
+
+        with h5py.File(path, "r") as f:
+            return f["frames"].shape[0]
+    return video_frame_count(path)
+
+
+def iter_frame_batches(path, size=None, batch=64):
+    """iter_h5_batches for .h5 episodes, iter_video_batches otherwise."""
+    if str(path).endswith(".h5"):
+        return iter_h5_batches(path, size=size, batch=batch)
+    return iter_video_batches(path, size, batch)
+
+
+def create_frame_dataset(group, name, num_frames, frame_shape, chunk_frames=16, **filters):
+    """
+    (Re)create *name* as an uint8 (num_frames, H, W, C) dataset with
+    multi-frame chunks; resizable along time so a wrong header count can
+    be corrected by `finish_frame_dataset`.
+    """
+    if name in group:
+        del group[name]
+    num_frames = max(int(num_frames), 1)
+    return group.create_dataset(
+        name,
+        shape=(num_frames, *frame_shape),
+        maxshape=(None, *frame_shape),
+        dtype=np.uint8,
+        chunks=(min(chunk_frames, num_frames), *frame_shape),
+        **filters,
+    )
+
+
+def write_frame_batch(ds, start, frames):
+    """Write one batch, growing *ds* if the header under-counted."""
+    end = start + len(frames)
+    if end > ds.shape[0]:
+        ds.resize(end, axis=0)
+    ds[start:end] = frames
+
+
+def finish_frame_dataset(ds, num_written):
+    if num_written != ds.shape[0]:
+        ds.resize(num_written, axis=0)
+
+
+def _ingest(batches, group, name, num_frames, chunk_frames, filters):
+    ds = None
+    written = 0
+    for start, frames in batches:
+        if ds is None:
+            ds = create_frame_dataset(group, name, num_frames, frames.shape[1:], chunk_frames, **filters)
+        write_frame_batch(ds, start, frames)
+        written = start + len(frames)
+    if ds is not None:
+        finish_frame_dataset(ds, written)
+    return written
+
+
+def ingest_video(path, group, name, size=None, batch=64, chunk_frames=16, **filters):
+    """Decode *path* into group[name] batch by batch; returns frames written."""
+    return _ingest(iter_video_batches(path, size, batch), group, name,
+                   video_frame_count(path), chunk_frames, filters)
+
+
+def ingest_images(paths, group, name, size=None, batch=64, chunk_frames=16, **filters):
+    """Load image files into group[name] batch by batch; returns frames written."""
+    paths = list(paths)
+    return _ingest(iter_image_batches(paths, size, batch), group, name,
+                   len(paths), chunk_frames, filters)
+
+
+def ingest_frames(path, group, name, size=None, batch=64, chunk_frames=16, **filters):
+    """ingest_video that also accepts fused-pipeline .h5 episodes."""
+    return _ingest(iter_frame_batches(path, size, batch), group, name,
+                   frame_count(path), chunk_frames, filters)
+
+
+def read_video(path, size=None, batch=64):
+    """Whole video as one preallocated (T, H, W, 3) array (no frame list)."""
+    out = None
+    written = 0
+    for start, frames in iter_video_batches(path, size, batch):
+        if out is None:
+            out = np.empty((max(video_frame_count(path), len(frames)), *frames.shape[1:]), dtype=np.uint8)
+        if start + len(frames) > len(out):
+            grown = np.empty((start + len(frames), *out.shape[1:]), dtype=np.uint8)
+            grown[:start] = out[:start]
+            out = grown
+        out[start:start + len(frames)] = frames
+        written = start + len(frames)
+    return out[:written]
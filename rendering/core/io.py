@@ -1,7 +1,10 @@
 from contextlib import contextmanager
+import hashlib
 import json
 import os
 import pathlib
+import tempfile
+import numpy as np
 import portalocker
 
 @contextmanager
@@ -24,4 +27,55 @@ def atomic_write_json(obj, path: pathlib.Path):
         json.dump(obj, tmp, indent=2)
         tmp.flush()
         os.fsync(tmp.fileno())           # make sure it’s on disk
-    os.replace(tmp.name, path) 
\ No newline at end of file
+    os.replace(tmp.name, path)
+
+def cache_root(*parts) -> pathlib.Path:
+    """
+    Per-user cache directory shared by the on-disk caches (kinematic chains,
+    compiled models, …).  Override with $R2R_CACHE_DIR.
+    """
+    root = pathlib.Path(os.environ.get("R2R_CACHE_DIR", "~/.cache/robot2robot")).expanduser()
+    path = root.joinpath(*map(str, parts))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def loadtxt_cached(path, mmap_mode="c", **loadtxt_kwargs):
+    """
+    `np.loadtxt(path)` backed by a binary .npy cache under cache_root("txt").
+
+    The cache file name carries the text file's size and mtime, so editing
+    the .txt rebuilds it on next access.  The default mmap_mode "c" is
+    copy-on-write: callers may modify the array in place (the joint offset
+    fix-ups do) without touching the cache.
+    """
+    path = pathlib.Path(path).resolve()
+    st = path.stat()
+    key = hashlib.sha1(f"{path}|{sorted(loadtxt_kwargs.items())}".encode()).hexdigest()
+    cache_dir = cache_root("txt")
+    npy = cache_dir / f"{key}-{st.st_size}-{st.st_mtime_ns}.npy"
+    if not npy.is_file():
+        arr = np.loadtxt(path, **loadtxt_kwargs)
+        tmp = npy.with_name(f".{npy.stem}.{os.getpid()}.npy")
+        np.save(tmp, arr)
+        os.replace(tmp, npy)
+        for stale in cache_dir.glob(f"{key}-*.npy"):          # older versions
+            if stale != npy:
+                stale.unlink(missing_ok=True)
+    return np.load(npy, mmap_mode=mmap_mode)
+
+
+def load_episode_text_states(states_dir, names=("joint_states.txt", "gripper_states.txt"), mmap_mode="c"):
+    """
+    Bulk loader for datasets/states/<dataset>/episode_N/*.txt:
+    returns {N: {name stem: array}} for every episode that has all *names*.
+    """
+    out = {}
+    for ep_dir in pathlib.Path(states_dir).glob("episode_*"):
+        suffix = ep_dir.name[len("episode_"):]
+        if not suffix.isdigit():
+            continue
+        files = [ep_dir / n for n in names]
+        if all(f.is_file() for f in files):
+            out[int(suffix)] = {f.stem: loadtxt_cached(f, mmap_mode=mmap_mode) for f in files}
+    return dict(sorted(out.items()))
@@ -0,0 +1,299 @@
+"""
+Episode leases on a shared filesystem, for runs spread over many machines.
+
+Sharding used to be hard-coded (`NUM_PARTITIONS = 5` + `--partition`, one
+shell loop per machine); adding a machine meant re-partitioning by hand
+and a crashed partition was silently lost.  Here every node points at the
+same directory and claims episode batches itself:
+
+    board = LeaseBoard(replay_path / "leases" / run_id / "UR5e", num_episodes, batch=16)
+    for lease in board.leases():                  # blocks until every batch is done
+        for ep in lease.episodes:
+            ...
+        lease.finish({"done": [...], "failed": [...]})
+
+A lease is the file `<root>/<batch>.lease`, created with O_EXCL (atomic
+on local filesystems and NFSv3+) while holding the batch's claim mutex
+`<root>/<batch>.claim` (also O_EXCL, held for milliseconds), so claims of
+one batch never interleave.  While a lease is held a heartbeat thread
+touches it every ttl/4; a lease untouched for `ttl` seconds belongs to a
+dead node and is re-claimed: the claimer renames it away, re-checks the
+age of the renamed file and either creates its own or links a live lease
+straight back – no other node can create the lease in between.  A holder
+that finds its file missing during that window keeps heartbeating; it
+only gives the lease up when another node's file has replaced it.  Ages are
+measured against the filesystem's clock (mtime of a freshly touched
+per-node file), not the local one, so clock skew between machines does
+not matter.  A finished
+batch leaves `<root>/<batch>.done` with the result passed to `finish`; the
+run is complete when every batch has one.
+
+The batch layout is fixed by the first node in `<root>/board.json`; a node
+given a different layout refuses to start.  A board is one run: its
+`.done` files stay behind, so a later run needs a board of its own (a
+new root, e.g. per run id).  Leases are plain files and not SQLite
+(core.ledger) because WAL databases must not live on NFS.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+
+from core.io import atomic_write_json
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _read_json(path):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class Lease:
+    """A claimed batch; heartbeats until finish() or release()."""
+
+    def __init__(self, board, index):
+        self.board = board
+        self.index = index
+        self.path = board.root / f"{index}.lease"
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+
+    @property
+    def episodes(self):
+        start = self.index * self.board.batch
+        return range(start, min(start + self.board.batch, self.board.num_items))
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.board.ttl / 4):
+            for _ in range(3):
+                owner = self._owner()
+                if owner is None:
+                    # renamed away by a claimer checking for expiry; it puts a
+                    # live lease back right after, so look again shortly
+                    time.sleep(0.5)
+                    continue
+                if owner != self.board.owner:
+                    # expired and re-claimed by another node (we stalled > ttl)
+                    self.lost = True
+                    return
+                try:
+                    os.utime(self.path)
+                    break
+                except FileNotFoundError:
+                    time.sleep(0.5)
+            # still missing: keep the lease and try again next tick; only
+            # another node's lease file in its place means it is lost
+
+    def _owner(self):
+        """Owner recorded in the lease file, None if it is (momentarily) missing."""
+        info = _read_json(self.path)
+        return info.get("owner") if info else None
+
+    def _mine(self):
+        return self._owner() == self.board.owner
+
+    def _stop_heartbeat(self):
+        self._stop.set()
+        self._thread.join()
+
+    def finish(self, result=None):
+        """Mark the batch terminal (visible to every node) and drop the lease."""
+        self._stop_heartbeat()
+        atomic_write_json({"owner": self.board.owner, "result": result},
+                          self.board.root / f"{self.index}.done")
+        self._remove()
+
+    def release(self):
+        """Give the batch back unfinished (e.g. on Ctrl-C) so another node takes it."""
+        self._stop_heartbeat()
+        self._remove()
+
+    def _remove(self):
+        if self._mine():
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self._stop.is_set():
+            self.release()
+
+    def __repr__(self):
+        if isinstance(self.index, str):
+            return f"Lease({self.board.root.name}#{self.index})"
+        return f"Lease({self.board.root.name}#{self.index}, episodes={self.episodes})"
+
+
+class LeaseBoard:
+    def __init__(self, root, num_items, batch=16, ttl=600.0, owner=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = float(ttl)
+        self.owner = owner or _owner()
+
+        layout = self.root / "board.json"
+        try:
+            fd = os.open(layout, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            info = None
+            for _ in range(50):                  # creator may still be writing it
+                info = _read_json(layout)
+                if info:
+                    break
+                time.sleep(0.1)
+            if not info:
+                raise RuntimeError(f"unreadable lease board layout {layout}")
+            if info["num_items"] != num_items or info["batch"] != batch:
+                raise ValueError(f"lease board {self.root} has layout {info}, not "
+                                 f"num_items={num_items}, batch={batch}; use a new board for a new run")
+        else:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"num_items": num_items, "batch": batch}, f)
+        self.num_items = int(num_items)
+        self.batch = int(batch)
+        self.num_batches = -(-self.num_items // self.batch)
+        self._clock = self.root / f".clock-{self.owner.replace(':', '-')}"
+
+    # ------------------------------------------------------------------ state
+    def _now(self):
+        """Current time on the shared filesystem's clock."""
+        self._clock.touch()
+        return self._clock.stat().st_mtime
+
+    def close(self):
+        """Remove this node's clock file (leases() does it when it returns)."""
+        self._clock.unlink(missing_ok=True)
+
+    def _expired(self, path, now):
+        try:
+            return now - path.stat().st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def done(self):
+        """Indices of terminal batches."""
+        return {int(n[:-5]) for n in os.listdir(self.root) if n.endswith(".done") and n[:-5].isdigit()}
+
+    def all_done(self):
+        return len(self.done()) >= self.num_batches
+
+    def results(self):
+        """{batch index: result passed to Lease.finish} over all nodes."""
+        return {i: (_read_json(self.root / f"{i}.done") or {}).get("result") for i in sorted(self.done())}
+
+    # ------------------------------------------------------------------ claim
+    def _lock_claim(self, index, now):
+        """O_EXCL claim mutex for one batch; False if another node holds it."""
+        mutex = self.root / f"{index}.claim"
+        try:
+            os.close(os.open(mutex, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        if self._expired(mutex, now):
+            # left by a claimer that died inside _take; clear it the same way
+            # as an expired lease (rename, re-check) and let the next poll retry
+            grave = mutex.with_name(f"{mutex.name}.{uuid.uuid4().hex}.stale")
+            try:
+                os.rename(mutex, grave)
+            except FileNotFoundError:
+                return False
+            if not self._expired(grave, self._now()):
+                try:
+                    os.link(grave, mutex)
+                except FileExistsError:
+                    pass
+            grave.unlink(missing_ok=True)
+        return False
+
+    def _take(self, index, now):
+        if not self._lock_claim(index, now):
+            return None
+        try:
+            return self._take_locked(index, now)
+        finally:
+            (self.root / f"{index}.claim").unlink(missing_ok=True)
+
+    def _take_locked(self, index, now):
+        path = self.root / f"{index}.lease"
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self._expired(path, now):
+                return None
+            grave = path.with_name(f"{path.name}.{uuid.uuid4().hex}.stale")
+            try:
+                os.rename(path, grave)
+            except FileNotFoundError:
+                return None
+            if not self._expired(grave, self._now()):
+                # the holder heartbeated between our check and the rename
+                try:
+                    os.link(grave, path)
+                except FileExistsError:
+                    pass
+                grave.unlink(missing_ok=True)
+                return None
+            print(f"[lease] re-claiming expired {path.name} "
+                  f"from {(_read_json(grave) or {}).get('owner')}", flush=True)
+            grave.unlink(missing_ok=True)
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return None
+        with os.fdopen(fd, "w") as f:
+            json.dump({"owner": self.owner, "host": socket.gethostname(), "pid": os.getpid()}, f)
+        if (self.root / f"{index}.done").exists():   # finished while we raced for it
+            path.unlink(missing_ok=True)
+            return None
+        return Lease(self, index)
+
+    def claim(self):
+        """A Lease on some unfinished, unleased batch, or None right now."""
+        done = self.done()
+        now = self._now()
+        # start at an owner-specific batch so nodes do not all fight over #0
+        first = zlib.crc32(self.owner.encode()) % max(self.num_batches, 1)
+        for k in range(self.num_batches):
+            i = (first + k) % self.num_batches
+            if i in done:
+                continue
+            lease = self._take(i, now)
+            if lease is not None:
+                return lease
+        return None
+
+    def claim_once(self, name):
+        """
+        Lease on the one-off task *name* (e.g. "reconcile", run by one node
+        after every batch is terminal); None if it is done or held elsewhere.
+        A holder that dies lets it expire like any batch lease.
+        """
+        if (self.root / f"{name}.done").exists():
+            return None
+        return self._take(name, self._now())
+
+    def leases(self, poll=30.0):
+        """Yield claimed leases until every batch is terminal; waits for other nodes' leases."""
+        try:
+            while not self.all_done():
+                lease = self.claim()
+                if lease is None:
+                    time.sleep(poll)
+                    continue
+                with lease:
+                    yield lease
+        finally:
+            self.close()
@@ -0,0 +1,212 @@
+"""
+SQLite job ledger for the per-episode replay.
+
+The replay used to track progress in `{robot}/whitelist.json` and
+`blacklist.json`: every finished episode took two portalocker locks and
+rewrote + fsynced both files, and utils/update_whitelist.py /
+intersect_whitelist.py rebuilt the same lists by scanning directories.
+Here one row per (dataset, robot, episode) lives in an SQLite table.
+
+The pool workers record into the node-local ledger
+(`cache_root("ledger")/jobs.sqlite`, WAL mode so they write concurrently:
+one small upsert each, readers never block).  WAL needs a local
+filesystem (shared memory for the index), so the dataset's ledger
+`<replay_path>/jobs.sqlite` on NFS is a rollback-journal database that is
+only written by `publish` – one batch per run, under a file lock – and
+read by everyone else:
+
+    with JobLedger.local() as ledger:                       # workers
+        ledger.record("toto", "UR5e", 3, "done", offset=disp, steps=T, seconds=12.5)
+    publish(replay_path, "toto", "UR5e", rows)              # driver, end of run
+    with JobLedger.for_root(replay_path, readonly=True) as ledger:
+        ledger.episodes("toto", "UR5e", "done")             # -> [0, 3, ...]
+        ledger.intersection("toto", ["UR5e", "IIWA"])       # done for every robot
+
+status is "done" (whitelist), "failed" (blacklist) or "rejected" (skipped
+by the --reach_check pre-filter; in neither list, so retried next run).
+The legacy files are imported on the first `publish` (`import_json`),
+which also regenerates them for the tools that still read JSON
+(`export_json`).
+"""
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import portalocker
+
+from core.io import atomic_write_json, cache_root
+
+LEDGER_NAME = "jobs.sqlite"
+STATUSES = ("done", "failed", "rejected")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    dataset  TEXT    NOT NULL,
+    robot    TEXT    NOT NULL,
+    episode  INTEGER NOT NULL,
+    status   TEXT    NOT NULL,
+    offset   TEXT,
+    steps    INTEGER,
+    seconds  REAL,
+    error    TEXT,
+    updated  REAL    NOT NULL,
+    PRIMARY KEY (dataset, robot, episode)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (dataset, robot, status);
+"""
+
+
+class JobLedger:
+    def __init__(self, path, timeout=60.0, readonly=False, wal=True):
+        self.path = Path(path)
+        if readonly:
+            # no schema / journal-mode writes: safe to open from any node
+            self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=timeout)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit; every write is a single statement
+        self._db = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+        self._db.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def local(cls):
+        """This node's live ledger, on local disk (WAL)."""
+        return cls(local_ledger_path())
+
+    @classmethod
+    def for_root(cls, replay_path, readonly=False):
+        """The dataset's shared ledger; write it only through publish()."""
+        return cls(Path(replay_path) / LEDGER_NAME, readonly=readonly, wal=False)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------ write
+    def record(self, dataset, robot, episode, status, offset=None, steps=None, seconds=None, error=None):
+        if status not in STATUSES:
+            raise ValueError(f"status must be one of {STATUSES}, got {status!r}")
+        if offset is not None:
+            offset = json.dumps([float(x) for x in offset])
+        self._db.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (dataset, robot, int(episode), status, offset,
+             None if steps is None else int(steps), seconds, error, time.time()),
+        )
+
+    def record_rows(self, rows):
+        """Write rows as returned by get() in one transaction (lease reconciliation)."""
+        values = [
+            (r["dataset"], r["robot"], int(r["episode"]), r["status"],
+             None if r.get("offset") is None else json.dumps([float(x) for x in r["offset"]]),
+             r.get("steps"), r.get("seconds"), r.get("error"), r.get("updated") or time.time())
+            for r in rows
+        ]
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+
+    def import_json(self, replay_path, dataset, robot):
+        """Seed from the legacy {robot}/whitelist.json + blacklist.json; returns rows added."""
+        rows = []
+        for status, name in (("done", "whitelist.json"), ("failed", "blacklist.json")):
+            path = Path(replay_path) / robot / name
+            try:
+                eps = json.loads(path.read_text(encoding="utf-8")).get(robot, [])
+            except (FileNotFoundError, ValueError):
+                continue
+            rows += [(dataset, robot, int(ep), status, time.time()) for ep in eps]
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            cur = self._db.executemany(
+                "INSERT OR IGNORE INTO jobs (dataset, robot, episode, status, updated) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return cur.rowcount
+
+    # ------------------------------------------------------------------- read
+    def episodes(self, dataset, robot, status="done"):
+        cur = self._db.execute(
+            "SELECT episode FROM jobs WHERE dataset=? AND robot=? AND status=? ORDER BY episode",
+            (dataset, robot, status),
+        )
+        return [r[0] for r in cur]
+
+    def intersection(self, dataset, robots, status="done"):
+        """Episodes with *status* for every robot in *robots*."""
+        robots = list(robots)
+        if not robots:
+            return []
+        marks = ",".join("?" * len(robots))
+        cur = self._db.execute(
+            f"SELECT episode FROM jobs WHERE dataset=? AND status=? AND robot IN ({marks}) "
+            "GROUP BY episode HAVING COUNT(DISTINCT robot)=? ORDER BY episode",
+            (dataset, status, *robots, len(robots)),
+        )
+        return [r[0] for r in cur]
+
+    def get(self, dataset, robot, episode):
+        """Row as a dict (offset decoded), or None."""
+        cur = self._db.execute(
+            "SELECT * FROM jobs WHERE dataset=? AND robot=? AND episode=?", (dataset, robot, int(episode))
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        out = dict(zip((d[0] for d in cur.description), row))
+        if out["offset"] is not None:
+            out["offset"] = json.loads(out["offset"])
+        return out
+
+    def rows(self, dataset, robot, episodes, since=0.0):
+        """get() rows of *episodes* recorded at or after *since* (what publish() takes)."""
+        rows = (self.get(dataset, robot, ep) for ep in episodes)
+        return [row for row in rows if row is not None and row["updated"] >= since]
+
+    def counts(self, dataset, robot=None):
+        """{status: count} for a dataset (optionally one robot)."""
+        sql, args = "SELECT status, COUNT(*) FROM jobs WHERE dataset=?", [dataset]
+        if robot is not None:
+            sql, args = sql + " AND robot=?", args + [robot]
+        return dict(self._db.execute(sql + " GROUP BY status", args).fetchall())
+
+    def has(self, dataset, robot):
+        cur = self._db.execute("SELECT 1 FROM jobs WHERE dataset=? AND robot=? LIMIT 1", (dataset, robot))
+        return cur.fetchone() is not None
+
+    def export_json(self, replay_path, dataset, robot):
+        """Rewrite {robot}/whitelist.json and blacklist.json from the ledger."""
+        for status, name in (("done", "whitelist.json"), ("failed", "blacklist.json")):
+            path = Path(replay_path) / robot / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json({robot: self.episodes(dataset, robot, status)}, path)
+
+
+def local_ledger_path():
+    return cache_root("ledger") / LEDGER_NAME
+
+
+def publish(replay_path, dataset, robot, rows):
+    """
+    Fold *rows* (as returned by get()) into <replay_path>/jobs.sqlite and
+    re-export {robot}/whitelist.json + blacklist.json.  One writer at a
+    time per dataset ledger, from any node (portalocker on a lock file
+    beside it); the legacy JSON is imported first if the robot is new.
+    """
+    path = Path(replay_path) / LEDGER_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with portalocker.Lock(str(path.with_name(f"{LEDGER_NAME}.lock")), "a", timeout=600):
+        with JobLedger.for_root(replay_path) as ledger:
+            if not ledger.has(dataset, robot):
+                ledger.import_json(replay_path, dataset, robot)
+            if rows:
+                ledger.record_rows(rows)
+            ledger.export_json(replay_path, dataset, robot)
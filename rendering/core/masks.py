@@ -0,0 +1,126 @@
+"""
+Lossless bit-packed robot masks.
+
+Replay masks are binary, so storing them as H.264 gray video only buys
+compression artefacts along the robot's edges and a decode + re-threshold
+in every consumer.  A `.mask` file is instead
+
+    b"R2RMASK1" | uint32 T, H, W (little endian) | T × H × ceil(W/8) bytes
+
+i.e. every frame is `np.packbits(mask, axis=-1)` at a fixed offset, so a
+single frame is one memmap slice and nothing has to be decoded up front.
+An 84×84 episode costs 924 bytes per frame.
+
+    with MaskWriter(path, H, W) as w:
+        for m in masks:
+            w.append(m)
+
+    masks = MaskReader(path)
+    masks[17]            # (H, W) bool
+    masks.read()         # (T, H, W) bool
+"""
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"R2RMASK1"
+_HEADER = struct.Struct("<8sIII")
+MASK_SUFFIX = ".mask"
+
+
+class MaskWriter:
+    """Append-only writer; the file is moved into place atomically by close()."""
+
+    def __init__(self, path, height, width):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.height, self.width = int(height), int(width)
+        self.num_frames = 0
+        self._tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self._fp = open(self._tmp, "wb")
+        self._fp.write(_HEADER.pack(MAGIC, 0, self.height, self.width))
+
+    def append(self, mask):
+        """mask : (H, W) bool/uint8, non-zero = robot."""
+        mask = np.asarray(mask)
+        if mask.shape != (self.height, self.width):
+            raise ValueError(f"Expected mask of shape {(self.height, self.width)}, got {mask.shape}")
+        self._fp.write(np.packbits(mask != 0, axis=-1).tobytes())
+        self.num_frames += 1
+
+    def close(self):
+        if self._fp is None:
+            return
+        self._fp.seek(0)
+        self._fp.write(_HEADER.pack(MAGIC, self.num_frames, self.height, self.width))
+        self._fp.close()
+        self._fp = None
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        if self._fp is None:
+            return
+        self._fp.close()
+        self._fp = None
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class MaskReader:
+    """Random access to a `.mask` file without decoding the whole episode."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as fp:
+            magic, T, H, W = _HEADER.unpack(fp.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a packed mask file")
+        self.shape = (T, H, W)
+        row_bytes = (W + 7) // 8
+        self._packed = (
+            np.memmap(self.path, dtype=np.uint8, mode="r", offset=_HEADER.size,
+                      shape=(T, H, row_bytes))
+            if T else np.zeros((0, H, row_bytes), dtype=np.uint8)
+        )
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _unpack(self, packed):
+        W = self.shape[2]
+        return np.unpackbits(packed, axis=-1, count=W).astype(bool)
+
+    def __getitem__(self, idx):
+        """Integer index -> (H, W) bool; slice / index array -> (N, H, W) bool."""
+        return self._unpack(self._packed[idx])
+
+    def read(self, start=0, stop=None):
+        return self._unpack(self._packed[start:stop])
+
+
+def read_masks(path, threshold=127):
+    """
+    (T, H, W) bool masks from either a `.mask` file or a legacy mask mp4
+    (decoded and thresholded at *threshold*).
+    """
+    path = Path(path)
+    if path.suffix == MASK_SUFFIX:
+        return MaskReader(path).read()
+
+    import imageio.v3 as iio
+
+    frames = iio.imread(path)                      # (T, H, W[, 3])
+    if frames.ndim == 4:
+        frames = frames[..., 0]
+    return frames > threshold
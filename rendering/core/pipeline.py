@@ -0,0 +1,155 @@
+"""
+In-process DAG runner for the per-episode pipeline.
+
+The driver scripts used to launch one `python <stage>.py` per (dataset,
+robot, episode) and stage, paying the interpreter + robosuite/TensorFlow
+import every time.  Here a stage is a plain function with declared input
+and output paths, and a `Pipeline` is a DAG of stage calls:
+
+    replay  = Stage("replay", replay_episode, inputs=..., outputs=...)
+    overlay = Stage("overlay", overlay_episode, inputs=..., outputs=...)
+
+    p = Pipeline()
+    for ep in episodes:
+        r = p.add(replay, dataset="toto", robot="UR5e", episode=ep)
+        p.add(overlay, deps=[r], dataset="toto", robot="UR5e", episode=ep)
+    status = p.run(workers=8)          # {node key: "done" | "skipped" | ...}
+
+A node is skipped ("up-to-date") when all its outputs exist and none is
+older than its newest input, like make.  Ready nodes run on a bounded
+spawn process pool whose workers live for the whole run, so imports and
+warm envs (sim.env_pool) are paid once per worker, not once per node.  A
+stage function returns False (or raises) to fail; dependents of a failed
+node are not run.
+"""
+import multiprocessing as mp
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+
+class Stage:
+    """
+    fn      : module-level callable fn(**params) -> bool | None
+    inputs  : params -> list of paths the stage reads
+    outputs : params -> list of paths the stage writes
+    """
+
+    def __init__(self, name, fn, inputs=None, outputs=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs or (lambda **_: [])
+        self.outputs = outputs or (lambda **_: [])
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def _mtime(path):
+    try:
+        return Path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def up_to_date(stage, params):
+    """All outputs exist and are at least as new as every existing input."""
+    outs = [_mtime(p) for p in stage.outputs(**params)]
+    if not outs or any(t is None for t in outs):
+        return False
+    ins = [t for t in (_mtime(p) for p in stage.inputs(**params)) if t is not None]
+    return not ins or min(outs) >= max(ins)
+
+
+def _call(fn, params):
+    """Worker side: never let an exception kill the pool; report it instead."""
+    try:
+        return fn(**params) is not False, None
+    except Exception:
+        return False, traceback.format_exc()
+
+
+class Node:
+    def __init__(self, stage, params, deps):
+        self.stage = stage
+        self.params = params
+        self.deps = deps
+
+    @property
+    def key(self):
+        return (self.stage.name, *(self.params[k] for k in sorted(self.params)))
+
+    def __repr__(self):
+        args = ", ".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.stage.name}({args})"
+
+
+class Pipeline:
+    def __init__(self):
+        self.nodes = []
+
+    def add(self, stage, deps=(), **params):
+        node = Node(stage, params, [d for d in deps if d is not None])
+        self.nodes.append(node)
+        return node
+
+    def run(self, workers=4, force=False, mp_context="spawn", verbose=True):
+        """
+        Run every node once its deps are done; returns {node.key: status}
+        with status "done", "up-to-date", "failed" or "blocked".
+        """
+        status = {}
+        waiting = {n: set(n.deps) for n in self.nodes}
+        dependents = {n: [] for n in self.nodes}
+        for n in self.nodes:
+            for d in n.deps:
+                dependents[d].append(n)
+
+        def _settle(node, state):
+            status[node.key] = state
+            if verbose and state not in ("done", "up-to-date"):
+                print(f"[pipeline] {state}: {node}", flush=True)
+            stack = [node]
+            while stack:
+                cur = stack.pop()
+                for child in dependents[cur]:
+                    if child.key in status:
+                        continue
+                    if state in ("failed", "blocked"):
+                        status[child.key] = "blocked"
+                        waiting.pop(child, None)
+                        stack.append(child)
+                    else:
+                        waiting[child].discard(cur)
+
+        ready = lambda: [n for n, deps in waiting.items() if not deps]
+        ctx = mp.get_context(mp_context)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            running = {}
+            while waiting or running:
+                for node in ready():
+                    del waiting[node]
+                    if not force and up_to_date(node.stage, node.params):
+                        _settle(node, "up-to-date")
+                        continue
+                    running[pool.submit(_call, node.stage.fn, node.params)] = node
+                if not running:
+                    if waiting and not ready():
+                        raise RuntimeError("pipeline has a dependency cycle")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    node = running.pop(fut)
+                    ok, err = fut.result()
+                    if err and verbose:
+                        print(f"[pipeline] {node} raised:\n{err}", flush=True)
+                    _settle(node, "done" if ok else "failed")
+        return status
+
+
+def summarize(status):
+    """{status: count}"""
+    counts = {}
+    for s in status.values():
+        counts[s] = counts.get(s, 0) + 1
+    return counts
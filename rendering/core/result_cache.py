@@ -0,0 +1,169 @@
+"""
+Content-addressed cache for per-episode pipeline results.
+
+A key is the SHA-1 of everything that determines an episode's output –
+joint trajectory, robot/gripper, displacement, camera pose/fov, output
+settings – plus a fingerprint of the source files that compute it, so
+editing the FK/IK/replay code invalidates old entries by itself:
+
+    cache = ResultCache("target_replay")
+    key = cache.key(poses, robot, disp, code_fingerprint("envs/target_env.py"))
+    hit = cache.get(key)                    # dict of arrays or None
+    cache.put(key, success=True, steps=T)
+
+Entries are small npz files under cache_root("results", name); reading one
+refreshes its mtime and `put` evicts least-recently-used entries once the
+directory grows past `max_bytes` (default 2 GiB, $R2R_RESULT_CACHE_BYTES).
+`MemoryLRU` is the in-process counterpart, bounded by the bytes it holds.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from core.io import cache_root
+
+_RENDERING_ROOT = Path(__file__).resolve().parent.parent
+_EVICT_EVERY = 64
+
+
+def _feed(h, obj):
+    """Stable hashing of nested numpy / python values."""
+    if isinstance(obj, np.ndarray) or isinstance(obj, np.generic):
+        arr = np.ascontiguousarray(obj)
+        h.update(f"nd{arr.dtype.str}{arr.shape}".encode())
+        h.update(arr.tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for k in sorted(obj, key=str):
+            _feed(h, str(k))
+            _feed(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"seq{len(obj)}".encode())
+        for x in obj:
+            _feed(h, x)
+    elif isinstance(obj, (bytes, bytearray)):
+        h.update(b"b" + bytes(obj))
+    else:
+        h.update(f"{type(obj).__name__}:{obj!r}".encode())
+    h.update(b"\0")
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint(*relpaths):
+    """SHA-1 over the contents of source files (relative to rendering/)."""
+    h = hashlib.sha1()
+    for rel in relpaths:
+        h.update(rel.encode())
+        h.update((_RENDERING_ROOT / rel).read_bytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, name, max_bytes=None):
+        self.root = cache_root("results", name)
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else os.environ.get("R2R_RESULT_CACHE_BYTES", 2 << 30))
+        self._puts = 0
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha1()
+        for p in parts:
+            _feed(h, p)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.npz"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as d:
+                out = {k: d[k] for k in d.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path)                              # LRU bookkeeping
+        except OSError:
+            pass
+        return out
+
+    def put(self, key, **arrays):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{key}.{os.getpid()}.npz")
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        self._puts += 1
+        if self._puts % _EVICT_EVERY == 1:
+            self.evict()
+
+    def evict(self):
+        """Drop least-recently-used entries until under 90 % of max_bytes."""
+        entries = []
+        total = 0
+        for path in self.root.glob("*/*.npz"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        target = 0.9 * self.max_bytes
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    return getattr(value, "nbytes", 0)
+
+
+class MemoryLRU:
+    """Byte-bounded in-memory LRU; values are arrays or dicts of arrays."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        self.pop(key)
+        self._data[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.nbytes -= _nbytes(evicted)
+
+    def pop(self, key):
+        value = self._data.pop(key, None)
+        if value is not None:
+            self.nbytes -= _nbytes(value)
+        return value
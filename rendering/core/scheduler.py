@@ -0,0 +1,148 @@
+"""
+Cost-aware scheduling of (dataset, robot, episode) jobs.
+
+Episode lengths vary by 10× and robots replay at different speeds, so
+submitting in episode order leaves the end of a run to one long episode
+while the other workers idle.  Here every job gets an estimated cost –
+frames × the robot's historical seconds per frame – and
+
+  • jobs are dispatched longest-first (LPT), short ones fill the tail;
+  • only `workers` jobs are in flight; whichever worker frees up takes the
+    next job from the one shared queue, across all datasets and robots
+    of the invocation (no per-dataset / per-robot partitioning);
+  • progress is reported in frames, with an ETA from the same model.
+
+Per-robot seconds/frame are an exponential moving average persisted under
+cache_root("scheduler"), so later runs start with calibrated estimates:
+
+    model = FrameTimeModel()
+    jobs = [Job(key=(ds, robot, ep), args=(...), frames=T, group=robot) for ...]
+    for job, result in run_jobs(jobs, generate_one_episode, workers=20, model=model):
+        ...
+"""
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from core.io import atomic_write_json, cache_root
+
+DEFAULT_SEC_PER_FRAME = 0.05
+_EWMA = 0.2
+
+
+class FrameTimeModel:
+    """Per-group (robot) seconds-per-frame estimates, persisted as JSON."""
+
+    def __init__(self, path=None):
+        self.path = path or cache_root("scheduler") / "frame_times.json"
+        try:
+            self.rates = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.rates = {}
+
+    def sec_per_frame(self, group):
+        if group in self.rates:
+            return self.rates[group]
+        # unseen robot: mean of the known ones is a better guess than a constant
+        return sum(self.rates.values()) / len(self.rates) if self.rates else DEFAULT_SEC_PER_FRAME
+
+    def cost(self, group, frames):
+        return frames * self.sec_per_frame(group)
+
+    def update(self, group, frames, seconds):
+        if frames <= 0:
+            return
+        rate = seconds / frames
+        old = self.rates.get(group)
+        self.rates[group] = rate if old is None else (1 - _EWMA) * old + _EWMA * rate
+
+    def save(self):
+        atomic_write_json(self.rates, self.path)
+
+
+class Job:
+    def __init__(self, key, args, frames, group):
+        self.key = key
+        self.args = args
+        self.frames = int(frames)
+        self.group = group
+        self.seconds = None
+
+    def __repr__(self):
+        return f"Job({self.key}, frames={self.frames})"
+
+
+def _timed(fn, args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+def _fmt(seconds):
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h:d}:{m:02d}:{s:02d}"
+
+
+def run_jobs(jobs, fn, workers, model=None, mp_context=None, report_every=10.0, refill=None,
+             measure=None):
+    """
+    Run fn(*job.args) for every job on a process pool, longest estimated
+    job first; yields (job, result) as jobs finish.  Exceptions propagate
+    like fut.result() would, after the model has been saved.
+
+    refill() is called whenever the queue runs dry; the jobs it returns are
+    ordered and queued on the same (warm) pool, [] ends the run once the
+    running jobs are done (core.lease claims the next batch this way).
+
+    measure(result) -> frames the job really processed; only those jobs
+    (> 0) update the model, so cache hits and early rejections – seconds
+    for a whole episode's worth of frames – do not drag the rate down.
+    Without it every job counts with job.frames.
+    """
+    model = model or FrameTimeModel()
+    by_cost = lambda j: model.cost(j.group, j.frames)
+    queue = sorted(jobs, key=by_cost, reverse=True)
+    total_frames = sum(j.frames for j in queue)
+    done_frames = 0
+    t_start = last_report = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+            running = {}
+
+            def _fill():
+                nonlocal total_frames
+                while len(running) < workers:
+                    if not queue and refill is not None:
+                        more = sorted(refill(), key=by_cost, reverse=True)
+                        total_frames += sum(j.frames for j in more)
+                        queue.extend(more)
+                    if not queue:
+                        return
+                    job = queue.pop(0)
+                    running[pool.submit(_timed, fn, job.args)] = job
+
+            _fill()
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    job = running.pop(fut)
+                    result, seconds = fut.result()
+                    job.seconds = seconds
+                    model.update(job.group, job.frames if measure is None else measure(result) or 0,
+                                 seconds)
+                    done_frames += job.frames
+                    yield job, result
+                _fill()
+
+                now = time.perf_counter()
+                if now - last_report >= report_every or not running:
+                    last_report = now
+                    rate = done_frames / max(now - t_start, 1e-9)
+                    eta = _fmt((total_frames - done_frames) / rate) if rate > 0 else "?"
+                    print(f"[progress] {done_frames}/{total_frames} frames "
+                          f"({100.0 * done_frames / max(total_frames, 1):.1f}%), {rate:.1f} fr/s, "
+                          f"elapsed {_fmt(now - t_start)}, ETA {eta}", flush=True)
+    finally:
+        model.save()
@@ -0,0 +1,440 @@
+"""
+Per-dataset chunked store for source / target robot states.
+
+The replay writes one tiny npz per episode (`source_robot_states/{ep}.npz`,
+`target_robot_states/{robot}/{ep}.npz`); on NFS every consumer then pays
+one metadata round-trip per file.  A `StateStore` keeps all of them in a
+single directory:
+
+    {dataset}/robot_states.store/
+        store.h5                        consolidated, ragged per field
+        shards/{host}-{pid}-{n}.h5      closed per-writer shards
+        shards/.{host}-{pid}-{n}.h5.tmp the shard a writer is appending to
+
+Each writer process appends its puts to its own hidden temp shard and
+renames it into place after SHARD_EPISODES puts and when the process
+exits, so readers only ever open complete files (no HDF5 file shared
+between a writer and readers, no SWMR) and a closed shard is never
+written again.  Once AUTO_CONSOLIDATE shards have piled up, the writer
+that closed the last one folds them into store.h5 (`consolidate()`, one
+node at a time under `consolidate.lock`), so the steady state is a single
+chunked file however many workers wrote it.  In store.h5 every field of a
+kind ("source", "target/UR5e", …) is one chunked dataset with the episodes
+concatenated along axis 0 and an `(episode, start, length)` index, so
+`get(kind, episode)` is one dict lookup plus one slice per field.
+
+    store = StateStore(replay_path)
+    store.put("target/UR5e", 12, target_pose=poses, joint_angles=q)
+    store.get("source", 12)["pos"]
+
+`load_episode_states` reads whichever of the store entry and the legacy
+npz was written last, so readers work on either layout and a re-export in
+one layout is never shadowed by the other.  Unreadable files are logged
+and skipped rather than failing every reader of the dataset.
+"""
+import os
+import socket
+import time
+import uuid
+from multiprocessing import util as mp_util
+from pathlib import Path
+
+import h5py
+import numpy as np
+import portalocker
+
+STORE_NAME = "robot_states.store"
+SHARD_EPISODES = 256        # puts per shard before a writer closes it and starts the next
+AUTO_CONSOLIDATE = 16       # closed shards that trigger a consolidate()
+_CHUNK_ROWS = 4096
+
+_stores = {}       # dataset root -> StateStore (keeps the index warm)
+
+
+def _legacy_npz(dataset_root, kind, episode):
+    root = Path(dataset_root)
+    if kind == "source":
+        return root / "source_robot_states" / f"{episode}.npz"
+    _, robot = kind.split("/", 1)
+    return root / "target_robot_states" / robot / f"{episode}.npz"
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _ShardWriter:
+    """This process's open shard: a hidden temp file renamed into place by close()."""
+
+    def __init__(self, shard_dir):
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.h5"
+        self.path = shard_dir / name
+        self.tmp = shard_dir / f".{name}.tmp"
+        self.file = h5py.File(self.tmp, "w")
+        self.count = 0
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp, self.path)
+
+
+class StateStore:
+    def __init__(self, dataset_root):
+        self.dataset_root = Path(dataset_root)
+        self.root = self.dataset_root / STORE_NAME
+        self._index = None                  # kind -> {episode: (file, location)}
+        self._stamp = None                  # (store.h5, shards/) mtimes the index was built from
+        self._writer = None
+        self._pending = {}                  # kind -> {episode} in the open writer's temp shard
+
+    @classmethod
+    def open(cls, dataset_root):
+        """Per-process cached instance, so the index is built once."""
+        key = str(Path(dataset_root).resolve())
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = cls(dataset_root)
+        return store
+
+    @property
+    def store_path(self):
+        return self.root / "store.h5"
+
+    @property
+    def shard_dir(self):
+        return self.root / "shards"
+
+    # ------------------------------------------------------------------
+    # writing
+    # ------------------------------------------------------------------
+    def put(self, kind, episode, **arrays):
+        """Write (or overwrite) one episode's arrays into this process's shard."""
+        self._put(kind, episode, arrays, time.time())
+
+    def _put(self, kind, episode, arrays, written):
+        if self._writer is None:
+            self._writer = _ShardWriter(self.shard_dir)
+            # pool workers exit through multiprocessing, which skips atexit
+            # but runs these finalizers (and so does a normal interpreter exit)
+            mp_util.Finalize(self, self.close, exitpriority=10)
+        f = self._writer.file
+        name = f"{kind}/{int(episode)}"
+        if name in f:
+            del f[name]
+        grp = f.create_group(name)
+        for field, value in arrays.items():
+            grp.create_dataset(field, data=np.asarray(value))
+        grp.attrs["written"] = float(written)
+        f.flush()
+        self._writer.count += 1
+        self._pending.setdefault(kind, set()).add(int(episode))
+        if self._index is not None:
+            self._index.setdefault(kind, {})[int(episode)] = (self._writer.tmp, None)
+        if self._writer.count >= SHARD_EPISODES:
+            self.close()
+
+    def close(self):
+        """
+        Publish this process's shard (rename into place); consolidate once
+        AUTO_CONSOLIDATE shards are waiting and no other node is at it.
+        """
+        if self._writer is None:
+            return
+        writer, self._writer = self._writer, None
+        writer.close()
+        self._pending = {}
+        self._index = None
+        shards = [n for n in os.listdir(self.shard_dir) if n.endswith(".h5") and not n.startswith(".")]
+        if len(shards) >= AUTO_CONSOLIDATE:
+            try:
+                self.consolidate(timeout=0)
+            except portalocker.AlreadyLocked:
+                pass                            # someone else is consolidating
+
+    # ------------------------------------------------------------------
+    # reading
+    # ------------------------------------------------------------------
+    def _current_stamp(self):
+        return _mtime(self.store_path), _mtime(self.shard_dir)
+
+    def _closed_shards(self):
+        """Published shards, oldest first, so later puts override earlier ones."""
+        names = os.listdir(self.shard_dir) if self.shard_dir.is_dir() else []
+        paths = [self.shard_dir / n for n in names if n.endswith(".h5") and not n.startswith(".")]
+        stamped = [(m, p) for p in paths if (m := _mtime(p)) is not None]
+        return [p for _, p in sorted(stamped)]
+
+    def _build_index(self):
+        index = {}
+        stamp = self._current_stamp()
+        if self.store_path.is_file():
+            try:
+                # store.h5 is only ever replaced atomically, never written in place
+                with h5py.File(self.store_path, "r", locking=False) as f:
+                    for kind in _kinds(f):
+                        eps = f[kind]["index/episode"][()]
+                        entries = index.setdefault(kind, {})
+                        for row, ep in enumerate(eps):
+                            entries[int(ep)] = (self.store_path, row)
+            except (OSError, KeyError) as e:
+                print(f"[state_store] skipping unreadable {self.store_path}: {e}")
+        # shards override the consolidated file, our own open shard overrides all
+        for path in self._closed_shards():
+            try:
+                with h5py.File(path, "r", locking=False) as f:
+                    for kind in _kinds(f):
+                        entries = index.setdefault(kind, {})
+                        for ep in f[kind].keys():
+                            entries[int(ep)] = (path, None)
+            except (OSError, KeyError) as e:
+                print(f"[state_store] skipping unreadable {path}: {e}")
+        for kind, eps in self._pending.items():
+            index.setdefault(kind, {}).update((ep, (self._writer.tmp, None)) for ep in eps)
+        self._index = index
+        self._stamp = stamp
+        return index
+
+    def _lookup(self, kind, episode):
+        index = self._index if self._index is not None else self._build_index()
+        loc = index.get(kind, {}).get(int(episode))
+        if loc is None and self._current_stamp() != self._stamp:
+            # written (or consolidated) since we looked; an unchanged store
+            # answers misses from the cached index without reopening anything
+            loc = self._build_index().get(kind, {}).get(int(episode))
+        return loc
+
+    def kinds(self):
+        index = self._index if self._index is not None else self._build_index()
+        return sorted(index)
+
+    def episodes(self, kind):
+        index = self._index if self._index is not None else self._build_index()
+        return sorted(index.get(kind, {}))
+
+    def __contains__(self, key):
+        kind, episode = key
+        return self._lookup(kind, episode) is not None
+
+    def get(self, kind, episode):
+        """dict field -> array for one episode; KeyError if absent or unreadable."""
+        return self.get_with_time(kind, episode)[0]
+
+    def get_with_time(self, kind, episode):
+        """(arrays, time.time() of the put) for one episode; KeyError like get()."""
+        loc = self._lookup(kind, episode)
+        if loc is None:
+            raise KeyError(f"{kind}/{episode} not in {self.root}")
+        try:
+            return self._read(kind, episode, *loc)
+        except FileNotFoundError:
+            # consolidated away under us: look again once
+            again = self._build_index().get(kind, {}).get(int(episode))
+            if again is None or again[0] == loc[0]:
+                raise KeyError(f"{kind}/{episode} not in {self.root}") from None
+            return self._read(kind, episode, *again)
+        except (OSError, KeyError) as e:
+            print(f"[state_store] skipping unreadable {loc[0]} for {kind}/{episode}: {e}")
+            raise KeyError(f"{kind}/{episode} unreadable in {self.root}") from e
+
+    def _read(self, kind, episode, path, row):
+        if self._writer is not None and path == self._writer.tmp:
+            # HDF5 refuses a second open of our own shard; read through the writer
+            return _read_entry(self._writer.file, kind, episode, row, path)
+        with h5py.File(path, "r", locking=False) as f:
+            return _read_entry(f, kind, episode, row, path)
+
+    # ------------------------------------------------------------------
+    # maintenance
+    # ------------------------------------------------------------------
+    def _adopt_orphans(self):
+        """Publish temp shards left by dead writers on this host (flushed after every put)."""
+        host = socket.gethostname()
+        for name in os.listdir(self.shard_dir) if self.shard_dir.is_dir() else []:
+            if not (name.startswith(".") and name.endswith(".h5.tmp")):
+                continue
+            stem = name[1:-len(".tmp")]
+            shost, _, rest = stem[:-len(".h5")].rpartition("-")[0].rpartition("-")
+            if shost != host or not rest.isdigit() or _pid_alive(int(rest)):
+                continue
+            if self._writer is not None and name == self._writer.tmp.name:
+                continue
+            try:
+                os.replace(self.shard_dir / name, self.shard_dir / stem)
+                print(f"[state_store] adopted shard of dead writer {rest}: {stem}")
+            except FileNotFoundError:
+                pass
+
+    def consolidate(self, timeout=600):
+        """
+        Merge store.h5 and every closed shard into a fresh store.h5 (atomic
+        replace), then delete the shards that were merged.  One consolidation
+        at a time per store (portalocker.AlreadyLocked if *timeout* runs
+        out); shards published while it runs are kept and still override
+        store.h5.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        with portalocker.Lock(str(self.root / "consolidate.lock"), "a", timeout=timeout,
+                              fail_when_locked=timeout == 0):
+            self._adopt_orphans()
+            index = self._build_index()
+            tmp = self.root / f".store.{socket.gethostname()}-{os.getpid()}.h5"
+            handles = {}
+            merged = {}                          # shard -> (inode, size, mtime) as read
+            try:
+                with h5py.File(tmp, "w") as out:
+                    for kind, entries in index.items():
+                        episodes, records, written = [], [], []
+                        for ep in sorted(entries):
+                            path, row = entries[ep]
+                            if self._writer is not None and path == self._writer.tmp:
+                                continue         # still open: stays a shard until close()
+                            try:
+                                if path not in handles:
+                                    st = path.stat()
+                                    handles[path] = h5py.File(path, "r", locking=False)
+                                    if row is None:
+                                        merged[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                                arrays, t = _read_entry(handles[path], kind, ep, row, path)
+                            except (OSError, KeyError) as e:
+                                print(f"[state_store] dropping unreadable {kind}/{ep} ({path}): {e}")
+                                continue
+                            episodes.append(ep)
+                            records.append(arrays)
+                            written.append(t)
+                        if episodes:
+                            _write_kind(out.create_group(kind), episodes, records, written)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            finally:
+                for f in handles.values():
+                    f.close()
+            os.replace(tmp, self.store_path)
+            for path, seen in merged.items():
+                # closed shards are never rewritten; still, only drop exactly what we read
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                if (st.st_ino, st.st_size, st.st_mtime_ns) == seen:
+                    path.unlink(missing_ok=True)
+            self._index = None
+
+    def import_npz(self):
+        """Copy the legacy per-episode npz tree into this store's shards."""
+        n = 0
+        src = self.dataset_root / "source_robot_states"
+        for path in sorted(src.glob("*.npz")):
+            if path.stem.isdigit():
+                with np.load(path, allow_pickle=True) as d:
+                    self._put("source", int(path.stem), {k: d[k] for k in d.files},
+                              path.stat().st_mtime)
+                n += 1
+        for robot_dir in sorted((self.dataset_root / "target_robot_states").glob("*")):
+            for path in sorted(robot_dir.glob("*.npz")):
+                if path.stem.isdigit():
+                    with np.load(path, allow_pickle=True) as d:
+                        self._put(f"target/{robot_dir.name}", int(path.stem),
+                                  {k: d[k] for k in d.files}, path.stat().st_mtime)
+                    n += 1
+        self.close()
+        return n
+
+
+def _kinds(f):
+    """Group paths that hold episodes: "source", "target/<robot>"."""
+    kinds = []
+    if "source" in f:
+        kinds.append("source")
+    if "target" in f:
+        kinds.extend(f"target/{robot}" for robot in f["target"].keys())
+    return kinds
+
+
+def _write_kind(grp, episodes, records, written):
+    grp.create_dataset("index/episode", data=np.asarray(episodes, dtype=np.int64))
+    grp.create_dataset("index/written", data=np.asarray(written, dtype=np.float64))
+    fields = sorted({k for r in records for k in r})
+    for field in fields:
+        parts = [np.atleast_1d(r[field]) for r in records if field in r]
+        lengths = np.array([len(np.atleast_1d(r[field])) if field in r else 0 for r in records],
+                           dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        data = np.concatenate(parts, axis=0)
+        chunks = (min(len(data), _CHUNK_ROWS),) + data.shape[1:] if len(data) else None
+        ds = grp.create_dataset(f"data/{field}", data=data, chunks=chunks)
+        ds.attrs["scalar"] = all(np.ndim(r[field]) == 0 for r in records if field in r)
+        grp.create_dataset(f"index/{field}_start", data=starts)
+        grp.create_dataset(f"index/{field}_length", data=lengths)
+
+
+def _read_entry(f, kind, episode, row, path):
+    """(arrays, put time); files older than the put times fall back to their mtime."""
+    if row is None:                                 # shard: one group per episode
+        grp = f[f"{kind}/{int(episode)}"]
+        written = grp.attrs.get("written")
+        arrays = {k: grp[k][()] for k in grp.keys()}
+    else:
+        written = f[kind]["index/written"][row] if "index/written" in f[kind] else None
+        arrays = _read_row(f[kind], row)
+    if written is None:
+        written = Path(path).stat().st_mtime
+    return arrays, float(written)
+
+
+def _read_row(grp, row):
+    out = {}
+    for field, ds in grp["data"].items():
+        n = int(grp[f"index/{field}_length"][row])
+        if n == 0:                                  # field absent for this episode
+            continue
+        start = int(grp[f"index/{field}_start"][row])
+        value = ds[start:start + n]
+        out[field] = value[0] if ds.attrs["scalar"] else value
+    return out
+
+
+def load_episode_states(dataset_root, kind, episode):
+    """
+    Arrays for (kind, episode) from the dataset's StateStore or the legacy
+    npz file, whichever was written last (an export re-run without
+    --state_store must not be shadowed by an older store entry, nor the
+    other way round).  kind: "source" or "target/<robot>".
+    """
+    npz = _legacy_npz(dataset_root, kind, episode)
+    store = StateStore.open(dataset_root)
+    if store.root.is_dir():
+        try:
+            arrays, written = store.get_with_time(kind, episode)
+        except KeyError:
+            pass
+        else:
+            npz_mtime = _mtime(npz)
+            if npz_mtime is None or written >= npz_mtime / 1e9:
+                return arrays
+    with np.load(npz, allow_pickle=True) as d:
+        return {k: d[k] for k in d.files}
+
+
+def list_episodes(dataset_root, kind):
+    """Sorted episode ids for *kind* in the StateStore and/or legacy npz tree."""
+    store = StateStore.open(dataset_root)
+    episodes = set(store.episodes(kind)) if store.root.is_dir() else set()
+    legacy_dir = _legacy_npz(dataset_root, kind, 0).parent
+    if legacy_dir.is_dir():
+        episodes.update(int(p.stem) for p in legacy_dir.glob("*.npz") if p.stem.isdigit())
+    return sorted(episodes)
@@ -0,0 +1,103 @@
+"""
+Streaming mp4 writer.
+
+Frames are handed to an ffmpeg (imageio) writer on a background thread as
+they are rendered, so an episode never has to sit in memory as a frame
+list and encoding overlaps with simulation.  Output goes to a hidden temp
+file next to the target and is renamed into place only by `close()`;
+`abort()` (or an exception inside the `with` block) deletes it, so a
+failed replay never leaves a partial video behind.
+
+    with StreamingVideoWriter(path, pixelformat="yuv420p") as w:
+        for frame in frames:
+            w.append(frame)
+"""
+import os
+import queue
+import threading
+from pathlib import Path
+
+import imageio.v2 as imageio
+
+_STOP = object()
+
+
+class StreamingVideoWriter:
+    def __init__(self, path, fps=30, codec="libx264", pixelformat="yuv420p",
+                 macro_block_size=1, max_queue=64):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # keep the suffix: imageio/ffmpeg picks the container from it
+        self._tmp = self.path.with_name(f".{self.path.stem}.{os.getpid()}.tmp{self.path.suffix}")
+        self._writer = imageio.get_writer(
+            self._tmp,
+            fps=fps,
+            codec=codec,
+            macro_block_size=macro_block_size,      # no 16-pixel padding
+            pixelformat=pixelformat,
+        )
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._closed = False
+        self.num_frames = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _STOP:
+                return
+            if self._error is None:
+                try:
+                    self._writer.append_data(frame)
+                except Exception as e:              # surfaced by append/close
+                    self._error = e
+
+    def append(self, frame):
+        """Queue one frame (H, W) or (H, W, 3) uint8; blocks if the encoder lags."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+        self.num_frames += 1
+
+    def _finish(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._writer.close()
+        self._closed = True
+
+    def close(self):
+        """Flush, finalise and atomically move the video into place."""
+        if self._closed:
+            return
+        try:
+            self._finish()
+        except Exception:
+            self._tmp.unlink(missing_ok=True)
+            raise
+        if self._error is not None:
+            self._tmp.unlink(missing_ok=True)
+            raise self._error
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        """Stop encoding and discard the temp file."""
+        if self._closed:
+            return
+        try:
+            self._finish()
+        except Exception:
+            pass                                    # the output is discarded anyway
+        finally:
+            self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,207 @@
+"""
+Lazy, on-demand target-robot rendering.
+
+Instead of pre-rendering every (dataset, episode, robot) to disk, a
+training job asks for frames when it needs them:
+
+    client = AugmentationClient(("localhost", 6001))
+    out = client.frames("toto", 12, "UR5e", start=40, stop=50)
+    out["rgb"]      # (10, 84, 84, 3) uint8
+    out["mask"]     # (10, 84, 84) bool
+
+`AugmentationService` replays the episode on this process's warm env
+(sim.env_pool) up to `stop` – the IK replay is path dependent, so it always
+starts at frame 0 – and keeps the rendered prefix in a byte-bounded memory
+LRU backed by a size-bounded disk `ResultCache` ("augment_frames"), so
+repeated / overlapping requests never re-render.  Keys include the replay
+code fingerprint, like the pipeline's result cache.
+
+`serve()` exposes one service over multiprocessing.connection (one
+thread per client, renders serialized – envs are not thread safe).
+Requests are unpickled, so only the loopback interface may use the
+well-known DEFAULT_AUTHKEY; any other address needs an explicit key (or
+gets a random one, printed at startup).
+`LocalAugmentationClient` offers the same API in-process for tests and
+single-process jobs.  serve_augmentation.py is the command-line entry.
+"""
+import ipaddress
+import secrets
+import socket
+import threading
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from config.robot_pose_dict import ROBOT_POSE_DICT
+from core.result_cache import MemoryLRU, ResultCache, code_fingerprint
+from envs.target_env import REPLAY_CODE, TargetEnvWrapper, load_replay_episode
+
+GRIPPERS = {
+    "Panda": "PandaGripper",
+    "Sawyer": "RethinkGripper",
+    "Jaco": "JacoThreeFingerGripper",
+    "IIWA": "Robotiq85Gripper",
+    "UR5e": "Robotiq85Gripper",
+    "Kinova3": "Robotiq85Gripper",
+}
+DEFAULT_AUTHKEY = b"robot2robot"
+
+
+class AugmentationService:
+    def __init__(self, cache_mb=2048, disk_cache_bytes=None, camera_height=84, camera_width=84,
+                 states_root=None):
+        """
+        states_root : dataset -> folder holding its source robot states;
+                      default ROBOT_CAMERA_POSES_DICT[dataset]["replay_path"].
+        """
+        self.memory = MemoryLRU(cache_mb << 20)
+        self.disk = ResultCache("augment_frames", max_bytes=disk_cache_bytes)
+        self.camera_height = camera_height
+        self.camera_width = camera_width
+        self.states_root = states_root or {}
+        self.renders = 0
+        self._lock = threading.Lock()
+
+    def _root(self, dataset):
+        return self.states_root.get(dataset) or ROBOT_CAMERA_POSES_DICT[dataset]["replay_path"]
+
+    def _key(self, replay, robot, disp):
+        return ResultCache.key(
+            replay, robot, GRIPPERS[robot], np.asarray(disp, dtype=np.float64),
+            (self.camera_height, self.camera_width), code_fingerprint(*REPLAY_CODE),
+        )
+
+    def _render(self, dataset, episode, robot, disp, stop):
+        wrapper = TargetEnvWrapper(robot, GRIPPERS[robot], dataset,
+                                   camera_height=self.camera_height, camera_width=self.camera_width,
+                                   pooled=True, output_hw=(self.camera_height, self.camera_width))
+        self.renders += 1
+        return wrapper.render_frames(
+            source_robot_states_path=self._root(dataset),
+            robot_dataset=dataset,
+            robot_disp=np.asarray(disp, dtype=np.float64),
+            episode=episode,
+            stop=stop,
+        )
+
+    def frames(self, dataset, episode, robot, start=0, stop=None, disp=None):
+        """
+        dict rgb / mask / target_pose / joint_angles / gripper_width for
+        frames [start, stop) of *robot* replaying *dataset* episode.
+        disp defaults to ROBOT_POSE_DICT[dataset][robot].
+        """
+        if disp is None:
+            disp = ROBOT_POSE_DICT[dataset][robot]
+        with self._lock:
+            replay = load_replay_episode(self._root(dataset), dataset, episode)
+            key = self._key(replay, robot, disp)
+            entry = self.memory.get(key)
+            if entry is None:
+                entry = self.disk.get(key)
+            # complete=1 means the prefix already is the whole episode
+            if entry is None or (not entry["complete"] and (stop is None or len(entry["rgb"]) < stop)):
+                rendered = self._render(dataset, episode, robot, disp, stop)
+                rendered.pop("success")
+                rendered.pop("offsets")
+                entry = dict(rendered, complete=np.asarray(len(rendered["rgb"]) >= len(replay[0])))
+                self.disk.put(key, **entry)
+            self.memory.put(key, entry)
+        # copies: the entry stays in the LRU, callers must not alias it
+        return {k: v[start:stop].copy() for k, v in entry.items() if k != "complete"}
+
+    def stats(self):
+        return {"renders": self.renders, "memory_hits": self.memory.hits,
+                "memory_misses": self.memory.misses, "memory_bytes": self.memory.nbytes}
+
+
+# ---------------------------------------------------------------------------
+# transport
+# ---------------------------------------------------------------------------
+def _handle(conn, service):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                op = request.pop("op")
+                if op == "frames":
+                    reply = {"ok": True, "result": service.frames(**request)}
+                elif op == "stats":
+                    reply = {"ok": True, "result": service.stats()}
+                else:
+                    raise ValueError(f"Unknown op {op!r}")
+            except Exception as exc:
+                reply = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+            conn.send(reply)
+
+
+def _is_loopback(address):
+    if isinstance(address, str):                    # AF_UNIX path / named pipe
+        return True
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(address[0])).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def serve(address=("localhost", 6001), authkey=None, service=None):
+    """
+    Serve *service* forever; one handler thread per connected client.
+    authkey defaults to DEFAULT_AUTHKEY on loopback and to a random key
+    (printed) elsewhere; DEFAULT_AUTHKEY is refused off loopback.
+    """
+    if not _is_loopback(address):
+        if authkey == DEFAULT_AUTHKEY:
+            raise ValueError(f"refusing the well-known authkey on non-loopback address {address}")
+        if authkey is None:
+            authkey = secrets.token_hex(16).encode()
+            print(f"augmentation service authkey: {authkey.decode()}", flush=True)
+    elif authkey is None:
+        authkey = DEFAULT_AUTHKEY
+    service = service or AugmentationService()
+    with Listener(address, authkey=authkey) as listener:
+        print(f"augmentation service listening on {listener.address}", flush=True)
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle, args=(conn, service), daemon=True).start()
+
+
+class AugmentationClient:
+    def __init__(self, address=("localhost", 6001), authkey=DEFAULT_AUTHKEY):
+        self._conn = Client(address, authkey=authkey)
+
+    def _call(self, op, **kwargs):
+        self._conn.send(dict(kwargs, op=op))
+        reply = self._conn.recv()
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def frames(self, dataset, episode, robot, start=0, stop=None, disp=None):
+        return self._call("frames", dataset=dataset, episode=episode, robot=robot,
+                          start=start, stop=stop, disp=disp)
+
+    def stats(self):
+        return self._call("stats")
+
+    def close(self):
+        self._conn.close()
+
+
+class LocalAugmentationClient:
+    """Same API as AugmentationClient, rendering in this process."""
+
+    def __init__(self, service=None, **service_kwargs):
+        self.service = service or AugmentationService(**service_kwargs)
+
+    def frames(self, dataset, episode, robot, start=0, stop=None, disp=None):
+        return self.service.frames(dataset, episode, robot, start, stop, disp)
+
+    def stats(self):
+        return self.service.stats()
+
+    def close(self):
+        pass
@@ -1,21 +1,49 @@
 #from sim.robot_camera_15 import RobotCameraWrapper
+import robosuite as suite
 from sim.robot_camera import RobotCameraWrapper
+from sim.env_pool import get_robot_env
 from sim.camera import CameraWrapper
 import numpy as np
 import os
 from tqdm import tqdm
 from scipy.spatial.transform import Rotation as R
 from sim.dataset_loader import gripper_convert, load_states_from_harsha
+from sim.kinematics import KinematicChain
+from core.state_store import StateStore
+from core.result_cache import ResultCache, code_fingerprint
+from pathlib import Path
 from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
 
 class SourceEnvWrapper:
-    def __init__(self, source_name, source_gripper, robot_dataset, camera_height=256, camera_width=256, verbose=False):
-        self.source_env = RobotCameraWrapper(robotname=source_name, grippername=source_gripper, robot_dataset=robot_dataset, camera_height=camera_height, camera_width=camera_width)
+    def __init__(self, source_name, source_gripper, robot_dataset, camera_height=256, camera_width=256, verbose=False, use_sim=False, pooled=False, state_store=False, use_cache=False):
+        # FK only needs the kinematic chain; the full robosuite env (and its
+        # offscreen renderer) is built only when use_sim=True.
+        self.source_env = None
+        self.chain = None
+        if use_sim and pooled:
+            self.source_env = get_robot_env(source_name, source_gripper, camera_height, camera_width, robot_dataset=robot_dataset)
+        elif use_sim:
+            self.source_env = RobotCameraWrapper(robotname=source_name, grippername=source_gripper, robot_dataset=robot_dataset, camera_height=camera_height, camera_width=camera_width)
+        else:
+            self.chain = KinematicChain.for_robot(source_name, source_gripper)
         self.source_name = source_name
+        self.source_gripper = source_gripper
         self.robot_dataset = robot_dataset
         self.fixed_cam_positions = None
         self.fixed_cam_quaternions = None
         self.verbose = verbose
+        self.pooled = pooled
+        # state_store=True: write into <dataset>/robot_states.store instead of
+        # one npz per episode (see core.state_store)
+        self.state_store = state_store
+        # use_cache=True: EEF poses of an already-seen trajectory come from the
+        # content-addressed result cache instead of FK / the sim
+        self.result_cache = ResultCache("source_fk") if use_cache else None
+
+    def close(self):
+        # pooled envs stay alive for the next episode in this process
+        if self.source_env is not None and not self.pooled:
+            self.source_env.env.close_renderer()
     
     def get_source_robot_states(self, gripper_states, joint_angles=None, ee_states=None, episode=0, save_source_robot_states_path="paired_images"):
         if joint_angles is None and ee_states is None:
@@ -24,24 +52,28 @@ class SourceEnvWrapper:
             raise ValueError("joint_angles must be provided")
         info = ROBOT_CAMERA_POSES_DICT[self.robot_dataset]
 
-        target_pose_list = []
-        num_frames = joint_angles.shape[0]
-
-        for pose_index in tqdm(range(num_frames), desc=f'{self.source_name} Pose States Calculation'):    
-        #for pose_index in range(num_frames):  
-            source_reached = False
-            attempt_counter = 0
-            while source_reached == False:
-                attempt_counter += 1
-                if attempt_counter > 10:
-                    break
-                for i in range(5):
-                    joint_angle = joint_angles[pose_index]
-                    self.source_env.teleport_to_joint_positions(joint_angle)
-                    target_pose = self.source_env.compute_eef_pose()
+        cache_key = hit = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.key(
+                joint_angles, self.source_name, self.source_gripper, self.chain is None, suite.__version__,
+                code_fingerprint("envs/source_env.py", "sim/kinematics.py", "sim/robot_camera.py"),
+            )
+            hit = self.result_cache.get(cache_key)
 
-            target_pose_list.append(target_pose)       
-        target_pose_array = np.vstack(target_pose_list)
+        if hit is not None:
+            target_pose_array = hit["pos"]
+        elif self.chain is not None:
+            target_pose_array = self.chain.forward(joint_angles[:, :self.chain.num_joints])
+        else:
+            target_pose_list = []
+            num_frames = joint_angles.shape[0]
+            for pose_index in tqdm(range(num_frames), desc=f'{self.source_name} Pose States Calculation'):
+                # teleport + forward is deterministic, one pass per frame is enough
+                self.source_env.teleport_to_joint_positions(joint_angles[pose_index])
+                target_pose_list.append(self.source_env.compute_eef_pose())
+            target_pose_array = np.vstack(target_pose_list)
+        if cache_key is not None and hit is None:
+            self.result_cache.put(cache_key, pos=target_pose_array)
         GREEN = "\033[92m"
         RESET = "\033[0m"
         npz_path = os.path.join(save_source_robot_states_path, f"{episode}.npz")
@@ -56,5 +88,10 @@ class SourceEnvWrapper:
             else:
                 gripper_states = np.clip(gripper_states, 0, 1)
 
-        np.savez(npz_path, pos=target_pose_array, grip=gripper_states)
-        print(f"{GREEN}✔ States saved under {npz_path}{RESET}")
\ No newline at end of file
+        if self.state_store:
+            store = StateStore.open(Path(save_source_robot_states_path).parent)
+            store.put("source", episode, pos=target_pose_array, grip=gripper_states)
+            print(f"{GREEN}✔ States saved under {store.root} (source/{episode}){RESET}")
+        else:
+            np.savez(npz_path, pos=target_pose_array, grip=gripper_states)
+            print(f"{GREEN}✔ States saved under {npz_path}{RESET}")
\ No newline at end of file
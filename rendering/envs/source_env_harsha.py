@@ -7,6 +7,7 @@ from tqdm import tqdm
 from scipy.spatial.transform import Rotation as R
 from sim.dataset_loader import gripper_convert, load_states_from_harsha
 from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.io import loadtxt_cached
 
 class SourceEnvWrapper:
     def __init__(self, source_name, source_gripper, robot_dataset, camera_height=256, camera_width=256, verbose=False):
@@ -25,8 +26,8 @@ class SourceEnvWrapper:
         if self.robot_dataset == "ucsd_kitchen_rlds" or self.robot_dataset == "utokyo_pick_and_place":
             joint_angles, gripper_states, translation = load_states_from_harsha(self.robot_dataset, episode, self.source_env.robot_name)
         else:
-            joint_angles = np.loadtxt(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", self.robot_dataset, f"episode_{episode}", "joint_states.txt"))
-            gripper_states = np.loadtxt(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", self.robot_dataset, f"episode_{episode}", "gripper_states.txt"))
+            joint_angles = loadtxt_cached(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", self.robot_dataset, f"episode_{episode}", "joint_states.txt"))
+            gripper_states = loadtxt_cached(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", self.robot_dataset, f"episode_{episode}", "gripper_states.txt"))
         if self.robot_dataset == "toto":
             joint_angles[:, 5] += 3.14159 / 2
             joint_angles[:, 6] += 3.14159 / 4
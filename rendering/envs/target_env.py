@@ -1,4 +1,5 @@
 from sim.robot_camera import RobotCameraWrapper
+from sim.env_pool import get_robot_env
 #from sim.robot_camera_15 import RobotCameraWrapper
 from core.signal import reach_further
 import numpy as np
@@ -12,119 +13,206 @@ import matplotlib.pyplot as plt
 from scipy.spatial.transform import Rotation as R
 import cv2
 from pathlib import Path
-import imageio.v3 as iio
+from core.video import StreamingVideoWriter
+from core.masks import MaskWriter, MASK_SUFFIX
+from core.state_store import StateStore, load_episode_states
 
 
 STEP_MAX = 0.02          # 单帧允许的最大 L1 位移（米），1 cm
 ORI_LERP = False
 
+# sources whose behaviour decides a replay's output (result cache key)
+REPLAY_CODE = (
+    "envs/target_env.py",
+    "sim/robot_camera.py",
+    "sim/ik.py",
+    "sim/render.py",
+    "sim/geom_utils.py",
+    "core/physics.py",
+)
+
+
+def replay_output_paths(save_paired_images_folder_path, target_name, episode, mask_format="packbits"):
+    """(mask path, video path) that generate_image writes for one episode."""
+    root = Path(save_paired_images_folder_path)
+    mask_suffix = MASK_SUFFIX if mask_format == "packbits" else ".mp4"
+    return (root / f"{target_name}_replay_mask" / f"{episode}{mask_suffix}",
+            root / f"{target_name}_replay_video" / f"{episode}.mp4")
+
+
+def load_replay_episode(source_robot_states_path, robot_dataset, episode):
+    """Return (source poses, gripper targets, camera pose, fov or None)."""
+    data = load_episode_states(source_robot_states_path, "source", episode)
+    info = ROBOT_CAMERA_POSES_DICT[robot_dataset]
+    target_pose_array = data['pos'].copy()
+    gripper_array = data['grip']
+    fov = data["fov"] if "fov" in data else None
+
+    camera_pose = None
+    if robot_dataset == "can":
+        camera_pose = np.array([0.9, 0.1, 1.75, 0.271, 0.271, 0.653, 0.653])
+    elif robot_dataset == "lift":
+        camera_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
+    elif robot_dataset == "square":
+        camera_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
+    elif robot_dataset == "stack":
+        camera_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
+    elif robot_dataset == "three_piece_assembly":
+        camera_pose = np.array([0.713078462147161, 2.062036796036723e-08, 1.5194726087166726, 0.293668270111084, 0.2936684489250183, 0.6432408690452576, 0.6432409286499023])
+    else:
+        for viewpoint in info["viewpoints"]:
+            if episode in viewpoint["episodes"]:
+                camera_reference_position = viewpoint["camera_position"] + np.array([-0.6, 0.0, 0.912]) 
+                roll_deg = viewpoint["roll"]
+                pitch_deg = viewpoint["pitch"]
+                yaw_deg = viewpoint["yaw"]
+                r = R.from_euler('xyz', [roll_deg, pitch_deg, yaw_deg], degrees=True)
+                camera_reference_quaternion = r.as_quat()
+                camera_pose = np.concatenate((camera_reference_position, camera_reference_quaternion))
+                break
+    return target_pose_array, gripper_array, camera_pose, fov
+
+
+def save_target_states(save_paired_images_folder_path, target_name, episode, states, state_store=False):
+    """target_robot_states/{robot}/{episode}.npz, or the dataset's StateStore."""
+    if state_store:
+        StateStore.open(save_paired_images_folder_path).put(f"target/{target_name}", episode, **states)
+    else:
+        state_dir = os.path.join(save_paired_images_folder_path, "target_robot_states", f"{target_name}")
+        os.makedirs(state_dir, exist_ok=True)
+        np.savez(os.path.join(state_dir, f"{episode}.npz"), **states)
+
+
 class TargetEnvWrapper:
-    def __init__(self, target_name, target_gripper, robot_dataset, camera_height=256, camera_width=256):
-        self.target_env = RobotCameraWrapper(robotname=target_name, grippername=target_gripper, robot_dataset=robot_dataset, camera_height=camera_height, camera_width=camera_width)
+    def __init__(self, target_name, target_gripper, robot_dataset, camera_height=256, camera_width=256, ik_mode=False, pooled=False, output_hw=(84, 84)):
+        # pooled=True reuses this process's warm env (sim.env_pool) instead of
+        # a fresh suite.make; don't close_renderer() a pooled env
+        if pooled:
+            self.target_env = get_robot_env(target_name, target_gripper, camera_height, camera_width, robot_dataset=robot_dataset, ik_mode=ik_mode)
+        else:
+            self.target_env = RobotCameraWrapper(robotname=target_name, grippername=target_gripper, robot_dataset=robot_dataset, camera_height=camera_height, camera_width=camera_width, ik_mode=ik_mode)
+        self.pooled = pooled
         self.target_name = target_name
-        # self.camera_height = camera_height
-        # self.camera_width = camera_width
-        self.camera_height = 84
-        self.camera_width = 84
+        # frames / masks are rendered at output_hw (H, W) whatever the env
+        # camera was built with; 84×84 is what the training HDF5s use
+        self.camera_height, self.camera_width = output_hw
 
-    def generate_image(
+    def _load_episode(self, source_robot_states_path, robot_dataset, episode):
+        return load_replay_episode(source_robot_states_path, robot_dataset, episode)
+
+    def _match_gripper(self, target_gripper):
+        """Open/close the gripper until its width is within 0.1 of the target."""
+        _, gripper_dist = self.target_env.get_gripper_width_from_qpos()
+        attempt = 0
+        while (gripper_dist < target_gripper - 0.1 or gripper_dist > target_gripper + 0.1) and attempt < 10:
+            if gripper_dist < target_gripper - 0.1:
+                self.target_env.open_close_gripper(gripper_open=True)
+            elif gripper_dist > target_gripper + 0.1:
+                self.target_env.open_close_gripper(gripper_open=False)
+            _, gripper_dist = self.target_env.get_gripper_width_from_qpos()
+            attempt += 1
+
+    def dry_run_replay(
         self,
-        save_paired_images_folder_path="paired_images",
         source_robot_states_path="paired_images",
         robot_dataset=None,
         robot_disp=None,
         unlimited=False,
         episode=0,
-        dry_run=False,
     ):
-        print(robot_dataset, robot_disp, episode)
-        data = np.load(os.path.join(source_robot_states_path, "source_robot_states", f"{episode}.npz"), allow_pickle=True)
-        info = ROBOT_CAMERA_POSES_DICT[robot_dataset]
-        target_pose_array = data['pos'].copy()
-
-
-        gripper_array = data['grip']
-        if robot_dataset == "can":
-            camera_pose = np.array([0.9, 0.1, 1.75, 0.271, 0.271, 0.653, 0.653])
-        elif robot_dataset == "lift":
-            camera_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
-        elif robot_dataset == "square":
-            camera_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
-        elif robot_dataset == "stack":
-            camera_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
-        elif robot_dataset == "three_piece_assembly":
-            camera_pose = np.array([0.713078462147161, 2.062036796036723e-08, 1.5194726087166726, 0.293668270111084, 0.2936684489250183, 0.6432408690452576, 0.6432409286499023])
-        else:
-            for viewpoint in info["viewpoints"]:
-                if episode in viewpoint["episodes"]:
-                    camera_reference_position = viewpoint["camera_position"] + np.array([-0.6, 0.0, 0.912]) 
-                    roll_deg = viewpoint["roll"]
-                    pitch_deg = viewpoint["pitch"]
-                    yaw_deg = viewpoint["yaw"]
-                    fov = viewpoint["camera_fov"]
-                    r = R.from_euler('xyz', [roll_deg, pitch_deg, yaw_deg], degrees=True)
-                    camera_reference_quaternion = r.as_quat()
-                    camera_pose = np.concatenate((camera_reference_position, camera_reference_quaternion))
-                    break
+        """
+        Feasibility-only replay: no camera setup, no rendering, no output.
+        Returns (steps, errors, first_fail) where errors holds the tracking
+        error of every replayed frame and first_fail is -1 if all frames
+        were reached.  With unlimited=True the whole episode is replayed
+        even past failures.
+        """
+        target_pose_array, gripper_array, _, _ = self._load_episode(source_robot_states_path, robot_dataset, episode)
         if robot_disp is None:
-            #robot_disp = ROBOT_POSE_DICT[robot_dataset][self.target_name]
             robot_disp = np.zeros(3, dtype=np.float32)
 
+        errors = []
+        first_fail = -1
+        for pose_index in range(target_pose_array.shape[0]):
+            target_pose = target_pose_array[pose_index].copy()
+            target_pose[:3] -= robot_disp
+            self._match_gripper(gripper_array[pose_index])
+            target_reached, _, error = self.target_env.drive_robot_to_target_pose(target_pose=target_pose)
+            errors.append(error)
+            if not target_reached and first_fail < 0:
+                first_fail = pose_index
+                if not unlimited:
+                    break
+        errors = np.asarray(errors, dtype=np.float64)
+        steps = first_fail if (first_fail >= 0 and not unlimited) else len(errors)
+        return steps, errors, first_fail
+
+    def _setup_camera(self, camera_pose, fov, robot_disp):
+        camera_pose = np.array(camera_pose, dtype=np.float64)
         camera_pose[:3] -= robot_disp
-        
         self.target_env.camera_wrapper.set_camera_pose(pos=camera_pose[:3], quat=camera_pose[3:])
-        if "fov" in data:
-            fov = data["fov"]
+        if fov is not None:
             self.target_env.camera_wrapper.set_camera_fov(fov)
         self.target_env.update_camera()
 
-        # os.makedirs(os.path.join(save_paired_images_folder_path, "{}_rgb".format(self.target_name), str(episode)), exist_ok=True)
-        # os.makedirs(os.path.join(save_paired_images_folder_path, "{}_mask".format(self.target_name), str(episode)), exist_ok=True)
-        num_robot_poses = target_pose_array.shape[0]
-        target_pose_list = []
-        joint_angles_list = []
-        gripper_width_list = []
-        success = True
+    def render_frames(
+        self,
+        source_robot_states_path="paired_images",
+        robot_dataset=None,
+        robot_disp=None,
+        episode=0,
+        stop=None,
+        unlimited=True,
+    ):
+        """
+        In-memory replay of frames [0, stop) (whole episode if None);
+        nothing is written.  unlimited=False stops at the first unreached
+        pose like generate_image.  Returns dict rgb (n, H, W, 3) uint8,
+        mask (n, H, W) bool, the target_pose / joint_angles / gripper_width
+        / offsets states and success (all requested frames reached).
+        """
+        target_pose_array, gripper_array, camera_pose, fov = self._load_episode(source_robot_states_path, robot_dataset, episode)
+        if robot_disp is None:
+            robot_disp = np.zeros(3, dtype=np.float32)
+        self._setup_camera(camera_pose, fov, robot_disp)
 
-        mask_dir = Path(save_paired_images_folder_path) / f"{self.target_name}_replay_mask"
-        video_dir = Path(save_paired_images_folder_path) / f"{self.target_name}_replay_video"
-        mask_dir.mkdir(parents=True, exist_ok=True)
-        video_dir.mkdir(parents=True, exist_ok=True)
-        mask_path  = mask_dir / f"{episode}.mp4"
-        video_path = video_dir / f"{episode}.mp4"
-        mask_frames = []
-        video_frames = []
-        mask_path = video_path = None
-        if not dry_run:
-            mask_dir = Path(save_paired_images_folder_path) / f"{self.target_name}_replay_mask"
-            video_dir = Path(save_paired_images_folder_path) / f"{self.target_name}_replay_video"
-            mask_dir.mkdir(parents=True, exist_ok=True)
-            video_dir.mkdir(parents=True, exist_ok=True)
-            mask_path  = mask_dir / f"{episode}.mp4"
-            video_path = video_dir / f"{episode}.mp4"
-        suggestion = np.zeros(3)
-        for pose_index in range(num_robot_poses):
+        target_pose_list, joint_angles_list, gripper_width_list = [], [], []
+        rgb, masks = [], []                 # lists stand in for the writers
+        target_pose_array = target_pose_array[:stop]
+        self._replay_frames(
+            target_pose_array, gripper_array[:stop], robot_disp, unlimited,
+            target_pose_list, joint_angles_list, gripper_width_list,
+            masks, rgb,
+        )
+        if not rgb:
+            return dict(success=False)
+        return dict(
+            rgb=np.stack(rgb),
+            mask=np.stack(masks) > 0,
+            target_pose=np.vstack(target_pose_list),
+            joint_angles=np.vstack(joint_angles_list),
+            gripper_width=np.asarray(gripper_width_list),
+            offsets=np.asarray(robot_disp),
+            success=len(rgb) == len(target_pose_array),
+        )
+
+    def _replay_frames(self, target_pose_array, gripper_array, robot_disp, unlimited,
+                       target_pose_list, joint_angles_list, gripper_width_list,
+                       mask_writer, video_writer):
+        """Drive, record and render frame by frame; stops at the first miss unless unlimited."""
+        self._last_suggestion = np.zeros(3)
+        for pose_index in range(target_pose_array.shape[0]):
             target_pose=target_pose_array[pose_index].copy()
             target_pose[:3] -= robot_disp
             #target_pose = reach_further(target_pose, distance=ROBOT_CAMERA_POSES_DICT[robot_dataset]["extend_gripper"])
-            _, gripper_dist = self.target_env.get_gripper_width_from_qpos()
-            attempt = 0
-            while (gripper_dist < gripper_array[pose_index] - 0.1 or gripper_dist > gripper_array[pose_index] + 0.1) and attempt < 10:
-                if gripper_dist < gripper_array[pose_index] - 0.1:
-                    self.target_env.open_close_gripper(gripper_open=True)
-                elif gripper_dist > gripper_array[pose_index] + 0.1:
-                    self.target_env.open_close_gripper(gripper_open=False)
-                _, gripper_dist = self.target_env.get_gripper_width_from_qpos()
-                attempt += 1
-
-                
+            self._match_gripper(gripper_array[pose_index])
+
             target_reached, target_reached_pose, error = (
                 self.target_env.drive_robot_to_target_pose(target_pose=target_pose)
             )
 
             if unlimited == False and not target_reached:
-                success = False
-                suggestion = target_pose[:3] - target_reached_pose[:3]
+                self._last_suggestion = target_pose[:3] - target_reached_pose[:3]
                 break
             reached_pose = self.target_env.compute_eef_pose()
             reached_pose[:3] += robot_disp
@@ -141,65 +229,100 @@ class TargetEnvWrapper:
                 width=self.camera_width,
                 height=self.camera_height,
             )
-            if not dry_run:
-                mask_frames.append(target_robot_seg_img)
-                video_frames.append(target_robot_img)
-        if success:        
-            if not dry_run:
-                mask_frames_np = np.stack(mask_frames, axis=0).astype(np.uint8) * 255
-                video_frames_np = np.stack(video_frames, axis=0)
-                iio.imwrite(
-                    mask_path,
-                    mask_frames_np,          # shape (T, 84, 84) or (T, 84, 84, 3)
-                    fps=30,
-                    codec="libx264",
-                    macro_block_size=1,      # ← disable 16-pixel padding
-                    pixelformat="gray"       # or "yuv420p" if your mask is 3-channel
-                )
-
-                iio.imwrite(
-                    video_path,
-                    video_frames_np,         # shape (T, 84, 84, 3)
-                    fps=30,
-                    codec="libx264",
-                    macro_block_size=1,      # ← same here
-                    pixelformat="yuv420p"    # keeps the file widely playable
-                )
+            if isinstance(mask_writer, MaskWriter):
+                mask_writer.append(target_robot_seg_img)
+            else:
+                mask_writer.append(target_robot_seg_img * np.uint8(255))
+            video_writer.append(target_robot_img)
+
+    def generate_image(
+        self,
+        save_paired_images_folder_path="paired_images",
+        source_robot_states_path="paired_images",
+        robot_dataset=None,
+        robot_disp=None,
+        unlimited=False,
+        episode=0,
+        dry_run=False,
+        mask_format="packbits",
+        state_store=False,
+    ):
+        """
+        mask_format : "packbits" writes {robot}_replay_mask/{episode}.mask
+                      (lossless, see core.masks); "mp4" the legacy gray video.
+        state_store : write target states into the dataset's StateStore
+                      instead of target_robot_states/{robot}/{episode}.npz.
+        """
+        print(robot_dataset, robot_disp, episode)
+        if dry_run:
+            # nothing is rendered or written; see dry_run_replay
+            steps, errors, first_fail = self.dry_run_replay(
+                source_robot_states_path=source_robot_states_path,
+                robot_dataset=robot_dataset,
+                robot_disp=robot_disp,
+                unlimited=unlimited,
+                episode=episode,
+            )
+            return unlimited or first_fail < 0, np.zeros(3), steps
+
+        target_pose_array, gripper_array, camera_pose, fov = self._load_episode(source_robot_states_path, robot_dataset, episode)
+        if robot_disp is None:
+            #robot_disp = ROBOT_POSE_DICT[robot_dataset][self.target_name]
+            robot_disp = np.zeros(3, dtype=np.float32)
+
+        self._setup_camera(camera_pose, fov, robot_disp)
+
+        num_robot_poses = target_pose_array.shape[0]
+        target_pose_list = []
+        joint_angles_list = []
+        gripper_width_list = []
+        success = True
+
+        # frames are encoded while the replay runs; the files only appear
+        # (atomically) once the whole episode succeeded
+        mask_path, video_path = replay_output_paths(save_paired_images_folder_path, self.target_name, episode, mask_format)
+        if mask_format == "packbits":
+            mask_writer = MaskWriter(mask_path, self.camera_height, self.camera_width)
+        elif mask_format == "mp4":
+            mask_writer = StreamingVideoWriter(mask_path, pixelformat="gray")
+        else:
+            raise ValueError(f"Unknown mask_format {mask_format!r}")
+        video_writer = StreamingVideoWriter(video_path, pixelformat="yuv420p")
+        suggestion = np.zeros(3)
+        try:
+            self._replay_frames(
+                target_pose_array, gripper_array, robot_disp, unlimited,
+                target_pose_list, joint_angles_list, gripper_width_list,
+                mask_writer, video_writer,
+            )
+        except BaseException:
+            mask_writer.abort()
+            video_writer.abort()
+            raise
+
+        if len(target_pose_list) < num_robot_poses and not unlimited:
+            success = False
+            suggestion = self._last_suggestion
+        if success:
+            mask_writer.close()
+            video_writer.close()
             if unlimited == False:
                 print(f"\033[92m[SUCCESS] Generated {self.target_name} – episode {episode}\033[0m")
             else:
                 print(f"\033[92m[UNLIMITED] Generated {self.target_name} – episode {episode}\033[0m")
 
-            if not dry_run:
-                os.makedirs(
-                    os.path.join(
-                        save_paired_images_folder_path,
-                        "target_robot_states",
-                        f"{self.target_name}",
-                    ),
-                    exist_ok=True,
-                )
-                target_pose_array = np.vstack(target_pose_list)
-                joint_angles_array = np.vstack(joint_angles_list)
-                gripper_width_array = np.asarray(gripper_width_list)
-                offset_array = robot_disp
-                state_npz_path = os.path.join(
-                    save_paired_images_folder_path,
-                    "target_robot_states",
-                    f"{self.target_name}",
-                    f"{episode}.npz",
-                )
-                np.savez(
-                    state_npz_path,
-                    target_pose=target_pose_array,
-                    joint_angles=joint_angles_array,
-                    gripper_width=gripper_width_array,
-                    offsets=offset_array,
-                )
+            states = dict(
+                target_pose=np.vstack(target_pose_list),
+                joint_angles=np.vstack(joint_angles_list),
+                gripper_width=np.asarray(gripper_width_list),
+                offsets=robot_disp,
+            )
+            save_target_states(save_paired_images_folder_path, self.target_name, episode, states, state_store)
             steps = len(target_pose_list)
             return success, suggestion, steps
         else:
+            mask_writer.abort()
+            video_writer.abort()
             print(f"\033[91m[FAILURE] Could not reach target pose for {self.target_name} – episode {episode}\033[0m")
             steps = len(target_pose_list)
             return False, suggestion, steps
-
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Export augmented episodes of one dataset straight into the LeRobot
+(codebase v2.1) chunked parquet + mp4 layout, one LeRobot dataset per
+target robot, without going through image_84.hdf5 first:
+
+    {out}/{dataset}_{robot}/
+        meta/info.json  meta/episodes.jsonl  meta/episodes_stats.jsonl  meta/tasks.jsonl
+        data/chunk-000/episode_000000.parquet
+        videos/chunk-000/observation.images.agentview/episode_000000.mp4
+
+Per frame the parquet holds the replayed target pose, joint angles and
+gripper width (from robot_states.store or target_robot_states/{robot}/{ep}.npz)
+plus the LeRobot bookkeeping columns.  The overlay mp4 ({robot}_overlay/{ep}.mp4)
+is already H.264, so it is copied, not re-encoded – unless it has more
+frames than the states; then only its first T frames are re-encoded, so
+video and parquet agree.  Episodes are written in parallel (--workers);
+parquet row groups are --row-group-rows frames so a training window
+touches one or two row groups instead of the whole file.
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/export_lerobot.py --robot_dataset toto --out /data/lerobot
+python /home/guanhuaji/mirage/robot2robot/rendering/export_lerobot.py --robot_dataset toto --robots UR5e Jaco --workers 16 --task "stack the blocks"
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.ingest import iter_video_batches
+from core.io import atomic_write_json
+from core.state_store import list_episodes, load_episode_states
+from core.video import StreamingVideoWriter
+
+ROBOTS = ["UR5e", "Jaco", "Sawyer", "Kinova3", "IIWA", "Panda"]
+CODEBASE_VERSION = "v2.1"
+CHUNKS_SIZE = 1000
+VIDEO_KEY = "observation.images.agentview"
+DATA_PATH = "data/chunk-{episode_chunk:03d}/episode_{episode_index:06d}.parquet"
+VIDEO_PATH = "videos/chunk-{episode_chunk:03d}/{video_key}/episode_{episode_index:06d}.mp4"
+
+# npz field -> LeRobot feature
+STATE_FEATURES = {
+    "target_pose": "observation.state.eef_pose",          # [x, y, z, qx, qy, qz, qw]
+    "joint_angles": "observation.state.joint_angles",
+    "gripper_width": "observation.state.gripper_width",   # [width, normalised]
+}
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+
+
+def _video_meta(path: Path) -> dict:
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    meta = {
+        "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "fps": float(cap.get(cv2.CAP_PROP_FPS)),
+    }
+    cap.release()
+    return meta
+
+
+def _image_stats(path: Path, num_frames: int, samples: int) -> dict:
+    """Per-channel stats (LeRobot shape (3, 1, 1), in [0, 1]) from evenly spaced frames."""
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    for idx in np.linspace(0, max(num_frames - 1, 0), num=min(samples, num_frames)).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ok, frame = cap.read()
+        if ok:
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    if not frames:
+        return {}
+    px = np.stack(frames).reshape(-1, 3).astype(np.float64) / 255.0
+    shape = lambda v: np.asarray(v).reshape(3, 1, 1).tolist()
+    return {"min": shape(px.min(0)), "max": shape(px.max(0)), "mean": shape(px.mean(0)),
+            "std": shape(px.std(0)), "count": [len(frames)]}
+
+
+def _trim_video(src: Path, dst: Path, num_frames: int, fps: float) -> None:
+    """Re-encode the first *num_frames* frames of *src* (only when the video outruns the states)."""
+    out = StreamingVideoWriter(dst, fps=fps)
+    try:
+        for start, frames in iter_video_batches(src):
+            for frame in frames[:num_frames - start]:
+                out.append(frame)
+            if start + len(frames) >= num_frames:
+                break
+    except BaseException:
+        out.abort()
+        raise
+    if out.num_frames != num_frames:
+        out.abort()
+        raise ValueError(f"{src}: decoded {out.num_frames} frames, expected {num_frames}")
+    out.close()
+
+
+def _array_stats(x: np.ndarray) -> dict:
+    x = x.reshape(len(x), -1).astype(np.float64)
+    return {"min": x.min(0).tolist(), "max": x.max(0).tolist(), "mean": x.mean(0).tolist(),
+            "std": x.std(0).tolist(), "count": [len(x)]}
+
+
+def _feature_column(x: np.ndarray) -> pa.Array:
+    """(T, D) float32 -> fixed-size list column (LeRobot "sequence" feature)."""
+    x = np.ascontiguousarray(x, dtype=np.float32).reshape(len(x), -1)
+    return pa.FixedSizeListArray.from_arrays(pa.array(x.ravel()), x.shape[1])
+
+
+def export_episode(
+    paired_root: Path,
+    out_root: Path,
+    robot: str,
+    source_episode: int,
+    episode_index: int,
+    global_index: int,
+    length: int,
+    fps: float,
+    row_group_rows: int,
+    stats_frames: int,
+) -> dict:
+    """Write one episode's parquet + video (*length* frames); returns its meta record."""
+    video_src = paired_root / f"{robot}_overlay" / f"{source_episode}.mp4"
+    states = load_episode_states(paired_root, f"target/{robot}", source_episode)
+    video = _video_meta(video_src)
+    T = length
+
+    frame_index = np.arange(T, dtype=np.int64)
+    columns = {}
+    stats = {}
+    for field, feature in STATE_FEATURES.items():
+        if field in states:
+            x = np.asarray(states[field])[:T]
+            columns[feature] = _feature_column(x)
+            stats[feature] = _array_stats(x)
+    bookkeeping = {
+        "timestamp": (frame_index / fps).astype(np.float32),
+        "frame_index": frame_index,
+        "episode_index": np.full(T, episode_index, dtype=np.int64),
+        "index": global_index + frame_index,
+        "task_index": np.zeros(T, dtype=np.int64),
+    }
+    for name, x in bookkeeping.items():
+        columns[name] = pa.array(x)
+        stats[name] = _array_stats(x)
+    stats[VIDEO_KEY] = _image_stats(video_src, T, stats_frames)
+
+    chunk = episode_index // CHUNKS_SIZE
+    data_path = out_root / DATA_PATH.format(episode_chunk=chunk, episode_index=episode_index)
+    video_path = out_root / VIDEO_PATH.format(episode_chunk=chunk, video_key=VIDEO_KEY,
+                                              episode_index=episode_index)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    video_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = data_path.with_name(f".{data_path.name}.{os.getpid()}.tmp")
+    pq.write_table(pa.table(columns), tmp, row_group_size=row_group_rows)
+    os.replace(tmp, data_path)
+    if video["frames"] > T:
+        _trim_video(video_src, video_path, T, fps)
+    else:
+        tmp = video_path.with_name(f".{video_path.name}.{os.getpid()}.tmp")
+        shutil.copyfile(video_src, tmp)
+        os.replace(tmp, video_path)
+
+    shapes = {STATE_FEATURES[f]: list(np.asarray(states[f]).reshape(len(states[f]), -1).shape[1:])
+              for f in STATE_FEATURES if f in states}
+    return {
+        "episode_index": episode_index,
+        "source_episode": int(source_episode),
+        "length": T,
+        "stats": stats,
+        "shapes": shapes,
+        "video": video,
+    }
+
+
+def _episode_length(paired_root: Path, robot: str, episode: int) -> int:
+    """Frames exported for *episode*: min(states, video frames); 0 = skip."""
+    try:
+        T = len(load_episode_states(paired_root, f"target/{robot}", episode)["target_pose"])
+        frames = _video_meta(paired_root / f"{robot}_overlay" / f"{episode}.mp4")["frames"]
+    except (KeyError, ValueError, FileNotFoundError, IOError) as exc:
+        logging.warning("Skipping target/%s/%s: %s", robot, episode, exc)
+        return 0
+    if frames and frames != T:
+        logging.warning("target/%s/%s: %d states vs %d video frames – exporting %d",
+                        robot, episode, T, frames, min(T, frames))
+        T = min(T, frames)
+    return T
+
+
+def _info(robot: str, records: list[dict], fps: float, num_tasks: int) -> dict:
+    shapes = records[0]["shapes"] if records else {}
+    video = records[0]["video"] if records else {"height": 0, "width": 0}
+    features = {
+        VIDEO_KEY: {
+            "dtype": "video",
+            "shape": [video["height"], video["width"], 3],
+            "names": ["height", "width", "channels"],
+            "info": {"video.fps": fps, "video.height": video["height"], "video.width": video["width"],
+                     "video.channels": 3, "video.codec": "h264", "video.pix_fmt": "yuv420p",
+                     "video.is_depth_map": False, "has_audio": False},
+        },
+        **{name: {"dtype": "float32", "shape": shape, "names": None} for name, shape in shapes.items()},
+        "timestamp": {"dtype": "float32", "shape": [1], "names": None},
+        "frame_index": {"dtype": "int64", "shape": [1], "names": None},
+        "episode_index": {"dtype": "int64", "shape": [1], "names": None},
+        "index": {"dtype": "int64", "shape": [1], "names": None},
+        "task_index": {"dtype": "int64", "shape": [1], "names": None},
+    }
+    n = len(records)
+    return {
+        "codebase_version": CODEBASE_VERSION,
+        "robot_type": robot,
+        "total_episodes": n,
+        "total_frames": sum(r["length"] for r in records),
+        "total_tasks": num_tasks,
+        "total_videos": n,
+        "total_chunks": (n + CHUNKS_SIZE - 1) // CHUNKS_SIZE,
+        "chunks_size": CHUNKS_SIZE,
+        "fps": fps,
+        "splits": {"train": f"0:{n}"},
+        "data_path": DATA_PATH,
+        "video_path": VIDEO_PATH,
+        "features": features,
+    }
+
+
+def _write_jsonl(rows, path: Path) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as fp:
+        for row in rows:
+            fp.write(json.dumps(row) + "\n")
+    os.replace(tmp, path)
+
+
+def export_robot(
+    paired_root: Path,
+    out_root: Path,
+    robot: str,
+    task: str,
+    fps: float = 30.0,
+    workers: int = 8,
+    row_group_rows: int = 256,
+    stats_frames: int = 16,
+) -> int:
+    """Export every replayed episode of *robot*; returns the episode count."""
+    episodes = [ep for ep in list_episodes(paired_root, f"target/{robot}")
+                if (paired_root / f"{robot}_overlay" / f"{ep}.mp4").exists()]
+    if not episodes:
+        logging.warning("No episodes with both states and overlay video for %s", robot)
+        return 0
+
+    # the global frame index must be known up front, so lengths come first
+    # (state arrays and container headers only – nothing is decoded)
+    keep = []
+    for ep in episodes:
+        n = _episode_length(paired_root, robot, ep)
+        if n:
+            keep.append((ep, n))
+    offsets = np.concatenate(([0], np.cumsum([n for _, n in keep])[:-1])).astype(int)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = [pool.submit(export_episode, paired_root, out_root, robot, ep, i, int(offsets[i]),
+                            n, fps, row_group_rows, stats_frames)
+                for i, (ep, n) in enumerate(keep)]
+        records = [fut.result() for fut in futs]
+
+    meta = out_root / "meta"
+    meta.mkdir(parents=True, exist_ok=True)
+    _write_jsonl(({"episode_index": r["episode_index"], "tasks": [task], "length": r["length"],
+                   "source_episode": r["source_episode"]} for r in records), meta / "episodes.jsonl")
+    _write_jsonl(({"episode_index": r["episode_index"], "stats": r["stats"]} for r in records),
+                 meta / "episodes_stats.jsonl")
+    _write_jsonl([{"task_index": 0, "task": task}], meta / "tasks.jsonl")
+    atomic_write_json(_info(robot, records, fps, 1), meta / "info.json")
+    return len(records)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export augmented episodes to LeRobot format")
+    ap.add_argument("--robot_dataset", required=True)
+    ap.add_argument("--root", default=None, help="override ROBOT_CAMERA_POSES_DICT[...]['replay_path']")
+    ap.add_argument("--out", required=True, help="output root; one dataset per robot is created inside")
+    ap.add_argument("--robots", nargs="+", default=ROBOTS)
+    ap.add_argument("--task", default=None, help="task string (default: the dataset name)")
+    ap.add_argument("--fps", type=float, default=30.0, help="fps the overlay videos were written at")
+    ap.add_argument("--workers", type=int, default=8, help="episodes written in parallel")
+    ap.add_argument("--row-group-rows", type=int, default=256,
+                    help="frames per parquet row group (≈ a few training windows)")
+    ap.add_argument("--stats-frames", type=int, default=16, help="frames sampled per episode for image stats")
+    args = ap.parse_args()
+
+    paired_root = Path(args.root or ROBOT_CAMERA_POSES_DICT[args.robot_dataset]["replay_path"])
+    for robot in args.robots:
+        out_root = Path(args.out) / f"{args.robot_dataset}_{robot}"
+        n = export_robot(paired_root, out_root, robot, args.task or args.robot_dataset,
+                         fps=args.fps, workers=args.workers,
+                         row_group_rows=args.row_group_rows, stats_frames=args.stats_frames)
+        logging.info("✔ %s: %d episodes → %s", robot, n, out_root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Write augmented episodes of one dataset as sharded RLDS TFRecords, one
+TFDS dataset per target robot, loadable like the OXE inputs:
+
+    builder = tfds.builder_from_directory(f"{out}/{dataset}_{robot}/1.0.0")
+
+    {out}/{dataset}_{robot}/1.0.0/
+        {dataset}_{robot}-train.tfrecord-00000-of-00012
+        …
+        dataset_info.json  features.json
+
+Each episode holds `steps` with observation/{image, eef_pose, joint_angles,
+gripper_width}, `action` (next step's eef pose + normalised gripper width,
+the last step repeats itself), reward/discount and the is_first/is_last/
+is_terminal flags, plus episode_metadata/{file_path, source_episode}.
+Frames come from the {robot}_overlay mp4s, states from robot_states.store
+or target_robot_states/{robot}/{ep}.npz.
+
+Shards are written by --workers processes in parallel; each worker rolls
+over to a new shard after --shard-mb of serialized data (≈100–200 MB keeps
+`tf.data` interleave busy without too many open files), then the shards
+are renamed to the -of-N template and the metadata is generated from them.
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/export_rlds.py --robot_dataset toto --out /data/rlds
+python /home/guanhuaji/mirage/robot2robot/rendering/export_rlds.py --robot_dataset toto --robots UR5e --workers 16 --shard-mb 128
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.ingest import iter_video_batches
+from core.state_store import list_episodes, load_episode_states
+
+ROBOTS = ["UR5e", "Jaco", "Sawyer", "Kinova3", "IIWA", "Panda"]
+VERSION = "1.0.0"
+SPLIT = "train"
+FILENAME_TEMPLATE = "{DATASET}-{SPLIT}.{FILEFORMAT}-{SHARD_X_OF_Y}"
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+
+
+def rlds_features(height: int, width: int, num_joints: int):
+    """tfds FeaturesDict of one augmented RLDS episode."""
+    import tensorflow as tf
+    import tensorflow_datasets as tfds
+
+    return tfds.features.FeaturesDict({
+        "steps": tfds.features.Dataset({
+            "observation": tfds.features.FeaturesDict({
+                "image": tfds.features.Image(shape=(height, width, 3), dtype=tf.uint8,
+                                             encoding_format="jpeg"),
+                "eef_pose": tfds.features.Tensor(shape=(7,), dtype=tf.float32),
+                "joint_angles": tfds.features.Tensor(shape=(num_joints,), dtype=tf.float32),
+                "gripper_width": tfds.features.Tensor(shape=(2,), dtype=tf.float32),
+            }),
+            "action": tfds.features.Tensor(shape=(8,), dtype=tf.float32),
+            "reward": tfds.features.Scalar(dtype=tf.float32),
+            "discount": tfds.features.Scalar(dtype=tf.float32),
+            "is_first": tfds.features.Scalar(dtype=tf.bool),
+            "is_last": tfds.features.Scalar(dtype=tf.bool),
+            "is_terminal": tfds.features.Scalar(dtype=tf.bool),
+        }),
+        "episode_metadata": tfds.features.FeaturesDict({
+            "file_path": tfds.features.Text(),
+            "source_episode": tfds.features.Scalar(dtype=tf.int64),
+        }),
+    })
+
+
+def _episode_example(paired_root: Path, robot: str, episode: int) -> dict:
+    """One RLDS episode dict (numpy) ready for features.serialize_example."""
+    video_path = paired_root / f"{robot}_overlay" / f"{episode}.mp4"
+    states = load_episode_states(paired_root, f"target/{robot}", episode)
+    pose = np.asarray(states["target_pose"], dtype=np.float32)
+    joints = np.asarray(states["joint_angles"], dtype=np.float32)
+    grip = np.asarray(states["gripper_width"], dtype=np.float32).reshape(len(pose), -1)
+
+    frames = [f for _, batch in iter_video_batches(video_path) for f in batch]
+    T = min(len(pose), len(frames))
+    if T == 0:
+        raise ValueError(f"empty episode target/{robot}/{episode}")
+
+    nxt = np.minimum(np.arange(T) + 1, T - 1)
+    action = np.concatenate([pose[nxt], grip[nxt, -1:]], axis=1)
+    steps = [{
+        "observation": {
+            "image": frames[t],
+            "eef_pose": pose[t],
+            "joint_angles": joints[t],
+            "gripper_width": grip[t],
+        },
+        "action": action[t],
+        "reward": np.float32(t == T - 1),
+        "discount": np.float32(1.0),
+        "is_first": t == 0,
+        "is_last": t == T - 1,
+        "is_terminal": t == T - 1,
+    } for t in range(T)]
+    return {
+        "steps": steps,
+        "episode_metadata": {"file_path": str(video_path), "source_episode": int(episode)},
+    }
+
+
+def write_shards(
+    paired_root: Path,
+    robot: str,
+    episodes: list[int],
+    shape: tuple[int, int, int],
+    tmp_prefix: str,
+    shard_bytes: int,
+) -> list[tuple[str, int]]:
+    """
+    Worker: serialize *episodes* into `{tmp_prefix}-{j}` files of roughly
+    *shard_bytes* each; returns [(path, num_episodes)].
+    """
+    import tensorflow as tf
+
+    features = rlds_features(*shape)
+    shards = []
+    writer = None
+    path, size, count = None, 0, 0
+    for ep in episodes:
+        try:
+            record = features.serialize_example(_episode_example(paired_root, robot, ep))
+        except Exception as exc:
+            logging.warning("Skipping target/%s/%s: %s", robot, ep, exc)
+            continue
+        if writer is None:
+            path = f"{tmp_prefix}-{len(shards)}"
+            writer, size, count = tf.io.TFRecordWriter(path), 0, 0
+        writer.write(record)
+        size += len(record)
+        count += 1
+        if size >= shard_bytes:
+            writer.close()
+            shards.append((path, count))
+            writer = None
+    if writer is not None:
+        writer.close()
+        shards.append((path, count))
+    return shards
+
+
+def export_robot(
+    paired_root: Path,
+    out_root: Path,
+    dataset_name: str,
+    robot: str,
+    workers: int = 8,
+    shard_mb: int = 150,
+) -> int:
+    """Write all episodes of *robot*; returns the number of shards."""
+    import tensorflow_datasets as tfds
+
+    episodes = [ep for ep in list_episodes(paired_root, f"target/{robot}")
+                if (paired_root / f"{robot}_overlay" / f"{ep}.mp4").exists()]
+    if not episodes:
+        logging.warning("No episodes with both states and overlay video for %s", robot)
+        return 0
+
+    # feature shapes from the first episode (same camera + robot throughout)
+    probe = _episode_example(paired_root, robot, episodes[0])["steps"][0]["observation"]
+    shape = (*probe["image"].shape[:2], len(probe["joint_angles"]))
+
+    name = f"{dataset_name}_{robot}"
+    data_dir = out_root / name / VERSION
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for stale in data_dir.glob(f"{name}-{SPLIT}.tfrecord-*"):
+        stale.unlink()
+
+    # interleave episodes so every worker gets a similar mix of lengths
+    ctx = get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futs = [pool.submit(write_shards, paired_root, robot, episodes[k::workers], shape,
+                            str(data_dir / f".{name}.w{k}.tmp"), shard_mb << 20)
+                for k in range(workers) if episodes[k::workers]]
+        shards = [s for fut in futs for s in fut.result()]
+
+    total = len(shards)
+    for i, (path, _) in enumerate(shards):
+        os.replace(path, data_dir / f"{name}-{SPLIT}.tfrecord-{i:05d}-of-{total:05d}")
+
+    tfds.folder_dataset.write_metadata(
+        data_dir=str(data_dir),
+        features=rlds_features(*shape),
+        filename_template=FILENAME_TEMPLATE,
+        description=f"{dataset_name} replayed on {robot} (robot2robot augmentation)",
+    )
+    logging.info("%s: %d episodes in %d shards", name, sum(n for _, n in shards), total)
+    return total
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export augmented episodes as sharded RLDS TFRecords")
+    ap.add_argument("--robot_dataset", required=True)
+    ap.add_argument("--root", default=None, help="override ROBOT_CAMERA_POSES_DICT[...]['replay_path']")
+    ap.add_argument("--out", required=True, help="output root; {dataset}_{robot}/1.0.0 is created inside")
+    ap.add_argument("--robots", nargs="+", default=ROBOTS)
+    ap.add_argument("--workers", type=int, default=8, help="parallel shard writer processes")
+    ap.add_argument("--shard-mb", type=int, default=150, help="target serialized size per shard")
+    args = ap.parse_args()
+
+    paired_root = Path(args.root or ROBOT_CAMERA_POSES_DICT[args.robot_dataset]["replay_path"])
+    for robot in args.robots:
+        export_robot(paired_root, Path(args.out), args.robot_dataset, robot,
+                     workers=args.workers, shard_mb=args.shard_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,8 @@ from pathlib import Path
 from typing import Tuple
 from mujoco import mjtObj
 import pynvml
+from sim.kinematics import KinematicChain
+from core.io import loadtxt_cached
 
 import logging
 logger = logging.getLogger(__name__) 
@@ -428,8 +430,13 @@ class RobotCameraWrapper:
 
 
 class SourceEnvWrapper:
-    def __init__(self, source_name, source_gripper, robot_dataset, camera_height=256, camera_width=256, verbose=False):
-        self.source_env = RobotCameraWrapper(robotname=source_name, grippername=source_gripper, robot_dataset=robot_dataset, camera_height=camera_height, camera_width=camera_width)
+    def __init__(self, source_name, source_gripper, robot_dataset, camera_height=256, camera_width=256, verbose=False, use_sim=False):
+        self.source_env = None
+        self.chain = None
+        if use_sim:
+            self.source_env = RobotCameraWrapper(robotname=source_name, grippername=source_gripper, robot_dataset=robot_dataset, camera_height=camera_height, camera_width=camera_width)
+        else:
+            self.chain = KinematicChain.for_robot(source_name, source_gripper)
         self.source_name = source_name
         self.fixed_cam_positions = None
         self.fixed_cam_quaternions = None
@@ -447,7 +454,7 @@ class SourceEnvWrapper:
         gripper_states = None
         if "robot_joint_angles_path" in info:
             joint_angles_path = info["robot_joint_angles_path"]
-            joint_angles = np.loadtxt(joint_angles_path)
+            joint_angles = loadtxt_cached(joint_angles_path)
             if dataset_name == "toto":
                 joint_angles[:, 5] += 3.14159 / 2
                 joint_angles[:, 6] += 3.14159 / 4
@@ -455,9 +462,9 @@ class SourceEnvWrapper:
                 joint_angles[:, 5] += 3.14159 / 2
         if "robot_ee_states_path" in info:
             ee_states_path = info["robot_ee_states_path"]
-            ee_states = np.loadtxt(ee_states_path)
+            ee_states = loadtxt_cached(ee_states_path)
         gripper_states_path = info["gripper_states_path"]
-        gripper_states = np.loadtxt(gripper_states_path)
+        gripper_states = loadtxt_cached(gripper_states_path)
         return joint_angles, ee_states, gripper_states
 
     
@@ -465,10 +472,10 @@ class SourceEnvWrapper:
     def get_source_robot_states(self, save_source_robot_states_path="paired_images", reference_joint_angles_path=None, reference_ee_states_path=None, reference_gripper_states_path=None, robot_dataset=None, episode=0):
         info = self._load_dataset_info(robot_dataset)
         if robot_dataset == "ucsd_kitchen_rlds" or robot_dataset == "utokyo_pick_and_place":
-            joint_angles, gripper_states, translation = load_states_from_harsha(robot_dataset, episode, self.source_env.robot_name)
+            joint_angles, gripper_states, translation = load_states_from_harsha(robot_dataset, episode, self.source_name)
         else:
-            joint_angles = np.loadtxt(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "joint_states.txt"))
-            gripper_states = np.loadtxt(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "gripper_states.txt"))
+            joint_angles = loadtxt_cached(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "joint_states.txt"))
+            gripper_states = loadtxt_cached(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "gripper_states.txt"))
         if robot_dataset == "toto":
             joint_angles[:, 5] += 3.14159 / 2
             joint_angles[:, 6] += 3.14159 / 4
@@ -492,24 +499,14 @@ class SourceEnvWrapper:
                 print("WARNING: all joint_angles rows are zeros; nothing replaced.")
         if robot_dataset == "can":
             camera_reference_pose = np.array([0.9, 0.1, 1.75, 0.271, 0.271, 0.653, 0.653])
-            cam_id = self.source_env.camera_wrapper.env.sim.model.camera_name2id("agentview")
-            fov = self.source_env.camera_wrapper.env.sim.model.cam_fovy[cam_id]
         elif robot_dataset == "lift":
             camera_reference_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
-            cam_id = self.source_env.camera_wrapper.env.sim.model.camera_name2id("agentview")
-            fov = self.source_env.camera_wrapper.env.sim.model.cam_fovy[cam_id]
         elif robot_dataset == "square":
             camera_reference_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
-            cam_id = self.source_env.camera_wrapper.env.sim.model.camera_name2id("agentview")
-            fov = self.source_env.camera_wrapper.env.sim.model.cam_fovy[cam_id]
         elif robot_dataset == "stack":
             camera_reference_pose = np.array([0.45, 0, 1.35, 0.271, 0.271, 0.653, 0.653])
-            cam_id = self.source_env.camera_wrapper.env.sim.model.camera_name2id("agentview")
-            fov = self.source_env.camera_wrapper.env.sim.model.cam_fovy[cam_id]
         elif robot_dataset == "three_piece_assembly":
             camera_reference_pose = np.array([0.713078462147161, 2.062036796036723e-08, 1.5194726087166726, 0.293668270111084, 0.2936684489250183, 0.6432408690452576, 0.6432409286499023])
-            cam_id = self.source_env.camera_wrapper.env.sim.model.camera_name2id("agentview")
-            fov = self.source_env.camera_wrapper.env.sim.model.cam_fovy[cam_id]
 
         else:
             for viewpoint in info["viewpoints"]:
@@ -523,31 +520,26 @@ class SourceEnvWrapper:
                     camera_reference_quaternion = r.as_quat()
                     camera_reference_pose = np.concatenate((camera_reference_position, camera_reference_quaternion))
                     break
-        target_pose_list = []
         gripper_list = []
         num_frames = joint_angles.shape[0]
 
-        for pose_index in tqdm(range(num_frames), desc=f'{self.source_name} Pose States Calculation'):    
-            source_reached = False
-            attempt_counter = 0
-            while source_reached == False:
-                attempt_counter += 1
-                if attempt_counter > 10:
-                    break
-                if robot_dataset == "kaist":
-                    gripper_open = False
-                elif robot_dataset in ["can", "lift", "square", "stack", "three_piece_assembly"]:
-                    gripper_open = (gripper_states[pose_index][0] - gripper_states[pose_index][1]) > 0.06
-                else:
-                    gripper_open = gripper_convert(gripper_states[pose_index], robot_dataset)
-                for i in range(5):
-                    joint_angle = joint_angles[pose_index]
-                    self.source_env.teleport_to_joint_positions(joint_angle)
-                    target_pose = self.source_env.compute_eef_pose()
-
+        for pose_index in range(num_frames):
+            if robot_dataset == "kaist":
+                gripper_open = False
+            elif robot_dataset in ["can", "lift", "square", "stack", "three_piece_assembly"]:
+                gripper_open = (gripper_states[pose_index][0] - gripper_states[pose_index][1]) > 0.06
+            else:
+                gripper_open = gripper_convert(gripper_states[pose_index], robot_dataset)
             gripper_list.append(gripper_open)
-            target_pose_list.append(target_pose)       
-        target_pose_array = np.vstack(target_pose_list)
+
+        if self.chain is not None:
+            target_pose_array = self.chain.forward(joint_angles[:, :self.chain.num_joints])
+        else:
+            target_pose_list = []
+            for pose_index in tqdm(range(num_frames), desc=f'{self.source_name} Pose States Calculation'):
+                self.source_env.teleport_to_joint_positions(joint_angles[pose_index])
+                target_pose_list.append(self.source_env.compute_eef_pose())
+            target_pose_array = np.vstack(target_pose_list)
         if robot_dataset == "ucsd_kitchen_rlds":
             target_pose_array[:, :3] -= translation
         gripper_array = np.vstack(gripper_list)
@@ -579,6 +571,7 @@ class SourceEnvWrapper:
         
 from config.dataset_pair_location import harsha_dataset_path
 from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.lease import LeaseBoard
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -592,6 +585,10 @@ if __name__ == "__main__":
     parser.add_argument("--reference_gripper_states_path", type=str, help="(optional) to match the gripper's open/close status")
     parser.add_argument("--verbose", action='store_true', help="If set, prints extra debug/warning information")
     parser.add_argument("--partition", type=int, default=0, help="(optional) camera height")
+    parser.add_argument("--use_sim", action='store_true', help="compute EEF poses with a robosuite env instead of the NumPy FK chain")
+    parser.add_argument("--lease", action='store_true', help="ignore --partition; claim episode batches via lease files under source_robot_states/leases (core.lease), any number of machines can run this at once")
+    parser.add_argument("--lease_batch", type=int, default=32, help="episodes per lease")
+    parser.add_argument("--lease_ttl", type=float, default=600.0, help="seconds without heartbeat before a lease is re-claimed")
     args = parser.parse_args()
 
     if args.source_gripper is not None:
@@ -627,8 +624,9 @@ if __name__ == "__main__":
     '''
 
 
-    for episode in episodes:
-        source_env = SourceEnvWrapper(source_name, source_gripper, args.robot_dataset, camera_height, camera_width, verbose=args.verbose)
+    # one wrapper for the whole partition: FK mode never builds a robosuite env
+    source_env = SourceEnvWrapper(source_name, source_gripper, args.robot_dataset, camera_height, camera_width, verbose=args.verbose, use_sim=args.use_sim)
+    def export(episode):
         source_env.get_source_robot_states(
             save_source_robot_states_path=save_source_robot_states_path, 
             reference_joint_angles_path=args.reference_joint_angles_path, 
@@ -638,4 +636,15 @@ if __name__ == "__main__":
             episode=episode
         )
 
-        source_env.source_env.env.close_renderer()
\ No newline at end of file
+    if args.lease:
+        board = LeaseBoard(save_source_robot_states_path / "leases", num_episode, args.lease_batch, args.lease_ttl)
+        for lease in board.leases():
+            for episode in tqdm(lease.episodes, desc=f"{args.robot_dataset} lease {lease.index}"):
+                export(episode)
+            lease.finish()
+    else:
+        for episode in tqdm(episodes, desc=f"{args.robot_dataset} episodes"):
+            export(episode)
+
+    if source_env.source_env is not None:
+        source_env.source_env.env.close_renderer()
@@ -25,12 +25,19 @@ def process_one_episode(idx: int,
                         gripper: np.ndarray,
                         meta: dict,
                         out_dir: str,
-                        verbose: bool = False):
+                        verbose: bool = False,
+                        use_sim: bool = False,
+                        state_store: bool = False,
+                        use_cache: bool = True):
     wrapper = SourceEnvWrapper(
         source_name    = meta["robot"],
         source_gripper = meta["gripper"],
         robot_dataset  = meta["dataset_name"],
         verbose        = verbose,
+        use_sim        = use_sim,
+        pooled         = True,
+        state_store    = state_store,
+        use_cache      = use_cache,
     )
     wrapper.get_source_robot_states(
         save_source_robot_states_path = out_dir,
@@ -38,7 +45,7 @@ def process_one_episode(idx: int,
         joint_angles                  = joints,
         gripper_states                = gripper,
     )
-    wrapper.source_env.env.close_renderer()
+    wrapper.close()
     if verbose:
         print(f"✓ episode {idx} done")
 
@@ -78,7 +85,10 @@ def dispatch_episodes(robot_dataset: str,
                       workers: int = 20,
                       seed: int = 0,
                       chunksize: int = 100,
-                      verbose: bool = False):
+                      verbose: bool = False,
+                      use_sim: bool = False,
+                      state_store: bool = False,
+                      use_cache: bool = True):
 
     random.seed(seed); np.random.seed(seed)
 
@@ -143,7 +153,7 @@ def dispatch_episodes(robot_dataset: str,
             if verbose:
                 print(f"🎞  saved {mp4_path}")
             fut = pool.submit(process_one_episode,
-                               idx, joints, grip, meta, str(src_states_dir), verbose)
+                               idx, joints, grip, meta, str(src_states_dir), verbose, use_sim, state_store, use_cache)
             pending.append(fut)
             if len(pending) >= chunksize:
                 done, pending_set = wait(pending, return_when=FIRST_COMPLETED)
@@ -161,13 +171,22 @@ if __name__ == "__main__":
     ap.add_argument("--seed",      type=int, default=0)
     ap.add_argument("--chunksize", type=int, default=100)
     ap.add_argument("--verbose",   action="store_true")
+    ap.add_argument("--use_sim",   action="store_true",
+                    help="compute EEF poses with a robosuite env instead of the NumPy FK chain")
+    ap.add_argument("--state_store", action="store_true",
+                    help="write states into <replay_path>/robot_states.store instead of per-episode npz")
+    ap.add_argument("--no_cache", action="store_true",
+                    help="recompute EEF poses even for trajectories already in the result cache")
     args = ap.parse_args()
 
     dispatch_episodes(args.robot_dataset,
                       workers=args.workers,
                       seed=args.seed,
                       chunksize=args.chunksize,
-                      verbose=args.verbose)
+                      verbose=args.verbose,
+                      use_sim=args.use_sim,
+                      state_store=args.state_store,
+                      use_cache=not args.no_cache)
 
 '''
 python /home/guanhuaji/mirage/robot2robot/rendering/export_source_robot_states_new.py --robot_dataset=ucsd_kitchen_rlds --workers=20 --chunksize=40
@@ -41,7 +41,7 @@ def process_one_episode(
         joint_angles=joints,
         gripper_states=gripper,
     )
-    wrapper.source_env.env.close_renderer()
+    wrapper.close()
     if verbose:
         print(f"✓ episode {idx} done")
 
@@ -16,6 +16,7 @@ macros.IMAGE_CONVENTION = "opencv"
 from scipy.spatial.transform import Rotation as R
 from PIL import Image
 from transforms3d.quaternions import quat2mat
+from core.io import loadtxt_cached
 
 
 np.set_printoptions(suppress=True, precision=6)
@@ -505,7 +506,7 @@ class SourceEnvWrapper:
         gripper_states = None
         if "robot_joint_angles_path" in info:
             joint_angles_path = info["robot_joint_angles_path"]
-            joint_angles = np.loadtxt(joint_angles_path)
+            joint_angles = loadtxt_cached(joint_angles_path)
             if dataset_name == "toto":
                 joint_angles[:, 5] += 3.14159 / 2
                 joint_angles[:, 6] += 3.14159 / 4
@@ -518,9 +519,9 @@ class SourceEnvWrapper:
                 joint_angles[:, 5] -= np.pi
         if "robot_ee_states_path" in info:
             ee_states_path = info["robot_ee_states_path"]
-            ee_states = np.loadtxt(ee_states_path)
+            ee_states = loadtxt_cached(ee_states_path)
         gripper_states_path = info["gripper_states_path"]
-        gripper_states = np.loadtxt(gripper_states_path)
+        gripper_states = loadtxt_cached(gripper_states_path)
         return joint_angles, ee_states, gripper_states
     
     def _parse_user_command(self, x, y, z, roll, pitch, yaw, fov, robot_dataset):
@@ -643,8 +644,8 @@ class SourceEnvWrapper:
         x, y, z, roll, pitch, yaw, fov = self.current_camera_pose
         info = self._load_dataset_info(robot_dataset)
 
-        joint_angles = np.loadtxt(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "joint_states.txt"))
-        gripper_states = np.loadtxt(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "gripper_states.txt"))
+        joint_angles = loadtxt_cached(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "joint_states.txt"))
+        gripper_states = loadtxt_cached(os.path.join("/home/guanhuaji/mirage/robot2robot/rendering/datasets/states", robot_dataset, f"episode_{episode}", "gripper_states.txt"))
         joint_angles[:, 1] -= np.pi / 2
         joint_angles[:, 2] *= -1
         joint_angles[:, 3] -= np.pi / 2
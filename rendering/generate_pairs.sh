@@ -4,6 +4,11 @@ conda activate mirage
 
 robot_dataset="austin_mutex"  # 机器人数据集名称
 
+# 多机运行不需要手动分区：每台机器执行同一条命令，按 lease 文件自动领取 episode 批次
+# （core/lease.py，节点崩溃后其 lease 过期会被其他节点重新领取）：
+#   python /home/guanhuaji/mirage/robot2robot/rendering/generate_target_robot_images_new.py \
+#          --robot_dataset "${robot_dataset}" --target_robot Kinova3 --lease
+
 start=19    # 起始分区号
 end=20     # 结束分区号（含）
 
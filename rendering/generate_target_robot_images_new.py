@@ -4,15 +4,27 @@ import argparse
 import json
 import multiprocessing as mp
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import sqlite3
+import time
+import traceback
 from pathlib import Path
 
 import numpy as np
 
 from core import pick_best_gpu, locked_json
+from core.ledger import LEDGER_NAME, JobLedger, local_ledger_path, publish
+from core.lease import LeaseBoard
+from core.scheduler import Job, run_jobs
 from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
 from config.robot_pose_dict import ROBOT_POSE_DICT
 
+# inputs of --autosearch beyond the replay itself (result-cache key)
+SEARCH_CODE = ("sim/displacement_search.py", "sim/kinematics.py")
+
+# --reach_check tolerance: a replay is skipped only when more than this many
+# source frames miss the map, each checked against its 3×3×3 voxel neighbourhood
+REACH_MAX_MISSES = 5
+REACH_SLACK = 1
 
 # ───────────────────────────── helpers ──────────────────────────────
 def select_gripper(robot: str) -> str:
@@ -34,20 +46,70 @@ def log_offsets(
     episode: int,
     tried: list[np.ndarray],
     working: np.ndarray,
+    candidates: list[dict] | None = None,
 ) -> None:
-    """Append displacement search info for one episode to a JSON file."""
+    """
+    Append displacement search info for one episode to a JSON file.
+    *candidates* are the per-offset scores from the batched autosearch.
+    """
     log_path = out_root / "target_robot_states" / f"{robot}_displacement.json"
     log_path.parent.mkdir(parents=True, exist_ok=True)
     if not log_path.exists():
         log_path.write_text("[]", encoding="utf-8")
     with locked_json(log_path, default=list) as hist:
-        hist.append(
-            {
-                "episode": int(episode),
-                "tried_offsets": [o.tolist() for o in tried],
-                "working_offset": working.tolist(),
-            }
+        entry = {
+            "episode": int(episode),
+            "tried_offsets": [o.tolist() for o in tried],
+            "working_offset": working.tolist(),
+        }
+        if candidates is not None:
+            entry["candidates"] = candidates
+        hist.append(entry)
+
+
+def _stamp(paths) -> list[int]:
+    """(size, mtime_ns) of every output file; -1s for missing ones."""
+    out = []
+    for p in paths:
+        try:
+            st = Path(p).stat()
+            out += [st.st_size, st.st_mtime_ns]
+        except FileNotFoundError:
+            out += [-1, -1]
+    return out
+
+
+def _states_stamp(out_root, robot: str, episode: int, state_store: bool) -> list[int]:
+    """Put time (ns) of the target states in the StateStore, else the npz's _stamp."""
+    if state_store:
+        from core.state_store import StateStore
+
+        try:
+            written = StateStore.open(out_root).get_with_time(f"target/{robot}", episode)[1]
+        except KeyError:
+            return [-1]
+        return [int(written * 1e9)]
+    return _stamp([Path(out_root) / "target_robot_states" / robot / f"{episode}.npz"])
+
+
+def reach_feasible(out_root, robot: str, episode: int, displacement) -> bool:
+    """--reach_check: False (and a note) if the source trajectory leaves *robot*'s map."""
+    from core.state_store import load_episode_states
+    from sim.reachability import load_reachability_map
+
+    rmap = load_reachability_map(robot)
+    if rmap is None:
+        return True
+    source_poses = load_episode_states(out_root, "source", episode)["pos"]
+    feasible, first_bad = rmap.check_trajectory(
+        source_poses, displacement, max_misses=REACH_MAX_MISSES, slack=REACH_SLACK
+    )
+    if not feasible:
+        print(
+            f"[REACH] {robot} episode {episode}: more than {REACH_MAX_MISSES} frames "
+            f"(first: {first_bad}) are outside the reachability map – skipping replay."
         )
+    return feasible
 
 
 # ───────────────────────── single-episode worker ────────────────────
@@ -60,10 +122,55 @@ def generate_one_episode(
     unlimited: bool = False,
     load_displacement: bool = False,
     autosearch: bool = False,  # NEW
-) -> tuple[str, int, bool]:
+    ik: bool = False,
+    reach_check: bool = False,
+    mask_format: str = "packbits",
+    state_store: bool = False,
+    use_cache: bool = True,
+    ledger: bool | str = True,
+) -> tuple[str, int, bool, int]:
     """
     Render one episode for a target robot, optionally searching over
-    displacement. Returns (robot, episode, success).
+    displacement. Returns (robot, episode, success, frames rendered by
+    this call – 0 for cache hits and rejections); with *ledger* the
+    outcome (status, offset, steps, time, error) is recorded by this
+    worker in the node-local ledger (core.ledger; the driver publishes
+    it to <out_root>/jobs.sqlite), or in the ledger file *ledger* names.
+    A --reach_check rejection is recorded as "rejected", not "failed": it
+    is a pre-filter verdict, so it never lands in the blacklist and the
+    episode is tried again next run.
+    """
+    t0 = time.perf_counter()
+
+    def _record(status, disp=None, steps=None, error=None):
+        if ledger:
+            path = local_ledger_path() if ledger is True else ledger
+            with JobLedger(path) as jobs:
+                jobs.record(robot_dataset, robot, episode, status,
+                            offset=disp, steps=steps,
+                            seconds=time.perf_counter() - t0, error=error)
+
+    try:
+        status, disp, steps, rendered = _replay_episode(
+            robot_dataset, robot, episode, camera_hw, out_root, unlimited, load_displacement,
+            autosearch, ik, reach_check, mask_format, state_store, use_cache,
+        )
+    except Exception:
+        _record("failed", error=traceback.format_exc())
+        raise
+    _record(status, disp, steps)
+    return robot, episode, status == "done", rendered
+
+
+def _replay_episode(
+    robot_dataset, robot, episode, camera_hw, out_root, unlimited, load_displacement,
+    autosearch, ik, reach_check, mask_format, state_store, use_cache,
+) -> tuple[str, np.ndarray, int | None, int]:
+    """
+    generate_one_episode without the bookkeeping: (ledger status – "done",
+    "failed" or "rejected" by the reachability pre-filter, displacement
+    used, steps replayed – 0 if rejected before replay, None if unknown,
+    steps rendered by this call).
     """
     pick_best_gpu()
     os.environ["MUJOCO_GL"] = "egl"
@@ -97,71 +204,58 @@ def generate_one_episode(
         else:
             displacement = ROBOT_POSE_DICT[robot_dataset][robot]
 
-    # ───────────── helper for dry-run image gen ─────────────
-    def _try_disp(disp: np.ndarray):
-        """Return (ok, steps) for a candidate displacement."""
-        wrapper = TargetEnvWrapper(
-            robot,
-            gripper,
-            robot_dataset,
-            camera_height=H,
-            camera_width=W,
+    # ───────────── reachability pre-filter ─────────────
+    if reach_check and not unlimited and not autosearch:
+        if not reach_feasible(out_root, robot, episode, displacement):
+            return "rejected", np.asarray(displacement, dtype=np.float64), 0, 0
+
+    # ───────────── result cache ─────────────
+    # same inputs (incl. the search's starting point) + same replay/search
+    # code + outputs untouched since → skip, before any search is run
+    if use_cache:
+        from core.result_cache import ResultCache, code_fingerprint
+        from envs.target_env import REPLAY_CODE, load_replay_episode, replay_output_paths
+
+        cache = ResultCache("target_replay")
+        code = REPLAY_CODE + (SEARCH_CODE if autosearch else ())
+        cache_key = cache.key(
+            load_replay_episode(out_root, robot_dataset, episode),
+            robot, gripper, np.asarray(displacement, dtype=np.float64), autosearch,
+            (H, W), unlimited, ik, mask_format, state_store, code_fingerprint(*code),
         )
-        ok, _suggested, steps = wrapper.generate_image(
-            save_paired_images_folder_path=out_root,
-            source_robot_states_path=out_root,
-            robot_dataset=robot_dataset,
-            robot_disp=disp,
-            episode=episode,
-            unlimited=unlimited,
-            dry_run=True,
-        )
-        print(f"Displacement {disp} for episode {episode} robot {robot} → ok={ok}")
-        wrapper.target_env.env.close_renderer()
-        return ok, steps
+        outputs = replay_output_paths(out_root, robot, episode, mask_format)
+        output_stamp = lambda: _stamp(outputs) + _states_stamp(out_root, robot, episode, state_store)
+        hit = cache.get(cache_key)
+        if hit is not None and (not hit["success"] or output_stamp() == hit["stamp"].tolist()):
+            print(f"[CACHE] {robot} episode {episode}: unchanged, success={bool(hit['success'])}")
+            # the offsets were logged by the run that filled the cache
+            status = "done" if hit["success"] else "failed"
+            steps = int(hit["steps"]) if "steps" in hit else None
+            return status, np.asarray(hit["disp"], dtype=np.float64), steps, 0
 
     # ───────────── optional grid search ─────────────
     tried: list[np.ndarray] = []
-    best_disp = displacement.copy()
+    candidates: list[dict] | None = None
+    best_disp = np.asarray(displacement, dtype=np.float64).copy()
 
     if autosearch:
-        best_steps = -1
-        scales = [0.03, 0.1, 0.3]
-
-        for step in scales:
-            found_success = False
-            offsets = np.array(
-                [
-                    [dx, dy, dz]
-                    for dx in (0, -step, step)
-                    for dy in (0, -step, step)
-                    for dz in (0, -step, step)
-                ],
-                dtype=np.float32,
-            )
-
-            for offset in offsets:
-                cand = best_disp + offset
-                tried.append(cand.copy())
-                print(
-                    f"Testing displacement {cand} (step={step}) "
-                    f"for episode {episode} robot {robot}",
-                    flush=True,
-                )
-                ok, steps = _try_disp(cand)
-                if ok:
-                    best_disp = cand
-                    best_steps = steps
-                    found_success = True
-                    break
-                if steps > best_steps:
-                    best_steps = steps
-                    best_disp = cand
-
-            # refine or stop depending on success
-            displacement = best_disp.copy()
-            if found_success:
-                break
+        # every candidate of a scale is scored in one batched kinematic
+        # replay; only the winner gets a real (rendered) replay below
+        from sim.kinematics import KinematicChain
+        from sim.displacement_search import search_displacement
+
+        from core.state_store import load_episode_states
+
+        source_poses = load_episode_states(out_root, "source", episode)["pos"]
+        chain = KinematicChain.for_robot(robot, gripper)
+        best_disp, candidates = search_displacement(chain, source_poses, best_disp)
+        tried = [np.asarray(c["offset"]) for c in candidates]
+        n_ok = sum(c["ok"] for c in candidates)
+        print(
+            f"Autosearch for episode {episode} robot {robot}: "
+            f"{len(candidates)} candidates, {n_ok} feasible → {best_disp}",
+            flush=True,
+        )
     else:
         # No search: just record the single attempt
         tried.append(best_disp.copy())
@@ -173,8 +267,10 @@ def generate_one_episode(
         robot_dataset,
         camera_height=H,
         camera_width=W,
+        ik_mode=ik,
+        pooled=True,
     )
-    success, _suggested, _ = wrapper.generate_image(
+    success, _suggested, steps = wrapper.generate_image(
         save_paired_images_folder_path=out_root,
         source_robot_states_path=out_root,
         robot_dataset=robot_dataset,
@@ -182,24 +278,28 @@ def generate_one_episode(
         episode=episode,
         unlimited=unlimited,
         dry_run=False,
+        mask_format=mask_format,
+        state_store=state_store,
     )
-    wrapper.target_env.env.close_renderer()
+    if use_cache:
+        cache.put(cache_key, success=bool(success), steps=np.int64(steps), disp=best_disp,
+                  stamp=np.asarray(output_stamp() if success else [], dtype=np.int64))
 
-    log_offsets(Path(out_root), robot, episode, tried, best_disp)
+    log_offsets(Path(out_root), robot, episode, tried, best_disp, candidates)
 
-    return robot, episode, bool(success)
+    return "done" if success else "failed", best_disp, int(steps), int(steps)
 
 
 # ───────────────────────────── dispatcher ────────────────────────────
-def _ensure_json_file(path: Path) -> None:
-    if not path.exists():
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text("{}", encoding="utf-8")
-
-
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser()
-    p.add_argument("--robot_dataset", required=True)
+    p.add_argument(
+        "--robot_dataset",
+        nargs="+",
+        required=True,
+        help="One or more datasets; all (dataset, robot, episode) jobs share "
+        "one cost-ordered queue (core.scheduler).",
+    )
     p.add_argument("--target_robot", nargs="+", required=True)
     p.add_argument("--num_workers", type=int, default=8)
     p.add_argument("--unlimited", action="store_true")
@@ -207,92 +307,300 @@ def parse_args() -> argparse.Namespace:
     p.add_argument(
         "--autosearch",
         action="store_true",
-        help="Enable grid-search for best displacement. "
+        help="Enable grid-search for best displacement (batched kinematic "
+        "scoring, one final render). "
         "If omitted, the script renders with (0,0,0) displacement only.",
     )
-    return p.parse_args()
+    p.add_argument(
+        "--ik",
+        action="store_true",
+        help="Reach each frame with damped-least-squares IK instead of "
+        "stepping the OSC controller.",
+    )
+    p.add_argument(
+        "--reach_check",
+        action="store_true",
+        help="Reject episodes that leave the robot's precomputed reachability "
+        "map (build_reachability_maps.py) before building any env; they are "
+        "recorded as 'rejected', not blacklisted.",
+    )
+    p.add_argument(
+        "--mask_format",
+        choices=("packbits", "mp4"),
+        default="packbits",
+        help="Robot masks as lossless bit-packed .mask files (core.masks) or "
+        "the legacy gray mp4.",
+    )
+    p.add_argument(
+        "--state_store",
+        action="store_true",
+        help="Write target states into <replay_path>/robot_states.store "
+        "(core.state_store) instead of one npz per episode.",
+    )
+    p.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Ignore the content-addressed result cache and replay every episode.",
+    )
+    p.add_argument(
+        "--lease",
+        action="store_true",
+        help="Multi-node mode: claim episode batches through lease files under "
+        "<replay_path>/leases/<lease_run>/<robot> (core.lease) so any number of "
+        "machines can share one run; ends when every batch is terminal.",
+    )
+    p.add_argument(
+        "--lease_run",
+        default=None,
+        help="Run id shared by every node of one --lease run (required with "
+        "--lease); a new id starts a new board.",
+    )
+    p.add_argument("--lease_batch", type=int, default=16, help="Episodes per lease.")
+    p.add_argument(
+        "--lease_ttl",
+        type=float,
+        default=600.0,
+        help="Seconds without heartbeat after which a node's lease is re-claimed.",
+    )
+    args = p.parse_args()
+    if args.lease and not args.lease_run:
+        p.error("--lease needs --lease_run <id> (the same on every node of the run)")
+    return args
 
 
-def main() -> None:
-    args = parse_args()
+def _episode_frames(out_root: Path, episode: int) -> int:
+    """Source trajectory length, the scheduler's cost proxy (0 if missing)."""
+    from core.state_store import load_episode_states
+
+    try:
+        return len(load_episode_states(out_root, "source", episode)["pos"])
+    except (FileNotFoundError, KeyError):
+        return 0
+
 
-    meta = ROBOT_CAMERA_POSES_DICT[args.robot_dataset]
-    with open(Path(meta["replay_path"]) / "dataset_metadata.json", encoding="utf-8") as f:
+def _rendered_frames(result: tuple) -> int:
+    """Frames that calibrate the scheduler: successful real renders only."""
+    _, _, ok, rendered = result
+    return rendered if ok else 0
+
+
+def _task(args, dataset: str, robot: str, ep: int, hw: tuple[int, int], out_root: Path, ledger=True) -> tuple:
+    return (
+        dataset,
+        robot,
+        ep,
+        hw,
+        str(out_root),
+        args.unlimited,
+        args.load_displacement,
+        args.autosearch,  # NEW
+        args.ik,
+        args.reach_check,
+        args.mask_format,
+        args.state_store,
+        not args.no_cache,
+        ledger,
+    )
+
+
+def _dataset_info(dataset: str) -> tuple[Path, tuple[int, int], int]:
+    out_root = Path(ROBOT_CAMERA_POSES_DICT[dataset]["replay_path"])
+    with open(out_root / "dataset_metadata.json", encoding="utf-8") as f:
         dmeta = json.load(f)
-    H, W = dmeta["image_height"], dmeta["image_width"]
-    out_root = Path(meta["replay_path"])
-    num_eps = dmeta["num_episodes"]
-    episodes = range(num_eps)
+    return out_root, (dmeta["image_height"], dmeta["image_width"]), dmeta["num_episodes"]
 
-    mp_ctx = mp.get_context("spawn")
 
-    # Build task list
-    tasks = []
-    for robot in args.target_robot:
-        wl_path = out_root / robot / "whitelist.json"
-        bl_path = out_root / robot / "blacklist.json"
-        _ensure_json_file(wl_path)
-        _ensure_json_file(bl_path)
-
-        with locked_json(wl_path) as wl:
-            done_eps = set(wl.get(robot, []))
-
-        for ep in episodes:
-            if ep not in done_eps:
-                tasks.append(
-                    (
-                        args.robot_dataset,
-                        robot,
-                        ep,
-                        (H, W),
-                        str(out_root),
-                        args.unlimited,
-                        args.load_displacement,
-                        args.autosearch,  # NEW
-                    )
-                )
+def main() -> None:
+    args = parse_args()
+    if args.lease:
+        return run_leased(args)
+
+    mp_ctx = mp.get_context("spawn")
 
-    if not tasks:
+    # Build one job list over every dataset × robot; the scheduler orders it
+    jobs, done_eps = [], {}
+    for dataset in args.robot_dataset:
+        out_root, hw, num_eps = _dataset_info(dataset)
+        frames = {}
+
+        for robot in args.target_robot:
+            done_eps[dataset, robot] = _done_episodes(out_root, dataset, robot)
+
+        for robot in args.target_robot:
+            for ep in range(num_eps):
+                if ep in done_eps[dataset, robot]:
+                    continue
+                if ep not in frames:
+                    frames[ep] = _episode_frames(out_root, ep)
+                task = _task(args, dataset, robot, ep, hw, out_root)
+                jobs.append(Job((dataset, robot, ep), task, frames[ep], group=robot))
+
+    if not jobs:
         print("Nothing to do – all episodes already processed.")
         return
 
-    # Submit to process pool
-    with ProcessPoolExecutor(max_workers=args.num_workers, mp_context=mp_ctx) as pool:
-        futures = [pool.submit(generate_one_episode, *t) for t in tasks]
-
-        # We update whitelist/blacklist incrementally as tasks finish
-        for fut in as_completed(futures):
-            robot, ep, ok = fut.result()
-
-            wl_path = out_root / robot / "whitelist.json"
-            bl_path = out_root / robot / "blacklist.json"
-
-            if ok:
-                with locked_json(wl_path) as wl:
-                    eps = set(wl.setdefault(robot, []))
-                    eps.add(ep)
-                    wl[robot] = sorted(eps)
-
-                with locked_json(bl_path) as bl:
-                    eps = set(bl.setdefault(robot, []))
-                    if ep in eps:
-                        eps.remove(ep)
-                        bl[robot] = sorted(eps)
-            else:
-                with locked_json(bl_path) as bl:
-                    eps = set(bl.setdefault(robot, []))
-                    eps.add(ep)
-                    bl[robot] = sorted(eps)
-
-                with locked_json(wl_path) as wl:
-                    eps = set(wl.setdefault(robot, []))
-                    if ep in eps:
-                        eps.remove(ep)
-                        wl[robot] = sorted(eps)
-
+    # Longest estimated job first; each worker records its own row in the
+    # node-local ledger, published to <replay_path>/jobs.sqlite at the end
+    failed, t_start = 0, time.time()
+    try:
+        for job, (robot, ep, ok, _) in run_jobs(jobs, generate_one_episode, args.num_workers,
+                                                 mp_context=mp_ctx, measure=_rendered_frames):
+            failed += not ok
+    finally:
+        dispatched = {}
+        for job in jobs:
+            dispatched.setdefault(job.key[:2], []).append(job.key[2])
+        with JobLedger.local() as local:
+            for (dataset, robot), eps in dispatched.items():
+                out_root = Path(ROBOT_CAMERA_POSES_DICT[dataset]["replay_path"])
+                publish(out_root, dataset, robot, local.rows(dataset, robot, eps, t_start))
+    print(f"{len(jobs) - failed}/{len(jobs)} episodes rendered, {failed} failed.")
     print("✓ all dispatched episodes finished")
 
 
+def _done_episodes(out_root: Path, dataset: str, robot: str) -> set[int]:
+    """Episodes already done per <replay_path>/jobs.sqlite or the legacy whitelist."""
+    done = set()
+    path = out_root / LEDGER_NAME
+    if path.exists():
+        try:
+            with JobLedger(path, readonly=True) as ledger:
+                done.update(ledger.episodes(dataset, robot, "done"))
+        except sqlite3.Error as e:
+            print(f"[ledger] cannot read {path}: {e}; using whitelist.json only", flush=True)
+    try:
+        wl = json.loads((out_root / robot / "whitelist.json").read_text(encoding="utf-8"))
+        done.update(int(ep) for ep in wl.get(robot, []))
+    except (FileNotFoundError, ValueError):
+        pass
+    return done
+
+
+def _lease_rows(dataset: str, robot: str, result: dict | None) -> list[dict]:
+    """Ledger rows carried by one batch's .done result."""
+    if not result:
+        return []
+    if "rows" in result:
+        return result["rows"]
+    return [{"dataset": dataset, "robot": robot, "episode": ep, "status": status}
+            for status in ("done", "failed") for ep in result.get(status, [])]
+
+
+def _reconcile(dataset: str, robot: str, out_root: Path, board: LeaseBoard) -> bool:
+    """
+    Fold every batch's rows into <replay_path>/jobs.sqlite and re-export
+    the legacy JSON, once per board (claim_once); False if another node
+    holds or already did it.
+    """
+    lease = board.claim_once("reconcile")
+    if lease is None:
+        return False
+    with lease:
+        rows = [row for r in board.results().values() for row in _lease_rows(dataset, robot, r)]
+        publish(out_root, dataset, robot, rows)
+        lease.finish({"rows": len(rows)})
+    return True
+
+
+def _generate_or_fail(*task) -> tuple[str, int, bool, int]:
+    """
+    generate_one_episode for lease mode: an exception fails the episode
+    (already recorded in the ledger with its traceback) instead of the
+    node, so the batch can still finish.
+    """
+    try:
+        return generate_one_episode(*task)
+    except Exception:
+        traceback.print_exc()
+        return task[1], task[2], False, 0
+
+
+def run_leased(args, poll: float = 30.0) -> None:
+    """
+    --lease: every node runs this against the same replay_path and
+    --lease_run id (boards under <replay_path>/leases/<lease_run>).  Batches
+    of episodes are claimed per (dataset, robot) board as the local pool
+    drains, so machines can join or die at any time; episodes already done
+    in jobs.sqlite / whitelist.json are skipped.  Workers record into a
+    node-local ledger (core.ledger: WAL must not live on NFS) and
+    each batch's rows travel in its .done file; once a board is terminal
+    one node folds them into <replay_path>/jobs.sqlite and re-exports
+    whitelist/blacklist.json.  An episode that raises counts as failed,
+    so its batch still finishes.
+    """
+    mp_ctx = mp.get_context("spawn")
+    ledger = str(local_ledger_path())
+    boards = []                                       # (dataset, robot, hw, out_root, board)
+    done_eps = {}
+    for dataset in args.robot_dataset:
+        out_root, hw, num_eps = _dataset_info(dataset)
+        for robot in args.target_robot:
+            board = LeaseBoard(out_root / "leases" / args.lease_run / robot, num_eps,
+                               args.lease_batch, args.lease_ttl)
+            boards.append((dataset, robot, hw, out_root, board))
+            done_eps[dataset, robot] = _done_episodes(out_root, dataset, robot)
+
+    held = {}                                         # lease -> {"pending", "done", "failed", "rows"}
+
+    def refill():
+        jobs = []
+        for dataset, robot, hw, out_root, board in boards:
+            while len(jobs) < args.num_workers:
+                lease = board.claim()
+                if lease is None:
+                    break
+                todo = [ep for ep in lease.episodes if ep not in done_eps[dataset, robot]]
+                if not todo:
+                    lease.finish({"done": [], "failed": [], "rows": []})
+                    continue
+                print(f"[lease] {dataset}/{robot}: claimed episodes {lease.episodes}, "
+                      f"{len(todo)} to render", flush=True)
+                held[lease] = {"pending": set(todo), "done": [], "failed": [], "rows": []}
+                for ep in todo:
+                    job = Job((dataset, robot, ep), _task(args, dataset, robot, ep, hw, out_root, ledger),
+                              _episode_frames(out_root, ep), group=robot)
+                    job.lease = lease
+                    jobs.append(job)
+        return jobs
+
+    local = JobLedger.local()
+    try:
+        while not all(b[-1].all_done() for b in boards):
+            ran = False
+            for job, (robot, ep, ok, _) in run_jobs([], _generate_or_fail, args.num_workers,
+                                                     mp_context=mp_ctx, refill=refill,
+                                                     measure=_rendered_frames):
+                ran = True
+                state = held[job.lease]
+                state["pending"].discard(ep)
+                state["done" if ok else "failed"].append(ep)
+                row = local.get(job.key[0], robot, ep)
+                if row is not None:
+                    state["rows"].append(row)
+                if not state["pending"]:
+                    if job.lease.lost:
+                        print(f"[lease] {job.lease} expired while running; finishing anyway", flush=True)
+                    job.lease.finish({k: sorted(state[k]) for k in ("done", "failed")} | {"rows": state["rows"]})
+                    del held[job.lease]
+            if not ran:                               # everything left is leased by other nodes
+                time.sleep(poll)
+    finally:
+        for lease in held:
+            lease.release()
+        local.close()
+        for *_, board in boards:
+            board.close()
+
+    # every batch is terminal: one node per board writes the shared ledger
+    for dataset, robot, hw, out_root, board in boards:
+        try:
+            if _reconcile(dataset, robot, out_root, board):
+                print(f"[lease] {dataset}/{robot}: results reconciled into {out_root / LEDGER_NAME}")
+        finally:
+            board.close()                         # claim_once touched the clock again
+    print("All leased batches are terminal.")
+
+
 # ─────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
     main()
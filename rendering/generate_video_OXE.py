@@ -1,108 +1,28 @@
 #!/usr/bin/env python3
 # generate_video_parallel.py
 """
-并行调用 overlay.py 生成合成视频；
-Ctrl-C 可随时打断，子进程会被统一杀掉；
-失败的 (dataset, robot, episode) 组合追加写入 failed_jobs.txt。
+并行生成合成视频（overlay stage，见 pipeline_stages.py）；
+各 (dataset, robot, episode) 在常驻的 worker 进程里直接调用，不再逐个启动 overlay.py 子进程；
+输出比输入新的节点会被跳过；失败的组合追加写入 failed_jobs.txt。
+
+source_dir = ROBOT_CAMERA_POSES_DICT[dataset]["replay_path"]
+for each robot, episode:
+    load bg video from {source_dir}/original_oxe_videos/{episode}/inpaint_e2fgvi.mp4
+    load mask from {source_dir}/{robot}_replay_mask/{episode}.mask
+    load rgb from {source_dir}/{robot}_replay_video/{episode}.mp4
+    overlay the masked region of rgb onto bg and save as {source_dir}/{robot}_overlay/{episode}.mp4
 
 python /home/guanhuaji/mirage/robot2robot/rendering/generate_video_OXE.py
 """
 
-import os, sys, signal, atexit, threading, subprocess
-from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.pipeline import Pipeline, summarize
+from pipeline_stages import OVERLAY
 
 # ──────────────────────────── 路径 & 常量 ────────────────────────────
-ROOT         = Path("/home/guanhuaji/mirage/robot2robot/rendering/inpaint_utils")
-OVERLAY      = ROOT / "overlay.py"
-FPS          = 30
-MAX_WORKERS  = 20                       # 并发线程数，自行调整
+MAX_WORKERS  = 20                       # 并发进程数，自行调整
 FAILED_FILE  = "failed_jobs.txt"        # 失败记录文件
 
-# 如需删掉上一轮失败记录，取消下一行注释
-# Path(FAILED_FILE).write_text("")
-
-# ──────────────────────────── 数据集信息 ────────────────────────────
-from config.dataset_pair_location import dataset_path, inpainting_path
-from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
-
-# ──────────────────────────── 进程组管理 ────────────────────────────
-PROCS: list[subprocess.Popen] = []      # 所有子进程句柄
-_PROCS_LOCK = threading.Lock()
-
-def _register(p: subprocess.Popen):
-    with _PROCS_LOCK:
-        PROCS.append(p)
-
-def _unregister(p: subprocess.Popen):
-    with _PROCS_LOCK:
-        if p in PROCS:
-            PROCS.remove(p)
-
-def _kill_children(sig=signal.SIGTERM):
-    """给每个子进程组发送信号（默认 SIGTERM）"""
-    with _PROCS_LOCK:
-        for p in PROCS:
-            if p.poll() is None:
-                try:
-                    os.killpg(p.pid, sig)
-                except ProcessLookupError:
-                    pass
-        PROCS.clear()
-
-def _sig_handler(signum, frame):
-    print("\n⏹  收到中断信号，正在终止所有子进程 ...", file=sys.stderr, flush=True)
-    _kill_children(signal.SIGTERM)
-    # 如果用户再按一次 Ctrl-C，让默认处理器直接终止主进程
-    signal.signal(signal.SIGINT, signal.SIG_DFL)
-
-signal.signal(signal.SIGINT,  _sig_handler)
-signal.signal(signal.SIGTERM, _sig_handler)
-atexit.register(_kill_children)
-
-# ──────────────────────────── 失败记录 ────────────────────────────
-FAILED: list[tuple[str, str, int]] = []
-_FAIL_LOCK = threading.Lock()
-
-def record_fail(ds: str, robot: str, ep: int):
-    with _FAIL_LOCK:
-        FAILED.append((ds, robot, ep))
-        with open(FAILED_FILE, "a") as fh:
-            fh.write(f"{ds},{robot},{ep}\n")
-
-# ──────────────────────────── 子进程 & 命令封装 ────────────────────────────
-def overlay_cmd(dataset: str, robot: str, ep: int) -> list[str]:
-    paired_path = Path(dataset_path[dataset])
-    inpaint_dir = Path(inpainting_path[dataset])
-    out_root    = Path("/home/abrashid/cross_inpainting")
-
-
-    if dataset == "taco_play":
-        inpaint_dir = inpaint_dir / f"episode_{ep}" / "frames" / "inpaint_out.mp4"
-    else:
-        inpaint_dir = (inpaint_dir / f"{ep}.mp4"
-                    if "shared" in inpainting_path[dataset]
-                    else inpaint_dir / f"{ep}")
-
-    return [
-        sys.executable, str(OVERLAY),
-        "--original_path", str(inpaint_dir),
-        "--mask_folder",    str(paired_path / dataset / f"{robot}_mask" / f"{ep}"),
-        "--overlay_folder", str(paired_path / dataset / f"{robot}_rgb"  / f"{ep}"),
-        "--output_folder",  str(out_root / dataset / robot / f"{ep}")
-    ]
-
-def run_cmd(cmd: list[str], ds: str, robot: str, ep: int) -> None:
-    """启动外部脚本并等待；异常返回时记录失败。"""
-    p = subprocess.Popen(cmd, start_new_session=True)
-    _register(p)
-    try:
-        ret = p.wait()
-        if ret != 0:
-            record_fail(ds, robot, ep)
-    finally:
-        _unregister(p)
-
 # ──────────────────────────── Episode 任务 ────────────────────────────
 
 ROBOTS = {
@@ -122,17 +42,6 @@ ROBOTS = {
     "utokyo_pick_and_place": ["Sawyer", "IIWA", "Jaco", "Kinova3"],
     "can": ["Sawyer", "IIWA", "Jaco", "Kinova3", "UR5e"]
 }
-def episode_task(dataset: str, ep: int):
-    # 针对数据集选择机器人列表
-    # robots = (["UR5e", "Sawyer", "IIWA", "Jaco", "Kinova3"]
-    #           if dataset in {"viola", "furniture_bench", "taco_play", "iamlab_cmu"}
-    #           else ["Sawyer", "IIWA", "Jaco", "Kinova3"])
-
-    robots = ROBOTS[dataset]
-    
-
-    for robot in robots:
-        run_cmd(overlay_cmd(dataset, robot, ep), dataset, robot, ep)
 
 # ──────────────────────────── 主流程 ────────────────────────────
 def main():
@@ -144,39 +53,29 @@ def main():
         "austin_buds"
     ]
 
-    try:
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
-            futures = [
-                pool.submit(episode_task, ds, ep)
-                for ds in robot_datasets
-                #for ep in range(ROBOT_CAMERA_POSES_DICT[ds]["num_episodes"])
-                for ep in range(2)
-            ]
-
-            # 逐个 wait；内部异常不会抛到这里
-            for _ in as_completed(futures):
-                pass
+    pipeline = Pipeline()
+    for ds in robot_datasets:
+        #for ep in range(ROBOT_CAMERA_POSES_DICT[ds]["num_episodes"]):
+        for ep in range(2):
+            for robot in ROBOTS[ds]:
+                pipeline.add(OVERLAY, dataset=ds, robot=robot, episode=ep)
 
+    try:
+        status = pipeline.run(workers=MAX_WORKERS)
     except KeyboardInterrupt:
         print("🛑 用户中断 (Ctrl-C)")
-    finally:
-        _kill_children(signal.SIGKILL)  # 保险起见
+        return
 
     # ----- 结束汇总 -----
-    if FAILED:
-        print(f"⚠️  共 {len(FAILED)} 个任务失败，已写入 {FAILED_FILE}")
+    failed = [key for key, s in status.items() if s in ("failed", "blocked")]
+    if failed:
+        with open(FAILED_FILE, "a") as fh:
+            for _, ds, ep, robot in failed:          # key = (stage, *sorted params)
+                fh.write(f"{ds},{robot},{ep}\n")
+        print(f"⚠️  共 {len(failed)} 个任务失败，已写入 {FAILED_FILE}")
     else:
-        print("🎉 所有任务完成且无失败！")
+        print(f"🎉 所有任务完成且无失败！{summarize(status)}")
 
 # ──────────────────────────── 入口 ────────────────────────────
 if __name__ == "__main__":
     main()
-
-'''
-source_dir = /home/guanhuaji/mirage/robot2robot/rendering/paired_images/can
-for each robot in "Sawyer", "Jaco", "Kinova3", "IIWA", "UR5e":
-    for episode in range 0-200:
-        load bg video from {source_dir}/original_oxe_videos/{episode}/inpaint_e2fgvi.mp4
-        load mask from {source_dir}/{robot}_replay_mask/{episode}.mp4
-        load rgb from {source_dir}/{robot}_replay_video/{episode}.mp4
-        overlay the masked region of rgb onto bg and save as {source_dir}/{robot}_overlay/{episode}.mp4
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Pipeline stages (core.pipeline) for one (dataset, robot, episode):
+
+    replay   source robot states  ->  {robot}_replay_video/{ep}.mp4,
+                                      {robot}_replay_mask/{ep}.mask
+    overlay  inpainted background + replay video + mask
+                                  ->  {robot}_overlay/{ep}.mp4
+    fused    replay → render → composite in memory, one final write:
+                                  ->  {robot}_overlay/{ep}.h5 (lossless 84×84,
+                                      read by process_h5) or {ep}.mp4,
+                                      + the mask (.mask or .mp4, as the
+                                      replay writes it) and target states
+
+Stage functions run inside pipeline workers and only take plain values,
+so they can be shipped to spawn processes.  Paths follow the replay
+folder of ROBOT_CAMERA_POSES_DICT[dataset]; the inpainted background is
+`{replay_path}/original_oxe_videos/{ep}/inpaint_e2fgvi.mp4` unless the
+dataset's `inpaint_path` holds an `{ep}.mp4`.
+"""
+import json
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from config.robot_pose_dict import ROBOT_POSE_DICT
+from core.ingest import create_frame_dataset, finish_frame_dataset, iter_video_batches, write_frame_batch
+from core.masks import MASK_SUFFIX, MaskWriter, read_masks
+from core.pipeline import Stage
+from core.video import StreamingVideoWriter
+
+FPS = 30
+FUSED_SIZE = (84, 84)           # (W, H) of the lossless sink, = process_h5.TARGET_SIZE
+
+
+def replay_root(dataset):
+    return Path(ROBOT_CAMERA_POSES_DICT[dataset]["replay_path"])
+
+
+def background_video(dataset, episode):
+    meta = ROBOT_CAMERA_POSES_DICT[dataset]
+    inpaint = meta.get("inpaint_path") or meta.get("inpainting_path")
+    if inpaint and (Path(inpaint) / f"{episode}.mp4").exists():
+        return Path(inpaint) / f"{episode}.mp4"
+    return replay_root(dataset) / "original_oxe_videos" / f"{episode}" / "inpaint_e2fgvi.mp4"
+
+
+def replay_paths(dataset, robot, episode, mask_format="packbits"):
+    """(mask, video) written by the replay; see envs.target_env.replay_output_paths."""
+    root = replay_root(dataset)
+    suffix = MASK_SUFFIX if mask_format == "packbits" else ".mp4"
+    return (root / f"{robot}_replay_mask" / f"{episode}{suffix}",
+            root / f"{robot}_replay_video" / f"{episode}.mp4")
+
+
+def overlay_path(dataset, robot, episode, sink="mp4"):
+    return replay_root(dataset) / f"{robot}_overlay" / f"{episode}.{sink}"
+
+
+# ---------------------------------------------------------------------------
+# replay
+# ---------------------------------------------------------------------------
+def replay_episode(dataset, robot, episode, mask_format="packbits", **options):
+    """Replay + render one episode in this worker (warm pooled env)."""
+    from generate_target_robot_images_new import generate_one_episode
+
+    root = replay_root(dataset)
+    with open(root / "dataset_metadata.json", encoding="utf-8") as f:
+        dmeta = json.load(f)
+    _, _, ok, _ = generate_one_episode(
+        dataset, robot, episode, (dmeta["image_height"], dmeta["image_width"]), str(root),
+        mask_format=mask_format, **options,
+    )
+    return ok
+
+
+REPLAY = Stage(
+    "replay",
+    replay_episode,
+    inputs=lambda dataset, episode, **_: [
+        replay_root(dataset) / "source_robot_states" / f"{episode}.npz",
+    ],
+    outputs=lambda dataset, robot, episode, mask_format="packbits", **_: list(
+        replay_paths(dataset, robot, episode, mask_format)
+    ),
+)
+
+
+# ---------------------------------------------------------------------------
+# overlay
+# ---------------------------------------------------------------------------
+def overlay_frames(background, rgb, mask):
+    """Paste the masked robot pixels of *rgb* onto *background* (resized to it)."""
+    H, W = background.shape[1:3]
+    if rgb.shape[1:3] != (H, W):
+        rgb = np.stack([cv2.resize(f, (W, H), interpolation=cv2.INTER_LINEAR) for f in rgb])
+        mask = np.stack([cv2.resize(m.astype(np.uint8), (W, H), interpolation=cv2.INTER_NEAREST)
+                         for m in mask]).astype(bool)
+    return np.where(mask[..., None], rgb, background)
+
+
+def overlay_episode(dataset, robot, episode, mask_format="packbits", batch=64):
+    """Composite the replayed robot onto the inpainted background, streamed in batches."""
+    mask_path, video_path = replay_paths(dataset, robot, episode, mask_format)
+    masks = read_masks(mask_path)
+    out = StreamingVideoWriter(overlay_path(dataset, robot, episode), fps=FPS)
+    try:
+        rgb_batches = iter_video_batches(video_path, batch=batch)
+        n = 0
+        for (start, bg), (_, rgb) in zip(iter_video_batches(background_video(dataset, episode), batch=batch),
+                                         rgb_batches):
+            k = min(len(bg), len(rgb), len(masks) - start)
+            if k <= 0:
+                break
+            for frame in overlay_frames(bg[:k], rgb[:k], masks[start:start + k]):
+                out.append(frame)
+            n += k
+    except BaseException:
+        out.abort()
+        raise
+    if n == 0:
+        out.abort()
+        return False
+    out.close()
+    return True
+
+
+OVERLAY = Stage(
+    "overlay",
+    overlay_episode,
+    inputs=lambda dataset, robot, episode, mask_format="packbits", **_: [
+        background_video(dataset, episode), *replay_paths(dataset, robot, episode, mask_format),
+    ],
+    outputs=lambda dataset, robot, episode, **_: [overlay_path(dataset, robot, episode)],
+)
+
+
+# ---------------------------------------------------------------------------
+# fused: replay → render → composite → one sink, frames stay in memory
+# ---------------------------------------------------------------------------
+class _H5FrameSink:
+    """Lossless per-episode sink: uint8 (T, H, W, 3) "frames", resized to FUSED_SIZE."""
+
+    def __init__(self, path, num_frames):
+        import h5py
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self._f = h5py.File(self._tmp, "w")
+        self._ds = create_frame_dataset(self._f, "frames", num_frames, (*FUSED_SIZE[::-1], 3),
+                                        chunk_frames=16, compression="gzip", compression_opts=4)
+        self._n = 0
+
+    def append_batch(self, frames):
+        if frames.shape[1:3] != FUSED_SIZE[::-1]:
+            frames = np.stack([cv2.resize(f, FUSED_SIZE, interpolation=cv2.INTER_AREA) for f in frames])
+        write_frame_batch(self._ds, self._n, frames)
+        self._n += len(frames)
+
+    def close(self):
+        finish_frame_dataset(self._ds, self._n)
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class _VideoFrameSink:
+    def __init__(self, path):
+        self._w = StreamingVideoWriter(path, fps=FPS)
+
+    def append_batch(self, frames):
+        for f in frames:
+            self._w.append(f)
+
+    def close(self):
+        self._w.close()
+
+    def abort(self):
+        self._w.abort()
+
+
+def fused_episode(dataset, robot, episode, sink="h5", mask_format="packbits", state_store=False,
+                  autosearch=False, ik=False, reach_check=False, batch=64):
+    """
+    One pass per episode: the replay renders into memory, the robot is
+    composited onto the decoded background batch by batch and the result
+    is encoded once.  Returns False if the replay misses a pose or the
+    reachability pre-filter (reach_check) rejects the episode.
+    """
+    from core import pick_best_gpu
+
+    pick_best_gpu()
+    os.environ["MUJOCO_GL"] = "egl"
+    from envs import TargetEnvWrapper
+    from envs.target_env import save_target_states
+    from generate_target_robot_images_new import reach_feasible, select_gripper
+
+    root = replay_root(dataset)
+    with open(root / "dataset_metadata.json", encoding="utf-8") as f:
+        dmeta = json.load(f)
+    gripper = select_gripper(robot)
+    disp = np.asarray(ROBOT_POSE_DICT[dataset][robot], dtype=np.float64)
+    if autosearch:
+        from core.state_store import load_episode_states
+        from sim.displacement_search import search_displacement
+        from sim.kinematics import KinematicChain
+
+        source_poses = load_episode_states(root, "source", episode)["pos"]
+        disp, _ = search_displacement(KinematicChain.for_robot(robot, gripper), source_poses, disp)
+    elif reach_check and not reach_feasible(root, robot, episode, disp):
+        return False
+
+    wrapper = TargetEnvWrapper(robot, gripper, dataset, camera_height=dmeta["image_height"],
+                               camera_width=dmeta["image_width"], ik_mode=ik, pooled=True)
+    out = wrapper.render_frames(source_robot_states_path=root, robot_dataset=dataset,
+                                robot_disp=disp, episode=episode, unlimited=False)
+    if not out["success"]:
+        print(f"[FUSED] {robot} episode {episode}: target pose not reached")
+        return False
+    rgb, masks = out["rgb"], out["mask"]
+
+    frames_out = (_H5FrameSink(overlay_path(dataset, robot, episode, "h5"), len(rgb)) if sink == "h5"
+                  else _VideoFrameSink(overlay_path(dataset, robot, episode, "mp4")))
+    try:
+        n = 0
+        for start, bg in iter_video_batches(background_video(dataset, episode), batch=batch):
+            k = min(len(bg), len(rgb) - start)
+            if k <= 0:
+                break
+            frames_out.append_batch(overlay_frames(bg[:k], rgb[start:start + k], masks[start:start + k]))
+            n += k
+        if n == 0:
+            raise ValueError(f"no background frames for {dataset} episode {episode}")
+    except BaseException:
+        frames_out.abort()
+        raise
+    frames_out.close()
+
+    # same mask file the replay stage would have written
+    mask_path, _ = replay_paths(dataset, robot, episode, mask_format)
+    if mask_format == "packbits":
+        with MaskWriter(mask_path, *masks.shape[1:]) as w:
+            for m in masks:
+                w.append(m)
+    else:
+        w = StreamingVideoWriter(mask_path, pixelformat="gray")
+        try:
+            for m in masks:
+                w.append(m.astype(np.uint8) * np.uint8(255))
+        except BaseException:
+            w.abort()
+            raise
+        w.close()
+    save_target_states(root, robot, episode,
+                       {k: out[k] for k in ("target_pose", "joint_angles", "gripper_width", "offsets")},
+                       state_store)
+    return True
+
+
+FUSED = Stage(
+    "fused",
+    fused_episode,
+    inputs=lambda dataset, episode, **_: [
+        replay_root(dataset) / "source_robot_states" / f"{episode}.npz",
+        background_video(dataset, episode),
+    ],
+    outputs=lambda dataset, robot, episode, sink="h5", **_: [overlay_path(dataset, robot, episode, sink)],
+)
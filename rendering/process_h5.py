@@ -16,24 +16,45 @@ Paths are built from three inputs:
   --paired-root      Root containing paired_images/<dataset>/...
                      (default: /home/guanhuaji/mirage/robot2robot/rendering/paired_images)
 
+Videos are decoded in batches on a thread pool (--workers) while the main
+thread, the only one touching the file, writes each batch straight into a
+dataset preallocated from the container's frame count (core/ingest.py), so
+no episode is ever held in RAM as a whole.  A lossless <id>.h5 written by
+the fused pipeline (run_pipeline.py --fused) is preferred over the mp4.  Image datasets use
+multi-frame chunks (--chunk-frames, 1 = the old per-frame layout) and
+--compression gzip | lzf | lz4 | blosc | none (lz4/blosc via hdf5plugin,
+falling back to gzip).  benchmark_h5_layouts.py compares the layouts.
+
 Usage
 -----
 python /home/guanhuaji/mirage/robot2robot/rendering/process_h5.py --dataset three_piece_assembly
+python /home/guanhuaji/mirage/robot2robot/rendering/process_h5.py --dataset three_piece_assembly --workers 16 --chunk-frames 32 --compression blosc
 """
 from __future__ import annotations
 
 import argparse
 import logging
 import re
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Sequence
 
-import cv2  # OpenCV‑Python
 import h5py
 import numpy as np
 
+from core.ingest import (
+    create_frame_dataset,
+    finish_frame_dataset,
+    frame_count,
+    iter_frame_batches,
+    write_frame_batch,
+)
+from core.state_store import load_episode_states
+
 ROBOTS: Sequence[str] = ["UR5e", "Jaco", "Sawyer", "Kinova3", "IIWA"]
 TARGET_SIZE = (84, 84)  # (width, height)
+DECODE_BATCH = 64       # frames decoded per batch before they are written
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
 
@@ -41,28 +62,6 @@ logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
 # Helper utilities
 # -----------------------------------------------------------------------------
 
-def _decode_video(path: Path, size: tuple[int, int] = TARGET_SIZE) -> np.ndarray:
-    """Load *path* and return RGB frames as uint8 array of shape (T,H,W,3)."""
-    cap = cv2.VideoCapture(str(path))
-    if not cap.isOpened():
-        raise IOError(f"Cannot open video {path}")
-
-    frames: list[np.ndarray] = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        if (frame.shape[1], frame.shape[0]) != size:  # width, height
-            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
-        frames.append(frame.astype(np.uint8))
-    cap.release()
-
-    if not frames:
-        raise ValueError(f"No frames decoded from {path}")
-    return np.stack(frames, axis=0)  # (T, H, W, 3)
-
-
 def _replace_dataset(group: h5py.Group, name: str, data: np.ndarray, **kw) -> None:
     """Delete *name* if it exists and recreate with *data*."""
     if name in group:
@@ -79,48 +78,190 @@ def _episode_id_from_group(group_name: str) -> str:
     return m.group(1) if m else group_name
 
 
-def process_episode(ep_group: h5py.Group, ep_name: str, paired_root: Path) -> None:
-    """Attach / overwrite all robot datasets for one episode inside *obs/*."""
-    file_id = _episode_id_from_group(ep_name)
-    state_root = paired_root / "target_robot_states"
+def compression_kwargs(name: str = "gzip", level: int | None = None) -> dict:
+    """
+    h5py filter kwargs for *name*: gzip | lzf | lz4 | blosc | none.
+    lz4 / blosc need the optional `hdf5plugin` package; without it they fall
+    back to gzip (readers then need no plugin either).
+    """
+    if name == "none":
+        return {}
+    if name == "lzf":
+        return {"compression": "lzf"}
+    if name in ("lz4", "blosc"):
+        try:
+            import hdf5plugin
+        except ImportError:
+            logging.warning("hdf5plugin not installed – %s falls back to gzip", name)
+            name = "gzip"
+        else:
+            if name == "lz4":
+                return dict(hdf5plugin.LZ4())
+            return dict(hdf5plugin.Blosc(cname="lz4", clevel=level or 5,
+                                         shuffle=hdf5plugin.Blosc.SHUFFLE))
+    if name == "gzip":
+        return {"compression": "gzip", "compression_opts": 4 if level is None else level}
+    raise ValueError(f"Unknown compression {name!r}")
 
-    obs_grp = ep_group.require_group("obs")
 
-    for robot in ROBOTS:
-        video_path = paired_root / f"{robot}_overlay" / f"{file_id}.mp4"
-        state_path = state_root / robot / f"{file_id}.npz"
+def video_chunks(num_frames: int, chunk_frames: int, frame_shape=(*TARGET_SIZE[::-1], 3)) -> tuple:
+    """Multi-frame chunks: (min(chunk_frames, T), H, W, 3)."""
+    return (max(1, min(chunk_frames, num_frames)), *frame_shape)
+
+
+def _video_path(paired_root: Path, file_id: str, robot: str) -> Path:
+    """Lossless {id}.h5 from the fused pipeline if present, else the overlay mp4."""
+    fused = paired_root / f"{robot}_overlay" / f"{file_id}.h5"
+    if fused.exists():
+        return fused
+    return paired_root / f"{robot}_overlay" / f"{file_id}.mp4"
 
-        # ---------------- Video frames ----------------
-        if video_path.exists():
-            try:
-                frames = _decode_video(video_path)
-                _replace_dataset(
-                    obs_grp,
-                    f"agentview_image_{robot}",
-                    frames,
-                    compression="gzip",
-                    compression_opts=4,
-                    chunks=(1, *TARGET_SIZE, 3),  # slow‑but‑safe chunking
-                )
-                logging.debug("Stored %s frames for %s", frames.shape[0], robot)
-            except Exception as exc:
-                logging.warning("Failed processing %s: %s", video_path, exc)
-        else:
-            logging.warning("Missing video: %s", video_path)
 
-        # -------------- End‑effector pose -------------
-        if state_path.exists():
+def _stream_robot_video(out: queue.Queue, paired_root: Path, ep_name: str, robot: str) -> None:
+    """
+    Decode-pool job: push ("open", count), ("batch", start, frames)… and
+    finally ("done", n) / ("error", exc) / ("missing",) for (ep_name, robot)
+    onto *out*.  The queue is bounded, so a slow writer stalls the decoders
+    instead of letting decoded frames pile up.
+    """
+    video_path = _video_path(paired_root, _episode_id_from_group(ep_name), robot)
+    if not video_path.exists():
+        out.put((ep_name, robot, "missing"))
+        return
+    n = 0
+    try:
+        out.put((ep_name, robot, "open", frame_count(video_path)))
+        for start, frames in iter_frame_batches(video_path, TARGET_SIZE, DECODE_BATCH):
+            out.put((ep_name, robot, "batch", start, frames))
+            n = start + len(frames)
+        out.put((ep_name, robot, "done", n))
+    except Exception as exc:
+        out.put((ep_name, robot, "error", exc))
+
+
+def _store_eef_states(obs_grp: h5py.Group, paired_root: Path, file_id: str, robot: str) -> None:
+    """robot_states.store if present, else target_robot_states/<robot>/<id>.npz."""
+    try:
+        states = load_episode_states(paired_root, f"target/{robot}", file_id)
+    except (KeyError, ValueError, FileNotFoundError):
+        logging.warning("Missing state: target/%s/%s", robot, file_id)
+        return
+    try:
+        if "target_pose" not in states:
+            raise KeyError(f"'target_pose' missing for target/{robot}/{file_id}")
+        eef = states["target_pose"].astype(np.float32)
+        _replace_dataset(obs_grp, f"{robot}_eef_states", eef)
+        logging.debug("Stored pose for %s", robot)
+    except Exception as exc:
+        logging.warning("Failed loading target/%s/%s: %s", robot, file_id, exc)
+
+
+def _commit_partial(obs_grp: h5py.Group, name: str) -> None:
+    """Move the finished "<name>.partial" over *name*."""
+    if name in obs_grp:
+        del obs_grp[name]
+    obs_grp.move(f"{name}.partial", name)
+
+
+def process_file(
+    f: h5py.File,
+    paired_root: Path,
+    workers: int = 8,
+    chunk_frames: int = 16,
+    filters: dict | None = None,
+) -> None:
+    """
+    Decode overlay videos on a thread pool (cv2 releases the GIL) while this
+    thread – the only one touching *f* – writes each decoded batch straight
+    into a dataset preallocated from the container's frame count.  Nothing
+    holds a whole episode in RAM: at most 4×workers decoded batches are
+    queued.  Videos are written under "<name>.partial" and renamed when
+    complete, so a failed decode keeps the previous dataset.
+    """
+    episodes = list(f["data"].keys())
+    logging.info("%d episode group(s) detected", len(episodes))
+    filters = compression_kwargs() if filters is None else filters
+
+    batches: queue.Queue = queue.Queue(maxsize=4 * workers)
+    open_ds: dict = {}                  # (ep, robot) -> partial dataset
+    frame_counts: dict = {}             # (ep, robot) -> header frame count
+    failed: set = set()                 # (ep, robot) whose write failed mid-video
+    remaining: dict = {}                # ep -> robots still decoding
+    it = iter(episodes)
+    in_flight = max(1, workers // len(ROBOTS)) + 1     # episodes decoding at once
+
+    def _submit(pool) -> bool:
+        ep = next(it, None)
+        if ep is None:
+            return False
+        logging.info("Processing %s", ep)
+        remaining[ep] = set(ROBOTS)
+        for robot in ROBOTS:
+            pool.submit(_stream_robot_video, batches, paired_root, ep, robot)
+        return True
+
+    def _finish(ep: str, robot: str) -> None:
+        remaining[ep].discard(robot)
+        if remaining[ep]:
+            return
+        del remaining[ep]
+        obs_grp = f["data"][ep].require_group("obs")
+        file_id = _episode_id_from_group(ep)
+        for r in ROBOTS:
+            _store_eef_states(obs_grp, paired_root, file_id, r)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(in_flight):
+            if not _submit(pool):
+                break
+        while remaining:
+            ep, robot, kind, *payload = batches.get()
+            key = (ep, robot)
+            obs_grp = f["data"][ep].require_group("obs")
+            name = f"agentview_image_{robot}"
             try:
-                with np.load(state_path) as npz:
-                    if "target_pose" not in npz.files:
-                        raise KeyError("'target_pose' missing in " + str(state_path))
-                    eef = npz["target_pose"].astype(np.float32)
-                _replace_dataset(obs_grp, f"{robot}_eef_states", eef)
-                logging.debug("Stored pose for %s", robot)
+                if kind == "open":
+                    # allocated on the first batch, once the frame shape is known
+                    frame_counts[key] = payload[0]
+                    continue
+                if kind == "batch":
+                    if key in failed:
+                        continue
+                    start, frames = payload
+                    ds = open_ds.get(key)
+                    if ds is None:
+                        ds = open_ds[key] = create_frame_dataset(
+                            obs_grp, f"{name}.partial", frame_counts.pop(key, 0) or len(frames),
+                            frames.shape[1:], chunk_frames, **filters)
+                    write_frame_batch(ds, start, frames)
+                    continue
+                # terminal message for this video
+                ds = open_ds.pop(key, None)
+                if key in failed:
+                    failed.discard(key)
+                elif kind == "missing":
+                    logging.warning("Missing video: %s",
+                                    _video_path(paired_root, _episode_id_from_group(ep), robot))
+                elif kind == "error":
+                    raise payload[0]
+                elif ds is None:
+                    raise ValueError(f"No frames decoded for {ep}/{robot}")
+                else:
+                    finish_frame_dataset(ds, payload[0])
+                    _commit_partial(obs_grp, name)
+                    logging.debug("Stored %s frames for %s", payload[0], robot)
             except Exception as exc:
-                logging.warning("Failed loading %s: %s", state_path, exc)
-        else:
-            logging.warning("Missing state: %s", state_path)
+                logging.warning("Failed processing %s/%s: %s", ep, robot, exc)
+                open_ds.pop(key, None)
+                frame_counts.pop(key, None)
+                if f"{name}.partial" in obs_grp:
+                    del obs_grp[f"{name}.partial"]
+                if kind == "batch":
+                    failed.add(key)         # drop the rest of this video's batches
+                    continue
+            _finish(ep, robot)
+            if len(remaining) < in_flight:
+                _submit(pool)
 
 # -----------------------------------------------------------------------------
 # Entry point
@@ -139,6 +280,12 @@ def main() -> None:
         default="/home/guanhuaji/mirage/robot2robot/rendering/paired_images",
         help="Root dir of paired_images/<dataset>",
     )
+    p.add_argument("--workers", type=int, default=8, help="video decode threads")
+    p.add_argument("--chunk-frames", type=int, default=16,
+                   help="frames per HDF5 chunk for the image datasets (1 = old layout)")
+    p.add_argument("--compression", default="gzip", choices=("gzip", "lzf", "lz4", "blosc", "none"),
+                   help="lz4/blosc need hdf5plugin (falls back to gzip)")
+    p.add_argument("--compression-level", type=int, default=None)
     args = p.parse_args()
 
     h5_path = Path(args.h5_root) / args.dataset / "image_84.hdf5"
@@ -151,11 +298,13 @@ def main() -> None:
     with h5py.File(h5_path, "a") as f:
         if "data" not in f:
             raise KeyError("'/data' group missing in HDF5 file")
-        episodes = list(f["data"].keys())
-        logging.info("%d episode group(s) detected", len(episodes))
-        for ep in episodes:
-            logging.info("Processing %s", ep)
-            process_episode(f["data"][ep], ep, paired_root)
+        process_file(
+            f,
+            paired_root,
+            workers=args.workers,
+            chunk_frames=args.chunk_frames,
+            filters=compression_kwargs(args.compression, args.compression_level),
+        )
 
     logging.info("✔ All done.")
 
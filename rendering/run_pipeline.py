@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Run replay → overlay for (dataset, robot, episode) nodes in-process
+(core.pipeline + pipeline_stages.py) instead of chaining one subprocess
+per stage and episode.  Nodes whose outputs are newer than their inputs
+are skipped; independent nodes run on --workers spawn processes that keep
+their imports and warm envs for the whole run.
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/run_pipeline.py --robot_dataset toto --robots UR5e Jaco --workers 16
+python /home/guanhuaji/mirage/robot2robot/rendering/run_pipeline.py --robot_dataset toto --robots UR5e --episodes 0 100 --stages overlay
+python /home/guanhuaji/mirage/robot2robot/rendering/run_pipeline.py --robot_dataset toto --robots UR5e Jaco --fused h5
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from config.dataset_poses_dict import ROBOT_CAMERA_POSES_DICT
+from core.ledger import JobLedger, publish
+from core.pipeline import Pipeline, summarize
+from pipeline_stages import FUSED, OVERLAY, REPLAY
+
+
+def build(dataset, robots, episodes, stages, replay_options, fused_sink=None):
+    p = Pipeline()
+    for robot in robots:
+        for ep in episodes:
+            if fused_sink:
+                p.add(FUSED, dataset=dataset, robot=robot, episode=ep, sink=fused_sink,
+                      mask_format=replay_options["mask_format"], state_store=replay_options["state_store"],
+                      autosearch=replay_options["autosearch"], ik=replay_options["ik"],
+                      reach_check=replay_options["reach_check"])
+                continue
+            r = None
+            if "replay" in stages:
+                r = p.add(REPLAY, dataset=dataset, robot=robot, episode=ep, **replay_options)
+            if "overlay" in stages:
+                p.add(OVERLAY, deps=[r], dataset=dataset, robot=robot, episode=ep,
+                      mask_format=replay_options["mask_format"])
+    return p
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="In-process replay/overlay pipeline")
+    ap.add_argument("--robot_dataset", required=True)
+    ap.add_argument("--robots", nargs="+", required=True)
+    ap.add_argument("--episodes", type=int, nargs=2, default=None, metavar=("START", "STOP"),
+                    help="episode range (default: all in dataset_metadata.json)")
+    ap.add_argument("--stages", nargs="+", choices=("replay", "overlay"), default=["replay", "overlay"])
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--force", action="store_true", help="run nodes even if their outputs are up to date")
+    ap.add_argument("--fused", choices=("h5", "mp4"), default=None,
+                    help="one in-memory replay→composite pass per episode, written once as a lossless "
+                    "84×84 {ep}.h5 (picked up by process_h5) or a single mp4")
+    ap.add_argument("--autosearch", action="store_true")
+    ap.add_argument("--ik", action="store_true")
+    ap.add_argument("--reach_check", action="store_true")
+    ap.add_argument("--mask_format", choices=("packbits", "mp4"), default="packbits")
+    ap.add_argument("--state_store", action="store_true")
+    ap.add_argument("--no_cache", action="store_true")
+    args = ap.parse_args()
+    if args.fused and args.no_cache:
+        # the fused stage has no result cache; its up-to-date check is what --force skips
+        ap.error("--no_cache does not apply to --fused; use --force to re-run up-to-date episodes")
+
+    root = Path(ROBOT_CAMERA_POSES_DICT[args.robot_dataset]["replay_path"])
+    if args.episodes is None:
+        with open(root / "dataset_metadata.json", encoding="utf-8") as f:
+            episodes = range(json.load(f)["num_episodes"])
+    else:
+        episodes = range(*args.episodes)
+
+    replay_options = dict(
+        autosearch=args.autosearch,
+        ik=args.ik,
+        reach_check=args.reach_check,
+        mask_format=args.mask_format,
+        state_store=args.state_store,
+        use_cache=not args.no_cache,
+    )
+    pipeline = build(args.robot_dataset, args.robots, episodes, args.stages, replay_options, args.fused)
+    t_start = time.time()
+    try:
+        status = pipeline.run(workers=args.workers, force=args.force)
+    finally:
+        if "replay" in args.stages and not args.fused:
+            # replay workers record into the node-local ledger; publish this run's rows
+            with JobLedger.local() as local:
+                for robot in args.robots:
+                    rows = local.rows(args.robot_dataset, robot, episodes, t_start)
+                    publish(root, args.robot_dataset, robot, rows)
+    print("✓", ", ".join(f"{k}: {v}" for k, v in sorted(summarize(status).items())))
+
+
+if __name__ == "__main__":
+    main()
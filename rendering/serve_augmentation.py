@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Run the on-demand augmentation service (envs/augment_server.py): clients
+ask for (dataset, episode, robot, frame range) and get rendered target
+robot frames + masks, served from a memory / disk LRU when possible.
+
+Usage
+-----
+python /home/guanhuaji/mirage/robot2robot/rendering/serve_augmentation.py --port 6001
+python /home/guanhuaji/mirage/robot2robot/rendering/serve_augmentation.py --port 6001 --cache_mb 8192 --disk_cache_gb 200
+python /home/guanhuaji/mirage/robot2robot/rendering/serve_augmentation.py --host 0.0.0.0 --port 6001 --authkey "$R2R_AUGMENT_KEY"
+
+    from envs.augment_server import AugmentationClient
+    frames = AugmentationClient(("localhost", 6001)).frames("toto", 12, "UR5e", 0, 32)
+"""
+import argparse
+
+from core import pick_best_gpu
+from envs.augment_server import AugmentationService, serve
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="On-demand target robot rendering service")
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", type=int, default=6001)
+    ap.add_argument("--authkey", default=None,
+                    help="shared secret; required off loopback (default: a random key, printed)")
+    ap.add_argument("--cache_mb", type=int, default=2048, help="in-memory frame cache")
+    ap.add_argument("--disk_cache_gb", type=float, default=None,
+                    help="on-disk frame cache bound (default $R2R_RESULT_CACHE_BYTES or 2 GiB)")
+    ap.add_argument("--height", type=int, default=84, help="rendered frame height")
+    ap.add_argument("--width", type=int, default=84, help="rendered frame width")
+    args = ap.parse_args()
+
+    pick_best_gpu()
+    service = AugmentationService(
+        cache_mb=args.cache_mb,
+        disk_cache_bytes=None if args.disk_cache_gb is None else int(args.disk_cache_gb * (1 << 30)),
+        camera_height=args.height,
+        camera_width=args.width,
+    )
+    authkey = None if args.authkey is None else args.authkey.encode()
+    serve((args.host, args.port), authkey=authkey, service=service)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,24 +7,45 @@ Public surface:
     - CameraWrapper
     - RobotCameraWrapper
     - _robot_geom_ids
+    - robot_geom_lut
+    - KinematicChain
+    - SiteIK
+    - ReachabilityMap
+    - get_robot_env
+    - compiled_model_cache
+    - FrameRenderer
 """
 
 # ── 公共 re-exports ──────────────────────────────────────────
 from .camera            import CameraWrapper
 from .robot_camera      import RobotCameraWrapper
-from .geom_utils        import _robot_geom_ids
+from .geom_utils        import _robot_geom_ids, robot_geom_lut
 from .dataset_loader    import gripper_convert, load_states_from_harsha
+from .kinematics        import KinematicChain
+from .ik                import SiteIK
+from .reachability      import ReachabilityMap, load_reachability_map
+from .env_pool          import get_robot_env
+from .model_cache       import compiled_model_cache
+from .render            import FrameRenderer
 
 __all__ = [
     "CameraWrapper",
     "RobotCameraWrapper",
     "_robot_geom_ids",
+    "robot_geom_lut",
     "gripper_convert",
     "load_states_from_harsha",
+    "KinematicChain",
+    "SiteIK",
+    "ReachabilityMap",
+    "load_reachability_map",
+    "get_robot_env",
+    "compiled_model_cache",
+    "FrameRenderer",
 ]
 
 # （可选）把子模块本身挂在顶层，便于 IDE 补全
 from importlib import import_module as _imp
-for _name in ("camera", "robot_camera", "geom_utils", "dataset_loader"):
+for _name in ("camera", "robot_camera", "geom_utils", "dataset_loader", "kinematics", "ik", "reachability", "env_pool", "model_cache", "render"):
     globals()[_name] = _imp(f"{__name__}.{_name}")
 del _imp, _name
@@ -0,0 +1,88 @@
+"""
+Batched displacement search for target replay.
+
+The old --autosearch built a fresh TargetEnvWrapper and ran a full dry-run
+replay for every candidate offset.  Here all candidates of one grid scale
+are replayed together through `solve_chain_trajectories` (NumPy FK + DLS
+IK, no MuJoCo, no renderer), and only the winner is rendered afterwards.
+
+The search keeps the old coarse-to-fine schedule: 27 offsets around the
+current best at each scale, stop at the first scale with a candidate that
+reaches every frame, otherwise move to the candidate that got furthest.
+"""
+import numpy as np
+
+from sim.ik import solve_chain_trajectories
+
+DEFAULT_SCALES = (0.03, 0.1, 0.3)
+
+
+def offset_grid(step):
+    """The 27 offsets {0, -step, +step}³, zero first (same order as before)."""
+    return np.array(
+        [
+            [dx, dy, dz]
+            for dx in (0, -step, step)
+            for dy in (0, -step, step)
+            for dz in (0, -step, step)
+        ],
+        dtype=np.float32,
+    )
+
+
+def score_displacements(chain, source_poses, candidates, **ik_kwargs):
+    """
+    Replay *source_poses* (T, 7) under every displacement in *candidates*
+    (C, 3) and return one record per candidate:
+        {"offset", "steps", "ok", "mean_error", "max_error"}
+    mean/max error are taken over the frames before the first failure.
+    """
+    candidates = np.asarray(candidates, dtype=np.float64)
+    poses = np.repeat(np.asarray(source_poses, dtype=np.float64)[None], len(candidates), axis=0)
+    poses[:, :, :3] -= candidates[:, None, :]          # target = source - disp
+
+    errors, steps = solve_chain_trajectories(chain, poses, **ik_kwargs)
+    T_ = poses.shape[1]
+    records = []
+    for cand, err, n in zip(candidates, errors, steps):
+        reached = err[:max(int(n), 1)]
+        records.append(
+            {
+                "offset": cand.tolist(),
+                "steps": int(n),
+                "ok": bool(n == T_),
+                "mean_error": float(reached.mean()),
+                "max_error": float(reached.max()),
+            }
+        )
+    return records
+
+
+def search_displacement(chain, source_poses, start, scales=DEFAULT_SCALES,
+                        **ik_kwargs):
+    """
+    Coarse-to-fine search from *start*.  Returns (best_disp, records) where
+    records lists every scored candidate (with its "scale") in order.
+    """
+    best_disp = np.asarray(start, dtype=np.float64).copy()
+    best_steps = -1
+    history = []
+
+    for step in scales:
+        cands = best_disp + offset_grid(step)
+        records = score_displacements(chain, source_poses, cands, **ik_kwargs)
+        for rec in records:
+            rec["scale"] = float(step)
+        history.extend(records)
+
+        ok = [r for r in records if r["ok"]]
+        if ok:
+            winner = min(ok, key=lambda r: r["mean_error"])
+            return np.asarray(winner["offset"]), history
+
+        furthest = max(records, key=lambda r: r["steps"])   # first on ties
+        if furthest["steps"] > best_steps:
+            best_steps = furthest["steps"]
+            best_disp = np.asarray(furthest["offset"])
+
+    return best_disp, history
@@ -0,0 +1,51 @@
+"""
+Per-process pool of warm `RobotCameraWrapper`s.
+
+`suite.make` with an offscreen renderer dominates short episodes, so worker
+processes keep one env per (robot, gripper, H, W) alive and hand it out
+again after a `reset_state()`:
+
+    env = get_robot_env("UR5e", "Robotiq85Gripper", 84, 84)
+
+The pool lives in module state, i.e. one per process – spawn/fork workers
+each build their own.  Envs are not safe to share between threads.
+"""
+import atexit
+
+from sim.robot_camera import RobotCameraWrapper
+
+_POOL = {}
+
+
+def get_robot_env(robot, gripper, camera_height=256, camera_width=256,
+                  robot_dataset=None, ik_mode=False):
+    """Return a reset env for this key, building it on first use."""
+    key = (robot, gripper, int(camera_height), int(camera_width))
+    env = _POOL.get(key)
+    if env is None:
+        env = RobotCameraWrapper(
+            robotname=robot,
+            grippername=gripper,
+            robot_dataset=robot_dataset,
+            camera_height=camera_height,
+            camera_width=camera_width,
+            ik_mode=ik_mode,
+        )
+        _POOL[key] = env
+    else:
+        env.reset_state()
+    env.ik_mode = ik_mode
+    return env
+
+
+def release_all():
+    """Close every pooled renderer (registered atexit)."""
+    while _POOL:
+        _, env = _POOL.popitem()
+        try:
+            env.env.close_renderer()
+        except Exception:
+            pass
+
+
+atexit.register(release_all)
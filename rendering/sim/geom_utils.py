@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def _robot_geom_ids(env):
     sim   = env.sim
     robot = env.robots[0]
@@ -17,4 +20,18 @@ def _robot_geom_ids(env):
     # ---- 3. union + id mapping ----
     names = set(arm_names) | set(grip_names)
     ids = {sim.model.geom_name2id(n) for n in names if n in sim.model.geom_names}
-    return ids
\ No newline at end of file
+    return ids
+
+def robot_geom_lut(env):
+    """
+    Dense uint8 lookup over geom ids: lut[g] == 1 iff geom g belongs to the
+    robot or its gripper.  One extra trailing 0 so that -1 (background in
+    FrameRenderer's geom-id image) maps to 0 as well:
+
+        mask = lut[geom_img]
+    """
+    ngeom = env.sim.model.ngeom
+    lut = np.zeros(ngeom + 1, dtype=np.uint8)
+    ids = np.fromiter(_robot_geom_ids(env), dtype=np.int64)
+    lut[ids] = 1
+    return lut
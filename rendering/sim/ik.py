@@ -0,0 +1,147 @@
+"""
+Damped-least-squares inverse kinematics.
+
+`SiteIK` solves arm joint angles for a target site pose directly from
+MuJoCo site Jacobians (`mj_jacSite`) – no controller, no physics substeps.
+It starts from whatever is currently in `data.qpos`, so replaying a
+trajectory frame by frame is warm-started from the previous solution.
+
+`solve_chain_trajectories` does the same on a NumPy `KinematicChain` for
+many candidate trajectories at once (no MuJoCo at all), which is what the
+displacement search scores candidates with.
+"""
+import mujoco
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from core.geometry import compute_pose_error, compute_pose_error_batch
+from sim.kinematics import mats_to_quat_xyzw
+
+
+def rotation_error(rot_cur, rot_tgt):
+    """
+    World-frame rotation vector taking rot_cur to rot_tgt.
+    Works on (3, 3) or batched (..., 3, 3) matrices.
+    """
+    rel = rot_tgt @ np.swapaxes(rot_cur, -1, -2)
+    flat = rel.reshape(-1, 3, 3)
+    return R.from_matrix(flat).as_rotvec().reshape(rel.shape[:-2] + (3,))
+
+
+def damped_least_squares(jac, err, damping):
+    """
+    dq = Jᵀ (J Jᵀ + λ² I)⁻¹ e, batched over leading dimensions.
+    jac : (..., m, n)   err : (..., m)
+    """
+    jt = np.swapaxes(jac, -1, -2)
+    m = jac.shape[-2]
+    lhs = jac @ jt + (damping ** 2) * np.eye(m)
+    return (jt @ np.linalg.solve(lhs, err[..., None]))[..., 0]
+
+
+class SiteIK:
+    def __init__(self, sim, joint_names, site_name,
+                 damping=0.05, ori_weight=0.5, max_step=0.2):
+        self.sim = sim
+        self.model = sim.model._model
+        self.data = sim.data._data
+        self.site_id = sim.model.site_name2id(site_name)
+
+        joint_ids = [sim.model.joint_name2id(n) for n in joint_names]
+        self.qpos_idx = np.array([self.model.jnt_qposadr[j] for j in joint_ids])
+        self.dof_idx = np.array([self.model.jnt_dofadr[j] for j in joint_ids])
+        limited = np.array([self.model.jnt_limited[j] for j in joint_ids], dtype=bool)
+        ranges = np.array([self.model.jnt_range[j] for j in joint_ids])
+        self.q_lower = np.where(limited, ranges[:, 0], -np.inf)
+        self.q_upper = np.where(limited, ranges[:, 1], np.inf)
+
+        self.damping = damping
+        self.ori_weight = ori_weight
+        self.max_step = max_step
+        self._jacp = np.zeros((3, self.model.nv))
+        self._jacr = np.zeros((3, self.model.nv))
+
+    def _site_pose(self):
+        pos = self.data.site_xpos[self.site_id].copy()
+        rot = self.data.site_xmat[self.site_id].reshape(3, 3).copy()
+        return pos, rot
+
+    def solve(self, target_pose, tol=0.003, max_iters=50):
+        """
+        target_pose : (7,) [x, y, z, qx, qy, qz, qw]
+        Leaves the solution in qpos (qvel zeroed, kinematics up to date) and
+        returns the final `compute_pose_error`.
+        """
+        tgt_pos = np.asarray(target_pose[:3], dtype=np.float64)
+        tgt_rot = R.from_quat(target_pose[3:]).as_matrix()
+        m, d = self.model, self.data
+
+        q = d.qpos[self.qpos_idx].copy()
+        for _ in range(max_iters):
+            mujoco.mj_kinematics(m, d)
+            pos, rot = self._site_pose()
+            cur = np.concatenate((pos, R.from_matrix(rot).as_quat()))
+            if compute_pose_error(cur, target_pose) < tol:
+                break
+
+            mujoco.mj_comPos(m, d)
+            mujoco.mj_jacSite(m, d, self._jacp, self._jacr, self.site_id)
+            jac = np.vstack((self._jacp[:, self.dof_idx],
+                             self.ori_weight * self._jacr[:, self.dof_idx]))
+            err = np.concatenate((tgt_pos - pos,
+                                  self.ori_weight * rotation_error(rot, tgt_rot)))
+            dq = damped_least_squares(jac, err, self.damping)
+            dq = np.clip(dq, -self.max_step, self.max_step)
+            q = np.clip(q + dq, self.q_lower, self.q_upper)
+            d.qpos[self.qpos_idx] = q
+
+        d.qvel[self.dof_idx] = 0.0
+        self.sim.forward()
+        pos, rot = self._site_pose()
+        cur = np.concatenate((pos, R.from_matrix(rot).as_quat()))
+        return compute_pose_error(cur, target_pose)
+
+
+def solve_chain_trajectories(chain, target_poses, q0=None, tol=0.003,
+                             max_threshold=0.02, max_iters=30, damping=0.05,
+                             ori_weight=0.5, max_step=0.2):
+    """
+    Kinematics-only replay of C candidate trajectories in lock-step.
+
+    target_poses : (C, T, 7) [x, y, z, qx, qy, qz, qw]
+    q0           : (J,) start configuration (defaults to the robot's init qpos)
+
+    Each frame is warm-started from the previous frame's solution, like the
+    sim replay.  Returns (errors (C, T), steps (C,)), where steps is the index
+    of the first frame with error >= max_threshold (T if all are reached) –
+    the same count `generate_image` reports when it stops at a failure.
+    """
+    target_poses = np.asarray(target_poses, dtype=np.float64)
+    C, T_, _ = target_poses.shape
+    q = np.tile(chain.q_init if q0 is None else np.asarray(q0, dtype=np.float64), (C, 1))
+    tgt_rot = R.from_quat(target_poses[..., 3:].reshape(-1, 4)).as_matrix().reshape(C, T_, 3, 3)
+
+    errors = np.zeros((C, T_))
+    for t in range(T_):
+        tgt = target_poses[:, t]
+        for _ in range(max_iters):
+            pos, rot, jac = chain._site_frames(q, with_jacobian=True)
+            cur = np.concatenate((pos, mats_to_quat_xyzw(rot)), axis=1)
+            err = compute_pose_error_batch(cur, tgt)
+            active = err >= tol
+            if not active.any():
+                break
+            jac[:, 3:] *= ori_weight
+            e = np.concatenate((tgt[:, :3] - pos,
+                                ori_weight * rotation_error(rot, tgt_rot[:, t])), axis=1)
+            dq = np.clip(damped_least_squares(jac, e, damping), -max_step, max_step)
+            dq[~active] = 0.0
+            q = np.clip(q + dq, chain.q_lower, chain.q_upper)
+        else:
+            cur = chain.forward(q)
+            err = compute_pose_error_batch(cur, tgt)
+        errors[:, t] = err
+
+    bad = errors >= max_threshold
+    steps = np.where(bad.any(axis=1), bad.argmax(axis=1), T_)
+    return errors, steps
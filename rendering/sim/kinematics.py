@@ -0,0 +1,287 @@
+"""
+Renderer-free forward kinematics for the robosuite arms.
+
+The chain (world → … → eef site) is read once from a compiled MjModel and
+then evaluated with plain NumPy, so a whole episode of joint angles turns
+into EEF poses with one call instead of one `sim.forward()` per frame.
+
+    chain = KinematicChain.for_robot("UR5e", "Robotiq85Gripper")
+    poses = chain.forward(joint_angles)        # (T, J) -> (T, 7)
+
+Poses follow `RobotCameraWrapper.compute_eef_pose`: [x, y, z, qx, qy, qz, qw]
+with the same sign convention as `robosuite.utils.transform_utils.mat2quat`
+(w >= 0).
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from core.io import cache_root
+
+# mjtJoint
+_SLIDE = 2
+_HINGE = 3
+
+
+def _quat_wxyz_to_mat(q):
+    """MuJoCo quaternion [w, x, y, z] -> 3×3 rotation matrix."""
+    w, x, y, z = q
+    return R.from_quat([x, y, z, w]).as_matrix()
+
+
+def _axis_angle_mats(axis, angles):
+    """Rodrigues for one unit axis and a batch of angles -> (T, 3, 3)."""
+    x, y, z = axis
+    K = np.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+    s = np.sin(angles)[:, None, None]
+    c = np.cos(angles)[:, None, None]
+    return np.eye(3) + s * K + (1.0 - c) * (K @ K)
+
+
+def mats_to_quat_xyzw(mats):
+    """(T, 3, 3) rotation matrices -> (T, 4) [x, y, z, w] with w >= 0."""
+    quat = R.from_matrix(mats).as_quat()
+    quat[quat[:, 3] < 0] *= -1.0
+    return quat
+
+
+class KinematicChain:
+    """
+    Serial chain from the world body to one site.
+
+    links      : (L, 3) body offsets and (L, 3, 3) body rotations, relative
+                 to the parent body (MuJoCo `body_pos` / `body_quat`).
+    joints     : one row per joint on the path, in MuJoCo order.  `jnt_col`
+                 is the column of the (T, J) joint array that drives the
+                 joint, or -1 for joints that are held at `jnt_value`
+                 (e.g. gripper joints sitting on the path).
+    """
+
+    def __init__(self, link_pos, link_rot, jnt_link, jnt_type, jnt_axis,
+                 jnt_pos, jnt_qpos0, jnt_col, jnt_value, site_pos, site_rot,
+                 joint_names, q_init, q_lower, q_upper):
+        self.link_pos = np.asarray(link_pos, dtype=np.float64)
+        self.link_rot = np.asarray(link_rot, dtype=np.float64)
+        self.jnt_link = np.asarray(jnt_link, dtype=np.int64)
+        self.jnt_type = np.asarray(jnt_type, dtype=np.int64)
+        self.jnt_axis = np.asarray(jnt_axis, dtype=np.float64)
+        self.jnt_pos = np.asarray(jnt_pos, dtype=np.float64)
+        self.jnt_qpos0 = np.asarray(jnt_qpos0, dtype=np.float64)
+        self.jnt_col = np.asarray(jnt_col, dtype=np.int64)
+        self.jnt_value = np.asarray(jnt_value, dtype=np.float64)
+        self.site_pos = np.asarray(site_pos, dtype=np.float64)
+        self.site_rot = np.asarray(site_rot, dtype=np.float64)
+        self.joint_names = [str(n) for n in joint_names]
+        self.q_init = np.asarray(q_init, dtype=np.float64)
+        self.q_lower = np.asarray(q_lower, dtype=np.float64)
+        self.q_upper = np.asarray(q_upper, dtype=np.float64)
+
+        # group joints by link once so forward() is a flat loop
+        self._link_joints = [[] for _ in range(len(self.link_pos))]
+        for k, li in enumerate(self.jnt_link):
+            self._link_joints[li].append(k)
+
+    @property
+    def num_joints(self):
+        return len(self.joint_names)
+
+    # ------------------------------------------------------------------
+    # construction
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_sim(cls, sim, joint_names, site_name):
+        """Extract the chain ending at *site_name* from a robosuite MjSim."""
+        m = sim.model
+        joint_names = list(joint_names)
+        site_id = m.site_name2id(site_name)
+
+        path = []
+        body = int(m.site_bodyid[site_id])
+        while body != 0:
+            path.append(body)
+            body = int(m.body_parentid[body])
+        path.reverse()
+
+        link_pos, link_rot = [], []
+        jnt_link, jnt_type, jnt_axis, jnt_pos = [], [], [], []
+        jnt_qpos0, jnt_col, jnt_value = [], [], []
+        for li, b in enumerate(path):
+            link_pos.append(m.body_pos[b].copy())
+            link_rot.append(_quat_wxyz_to_mat(m.body_quat[b]))
+            start = int(m.body_jntadr[b])
+            for j in range(start, start + int(m.body_jntnum[b])):
+                jtype = int(m.jnt_type[j])
+                if jtype not in (_HINGE, _SLIDE):
+                    raise ValueError(f"Unsupported joint type {jtype} on the eef chain")
+                qadr = int(m.jnt_qposadr[j])
+                name = m.joint_id2name(j)
+                jnt_link.append(li)
+                jnt_type.append(jtype)
+                jnt_axis.append(m.jnt_axis[j].copy())
+                jnt_pos.append(m.jnt_pos[j].copy())
+                jnt_qpos0.append(float(m.qpos0[qadr]))
+                jnt_col.append(joint_names.index(name) if name in joint_names else -1)
+                jnt_value.append(float(sim.data.qpos[qadr]))
+
+        missing = set(range(len(joint_names))) - set(jnt_col)
+        if missing:
+            raise ValueError(
+                f"Joints {[joint_names[i] for i in sorted(missing)]} are not on the path to {site_name!r}"
+            )
+
+        q_init, q_lower, q_upper = [], [], []
+        for name in joint_names:
+            j = m.joint_name2id(name)
+            q_init.append(float(sim.data.qpos[m.jnt_qposadr[j]]))
+            if m.jnt_limited[j]:
+                q_lower.append(float(m.jnt_range[j][0]))
+                q_upper.append(float(m.jnt_range[j][1]))
+            else:
+                q_lower.append(-np.inf)
+                q_upper.append(np.inf)
+
+        return cls(link_pos, link_rot, jnt_link, jnt_type, jnt_axis, jnt_pos,
+                   jnt_qpos0, jnt_col, jnt_value,
+                   m.site_pos[site_id].copy(), _quat_wxyz_to_mat(m.site_quat[site_id]),
+                   joint_names, q_init, q_lower, q_upper)
+
+    @classmethod
+    def for_robot(cls, robot, gripper):
+        """
+        Chain for a robosuite robot/gripper pair inside the Empty arena
+        (the world frame `RobotCameraWrapper` works in).  Cached in-process
+        and on disk, so `suite.make` runs at most once per robosuite version.
+        """
+        return _chain_for_robot(robot, gripper)
+
+    # ------------------------------------------------------------------
+    # (de)serialisation
+    # ------------------------------------------------------------------
+    def save(self, path):
+        np.savez(
+            path,
+            link_pos=self.link_pos, link_rot=self.link_rot,
+            jnt_link=self.jnt_link, jnt_type=self.jnt_type,
+            jnt_axis=self.jnt_axis, jnt_pos=self.jnt_pos,
+            jnt_qpos0=self.jnt_qpos0, jnt_col=self.jnt_col,
+            jnt_value=self.jnt_value,
+            site_pos=self.site_pos, site_rot=self.site_rot,
+            joint_names=np.array(self.joint_names),
+            q_init=self.q_init, q_lower=self.q_lower, q_upper=self.q_upper,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            return cls(**{k: d[k] for k in d.files})
+
+    # ------------------------------------------------------------------
+    # kinematics
+    # ------------------------------------------------------------------
+    def _site_frames(self, joint_angles, with_jacobian=False):
+        """
+        Return site positions (T, 3) and rotations (T, 3, 3), plus the
+        world-frame site Jacobian (T, 6, J) [linear; angular] if requested.
+        """
+        q = np.asarray(joint_angles, dtype=np.float64)
+        if q.ndim == 1:
+            q = q[None]
+        if q.shape[1] < self.num_joints:
+            raise ValueError(f"Expected {self.num_joints} joint columns, got {q.shape[1]}")
+        T_ = q.shape[0]
+
+        rot = np.broadcast_to(np.eye(3), (T_, 3, 3)).copy()
+        pos = np.zeros((T_, 3))
+        axes, anchors = {}, {}
+        for li in range(len(self.link_pos)):
+            pos = pos + rot @ self.link_pos[li]
+            rot = rot @ self.link_rot[li]
+            for k in self._link_joints[li]:
+                col = self.jnt_col[k]
+                val = q[:, col] if col >= 0 else np.full(T_, self.jnt_value[k])
+                delta = val - self.jnt_qpos0[k]
+                if self.jnt_type[k] == _HINGE:
+                    # rotate about the joint anchor, as mj_kinematics does
+                    anchor = pos + rot @ self.jnt_pos[k]
+                    if with_jacobian and col >= 0:
+                        axes[col], anchors[col] = rot @ self.jnt_axis[k], anchor
+                    rot = rot @ _axis_angle_mats(self.jnt_axis[k], delta)
+                    pos = anchor - rot @ self.jnt_pos[k]
+                else:
+                    if with_jacobian and col >= 0:
+                        axes[col], anchors[col] = rot @ self.jnt_axis[k], None
+                    pos = pos + (rot @ self.jnt_axis[k]) * delta[:, None]
+
+        site_pos = pos + rot @ self.site_pos
+        site_rot = rot @ self.site_rot
+        if not with_jacobian:
+            return site_pos, site_rot
+
+        jac = np.zeros((T_, 6, self.num_joints))
+        for col, axis in axes.items():
+            if anchors[col] is None:                  # slide
+                jac[:, :3, col] = axis
+            else:                                     # hinge
+                jac[:, :3, col] = np.cross(axis, site_pos - anchors[col])
+                jac[:, 3:, col] = axis
+        return site_pos, site_rot, jac
+
+    def forward(self, joint_angles):
+        """
+        joint_angles : (T, J) or (J,)
+        returns      : (T, 7) or (7,) EEF poses [x, y, z, qx, qy, qz, qw]
+        """
+        single = np.ndim(joint_angles) == 1
+        site_pos, site_rot = self._site_frames(joint_angles)
+        poses = np.concatenate((site_pos, mats_to_quat_xyzw(site_rot)), axis=1)
+        return poses[0] if single else poses
+
+
+def _chain_key(robot, gripper):
+    """
+    sim.model_cache.model_key of the robot + gripper model XML (plus the
+    robosuite / mujoco versions): editing either XML or upgrading a
+    library gives a new chain.  Parsing the two models is cheap next to
+    suite.make.
+    """
+    from robosuite.models.grippers import gripper_factory
+    from robosuite.models.robots import create_robot
+
+    from sim.model_cache import model_key
+
+    return model_key(create_robot(robot).get_xml() + gripper_factory(gripper).get_xml())
+
+
+@lru_cache(maxsize=None)
+def _chain_for_robot(robot, gripper):
+    import robosuite as suite
+
+    path = cache_root("kinematics") / f"{robot}_{gripper}_{_chain_key(robot, gripper)[:16]}.npz"
+    if path.is_file():
+        return KinematicChain.load(path)
+
+    from sim.model_cache import compiled_model_cache
+
+    with compiled_model_cache():
+        env = suite.make(
+            robots=robot,
+            gripper_types=gripper,
+            env_name="Empty",
+            has_renderer=False,
+            has_offscreen_renderer=False,
+            ignore_done=True,
+            use_camera_obs=False,
+            controller_configs=suite.load_controller_config(default_controller="OSC_POSE"),
+            control_freq=20,
+            hard_reset=False,
+        )
+    robot0 = env.robots[0]
+    chain = KinematicChain.from_sim(env.sim, robot0.robot_joints, robot0.controller.eef_name)
+    env.close()
+
+    tmp = path.with_name(f".{path.stem}.{os.getpid()}.npz")
+    chain.save(tmp)
+    tmp.replace(path)
+    return chain
@@ -0,0 +1,85 @@
+"""
+On-disk cache of compiled MuJoCo models.
+
+robosuite builds the Empty-arena XML in Python and then compiles it with
+`MjSim.from_xml_string`; the compile (mesh loading, convex hulls, …) is
+the slow part and is identical for every env of the same robot, gripper
+and camera config.  Inside `compiled_model_cache()` that call is served
+from an MJB file keyed by
+
+    sha1(xml string, robosuite version, mujoco version)
+
+The XML already encodes robot, gripper, cameras and asset paths, so any
+change there (or a library upgrade) is a new key – nothing to invalidate
+by hand.  Files live under `cache_root("mjb")`; set R2R_MODEL_CACHE=0 to
+disable.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+
+import mujoco
+
+from core.io import cache_root
+
+_depth = 0
+_orig_from_xml_string = None
+
+
+def _enabled():
+    return os.environ.get("R2R_MODEL_CACHE", "1") != "0"
+
+
+def model_key(xml):
+    import robosuite
+
+    h = hashlib.sha1()
+    for part in (xml, robosuite.__version__, mujoco.__version__):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_or_compile(xml):
+    """Compiled MjModel for *xml*, from the cache if possible."""
+    path = cache_root("mjb") / f"{model_key(xml)}.mjb"
+    if path.is_file():
+        try:
+            return mujoco.MjModel.from_binary_path(str(path))
+        except Exception:
+            path.unlink(missing_ok=True)        # truncated / foreign file
+
+    model = mujoco.MjModel.from_xml_string(xml)
+    tmp = path.with_name(f".{path.stem}.{os.getpid()}.mjb")
+    try:
+        mujoco.mj_saveModel(model, str(tmp), None)
+        tmp.replace(path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+    return model
+
+
+@contextmanager
+def compiled_model_cache():
+    """
+    Route robosuite's `MjSim.from_xml_string` through the MJB cache for the
+    duration of the block (re-entrant).
+    """
+    global _depth, _orig_from_xml_string
+    if not _enabled():
+        yield
+        return
+
+    from robosuite.utils.binding_utils import MjSim
+
+    if _depth == 0:
+        _orig_from_xml_string = MjSim.__dict__["from_xml_string"]
+        MjSim.from_xml_string = classmethod(lambda cls, xml: cls(load_or_compile(xml)))
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        if _depth == 0:
+            MjSim.from_xml_string = _orig_from_xml_string
+            _orig_from_xml_string = None
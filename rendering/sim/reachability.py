@@ -0,0 +1,169 @@
+"""
+Per-robot reachability maps.
+
+A map is a boolean grid over (voxel, approach direction) in the robot's
+Empty-arena world frame – the frame `TargetEnvWrapper` replays in.  It is
+built offline by sampling joint configurations through `KinematicChain`
+(see build_reachability_maps.py) and answers "can this robot put its grip
+site here, pointing roughly this way?" for a whole trajectory with one
+fancy-indexing op.
+
+    rmap = load_reachability_map("IIWA")
+    ok, first_bad = rmap.check_trajectory(poses, displacement, max_misses=5, slack=1)
+
+It is a pre-filter: a voxel that was never hit is treated as unreachable,
+so build with enough samples (and the default 1-voxel dilation) to keep
+false rejections rare, and query with some slack – a few neighbour voxels
+and a few missing frames – when a rejection skips the replay.
+"""
+from functools import lru_cache
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+REACHABILITY_DIR = Path(__file__).resolve().parent.parent / "reachability_maps"
+
+
+def fibonacci_sphere(n):
+    """n roughly evenly spaced unit vectors, (n, 3)."""
+    i = np.arange(n) + 0.5
+    phi = np.arccos(1.0 - 2.0 * i / n)
+    theta = np.pi * (1.0 + 5 ** 0.5) * i
+    return np.stack((np.cos(theta) * np.sin(phi),
+                     np.sin(theta) * np.sin(phi),
+                     np.cos(phi)), axis=1)
+
+
+def _dilate(grid):
+    """6-neighbour binary dilation over the three spatial axes."""
+    out = grid.copy()
+    for axis in range(3):
+        n = grid.shape[axis]
+        lo = [slice(None)] * grid.ndim
+        hi = [slice(None)] * grid.ndim
+        lo[axis], hi[axis] = slice(0, n - 1), slice(1, n)
+        out[tuple(lo)] |= grid[tuple(hi)]
+        out[tuple(hi)] |= grid[tuple(lo)]
+    return out
+
+
+class ReachabilityMap:
+    def __init__(self, grid, origin, voxel, dirs, robot="", ori_tol_deg=30.0):
+        self.grid = np.asarray(grid, dtype=bool)           # (nx, ny, nz, K)
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.voxel = float(voxel)
+        self.dirs = np.asarray(dirs, dtype=np.float64)     # (K, 3)
+        self.robot = str(robot)
+        self.ori_tol_deg = float(ori_tol_deg)
+        # direction bins within the tolerance of each other
+        cos_tol = np.cos(np.deg2rad(self.ori_tol_deg))
+        self._dir_nbrs = (self.dirs @ self.dirs.T) >= cos_tol
+
+    # ------------------------------------------------------------------
+    # build / io
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, chain, num_samples=2_000_000, voxel=0.03, num_dirs=64,
+              batch=100_000, seed=0, dilate=True, robot=""):
+        """Monte-Carlo sample the joint space of *chain* into a new map."""
+        rng = np.random.default_rng(seed)
+        lower = np.where(np.isfinite(chain.q_lower), chain.q_lower, -np.pi)
+        upper = np.where(np.isfinite(chain.q_upper), chain.q_upper, np.pi)
+
+        # conservative workspace bound: base position ± total link length
+        base = chain.link_pos[0]
+        reach = (np.linalg.norm(chain.link_pos[1:], axis=1).sum()
+                 + np.linalg.norm(chain.jnt_pos, axis=1).sum()
+                 + np.linalg.norm(chain.site_pos))
+        origin = base - reach - voxel
+        n_vox = int(np.ceil(2 * (reach + voxel) / voxel))
+
+        dirs = fibonacci_sphere(num_dirs)
+        grid = np.zeros((n_vox, n_vox, n_vox, num_dirs), dtype=bool)
+
+        done = 0
+        while done < num_samples:
+            n = min(batch, num_samples - done)
+            q = rng.uniform(lower, upper, size=(n, chain.num_joints))
+            pos, rot = chain._site_frames(q)
+            idx = np.floor((pos - origin) / voxel).astype(int)
+            inside = np.all((idx >= 0) & (idx < grid.shape[:3]), axis=1)
+            d = np.argmax(rot[:, :, 2] @ dirs.T, axis=1)
+            grid[idx[inside, 0], idx[inside, 1], idx[inside, 2], d[inside]] = True
+            done += n
+
+        if dilate:
+            grid = _dilate(grid)
+        return cls(grid, origin, voxel, dirs, robot=robot)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            bits=np.packbits(self.grid, axis=None),
+            shape=np.array(self.grid.shape),
+            origin=self.origin,
+            voxel=self.voxel,
+            dirs=self.dirs,
+            robot=self.robot,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            shape = tuple(d["shape"])
+            grid = np.unpackbits(d["bits"], count=int(np.prod(shape))).astype(bool).reshape(shape)
+            return cls(grid, d["origin"], float(d["voxel"]), d["dirs"], robot=str(d["robot"]))
+
+    # ------------------------------------------------------------------
+    # queries
+    # ------------------------------------------------------------------
+    def query(self, poses, slack=0):
+        """
+        poses : (T, 7) [x, y, z, qx, qy, qz, qw] in the map's world frame
+        slack : also accept a hit in any voxel within *slack* cells (per axis)
+        returns (T,) bool – True where the pose is (approximately) reachable.
+        """
+        poses = np.atleast_2d(poses)
+        base = np.floor((poses[:, :3] - self.origin) / self.voxel).astype(int)
+        approach = R.from_quat(poses[:, 3:7]).as_matrix()[:, :, 2]
+        nbrs = self._dir_nbrs[np.argmax(approach @ self.dirs.T, axis=1)]   # (T, K)
+        ok = np.zeros(len(poses), dtype=bool)
+        steps = range(-int(slack), int(slack) + 1)
+        for off in product(steps, steps, steps):
+            idx = base + off
+            inside = ~ok & np.all((idx >= 0) & (idx < self.grid.shape[:3]), axis=1)
+            if not inside.any():
+                continue
+            cells = self.grid[idx[inside, 0], idx[inside, 1], idx[inside, 2]]   # (n, K)
+            ok[inside] = np.any(cells & nbrs[inside], axis=1)
+        return ok
+
+    def check_trajectory(self, poses, displacement=None, max_misses=0, slack=0):
+        """
+        Apply the replay displacement (target = source - disp, as in
+        TargetEnvWrapper.generate_image) and return (feasible, first_bad),
+        where first_bad is the first unreachable frame (-1 if none).  The
+        trajectory stays feasible while at most *max_misses* frames miss;
+        *slack* is passed to query().
+        """
+        poses = np.array(poses, dtype=np.float64, copy=True)
+        if displacement is not None:
+            poses[:, :3] -= np.asarray(displacement, dtype=np.float64)
+        bad = np.flatnonzero(~self.query(poses, slack))
+        if bad.size == 0:
+            return True, -1
+        return bad.size <= max_misses, int(bad[0])
+
+
+@lru_cache(maxsize=None)
+def load_reachability_map(robot, root=None):
+    """Cached loader; returns None when no map has been built for *robot*."""
+    path = Path(root or REACHABILITY_DIR) / f"{robot}.npz"
+    if not path.is_file():
+        return None
+    return ReachabilityMap.load(path)
+
@@ -0,0 +1,95 @@
+"""
+Offscreen RGB + segmentation from one scene update.
+
+`sim.render(...)` twice (RGB, then segmentation=True) rebuilds the MjvScene
+twice, allocates fresh images for both reads and decodes segmentation
+through an (H, W, 2) int32 table that is then flipped and copied again.
+`FrameRenderer` drives robosuite's offscreen context directly:
+
+    mjv_updateScene                     – once per frame
+    mjr_render → mjr_readPixels (RGB)   – into a preallocated buffer
+    mjr_render → mjr_readPixels (seg)   – same scene, segment flags on
+
+MuJoCo still needs a second `mjr_render` for the ID-colour pass; what goes
+away is the second scene update and every per-frame allocation.  The
+vertical flip is a `[::-1]` view of the buffers, so nothing is copied;
+results are only valid until the next `render()`.
+"""
+import mujoco
+import numpy as np
+
+
+class FrameRenderer:
+    def __init__(self, sim, width, height):
+        self.sim = sim
+        self.width = int(width)
+        self.height = int(height)
+        if sim._render_context_offscreen is None:
+            sim.render(width=self.width, height=self.height)    # creates the context
+        self.ctx = sim._render_context_offscreen
+        self.viewport = mujoco.MjrRect(0, 0, self.width, self.height)
+
+        H, W = self.height, self.width
+        self._rgb = np.empty((H, W, 3), dtype=np.uint8)
+        self._seg_rgb = np.empty((H, W, 3), dtype=np.uint8)
+        self._segid = np.empty((H, W), dtype=np.int32)
+        self._tmp = np.empty((H, W), dtype=np.int32)
+        self._geom = np.empty((H, W), dtype=np.int32)
+
+    def _ensure_offscreen_size(self):
+        con = self.ctx.con
+        if self.width > con.offWidth or self.height > con.offHeight:
+            vis = self.sim.model._model.vis.global_
+            self.ctx.update_offscreen_size(max(self.width, vis.offwidth),
+                                           max(self.height, vis.offheight))
+
+    def _scene_geom_lut(self):
+        """seg value (scene index + 1) -> model geom id, -1 for non-geoms/background."""
+        scn = self.ctx.scn
+        lut = np.full(scn.ngeom + 2, -1, dtype=np.int32)
+        for i in range(scn.ngeom):
+            g = scn.geoms[i]
+            if g.segid != -1 and g.objtype == mujoco.mjtObj.mjOBJ_GEOM:
+                lut[g.segid + 1] = g.objid
+        return lut
+
+    def render(self, camera_id):
+        """
+        Returns (rgb (H, W, 3) uint8, geom_ids (H, W) int32), both upright
+        views into reused buffers.  geom_ids is -1 on background.
+        """
+        ctx = self.ctx
+        if hasattr(ctx, "gl_ctx"):
+            ctx.gl_ctx.make_current()               # pooled envs each own a context
+        self._ensure_offscreen_size()
+
+        ctx.cam.type = mujoco.mjtCamera.mjCAMERA_FIXED
+        ctx.cam.fixedcamid = camera_id
+        mujoco.mjv_updateScene(self.sim.model._model, self.sim.data._data,
+                               ctx.vopt, ctx.pert, ctx.cam,
+                               mujoco.mjtCatBit.mjCAT_ALL, ctx.scn)
+
+        mujoco.mjr_render(self.viewport, ctx.scn, ctx.con)
+        mujoco.mjr_readPixels(self._rgb, None, self.viewport, ctx.con)
+
+        flags = ctx.scn.flags
+        flags[mujoco.mjtRndFlag.mjRND_SEGMENT] = 1
+        flags[mujoco.mjtRndFlag.mjRND_IDCOLOR] = 1
+        try:
+            mujoco.mjr_render(self.viewport, ctx.scn, ctx.con)
+            mujoco.mjr_readPixels(self._seg_rgb, None, self.viewport, ctx.con)
+        finally:
+            flags[mujoco.mjtRndFlag.mjRND_SEGMENT] = 0
+            flags[mujoco.mjtRndFlag.mjRND_IDCOLOR] = 0
+
+        # id colour = r + g·2⁸ + b·2¹⁶ = scene index + 1 (0: background)
+        seg = self._seg_rgb
+        lut = self._scene_geom_lut()
+        np.left_shift(seg[..., 1], 8, out=self._segid, dtype=np.int32)
+        np.left_shift(seg[..., 2], 16, out=self._tmp, dtype=np.int32)
+        self._segid |= self._tmp
+        self._segid |= seg[..., 0]
+        np.minimum(self._segid, len(lut) - 1, out=self._segid)
+        np.take(lut, self._segid, out=self._geom)
+
+        return self._rgb[::-1], self._geom[::-1]
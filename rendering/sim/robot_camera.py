@@ -4,36 +4,73 @@ import numpy as np
 import robosuite.utils.transform_utils as T
 from core.physics import fast_step
 from core.geometry import compute_pose_error
-from sim.geom_utils import _robot_geom_ids
+from sim.geom_utils import robot_geom_lut
+from sim.ik import SiteIK
+from sim.model_cache import compiled_model_cache
+from sim.render import FrameRenderer
 
 class RobotCameraWrapper:
-    def __init__(self, robotname="Panda", grippername="PandaGripper", robot_dataset=None, camera_height=256, camera_width=256):
-        options = {}
-        self.env = suite.make(
-            **options,
-            robots=robotname,
-            gripper_types=grippername,
-            env_name="Empty",
-            has_renderer=True,  # no on-screen renderer
-            has_offscreen_renderer=True,  # no off-screen renderer
-            ignore_done=True,
-            use_camera_obs=True,  # no camera observations
-            controller_configs = suite.load_controller_config(default_controller="OSC_POSE"),
-            control_freq=20,
-            renderer="mujoco",
-            camera_names = ["agentview"],  # You can add more camera names if needed
-            camera_heights = camera_height,
-            camera_widths = camera_width,
-            camera_depths = True,
-            camera_segmentations = "robot_only",
-            hard_reset=False,
-        )
+    def __init__(self, robotname="Panda", grippername="PandaGripper", robot_dataset=None, camera_height=256, camera_width=256, ik_mode=False):
+        # the XML -> MjModel compile (incl. CameraMover's reload) comes from the MJB cache
+        with compiled_model_cache():
+            options = {}
+            self.env = suite.make(
+                **options,
+                robots=robotname,
+                gripper_types=grippername,
+                env_name="Empty",
+                has_renderer=True,  # no on-screen renderer
+                has_offscreen_renderer=True,  # no off-screen renderer
+                ignore_done=True,
+                use_camera_obs=True,  # no camera observations
+                controller_configs = suite.load_controller_config(default_controller="OSC_POSE"),
+                control_freq=20,
+                renderer="mujoco",
+                camera_names = ["agentview"],  # You can add more camera names if needed
+                camera_heights = camera_height,
+                camera_widths = camera_width,
+                camera_depths = True,
+                camera_segmentations = "robot_only",
+                hard_reset=False,
+            )
         
-        self.camera_wrapper = CameraWrapper(self.env)
+            self.camera_wrapper = CameraWrapper(self.env)
         self.robot_name = robotname
         self.robot_base_name = f"robot0_base"
         self.base_body_id = self.env.sim.model.body_name2id(self.robot_base_name)
         self.base_position = self.env.sim.model.body_pos[self.base_body_id].copy()
+        # ik_mode: drive_robot_to_target_pose solves joint angles with DLS IK
+        # and teleports, instead of stepping the OSC controller
+        self.ik_mode = ik_mode
+        self._ik = None
+        self._renderers = {}        # (width, height) -> FrameRenderer
+        self._robot_geom_lut = None
+
+        # snapshot of the freshly built env, restored by reset_state()
+        sim = self.env.sim
+        self._init_sim_state = sim.get_state().flatten()
+        self._init_camera_pose = self.camera_wrapper.get_camera_pose_world_frame()
+        self._init_camera_fov = float(sim.model.cam_fovy[self.camera_wrapper.camera_id])
+        self._init_use_delta = self.env.robots[0].controller.use_delta
+
+    def reset_state(self):
+        """
+        Cheap per-episode reset for a reused env: restores qpos/qvel, the
+        agentview camera pose and fov, and the controller goal to what they
+        were right after construction.  No suite.make, no renderer rebuild.
+        """
+        sim = self.env.sim
+        sim.set_state_from_flattened(self._init_sim_state)
+        sim.forward()
+        self.camera_wrapper.set_camera_pose(pos=self._init_camera_pose[:3], quat=self._init_camera_pose[3:])
+        self.camera_wrapper.set_camera_fov(self._init_camera_fov)
+        sim.forward()
+
+        controller = self.env.robots[0].controller
+        controller.use_delta = self._init_use_delta
+        controller.update(force=True)
+        controller.reset_goal()
+        self.some_safe_joint_angles = None
 
     def get_gripper_width_from_qpos(self):
         sim   = self.env.sim
@@ -68,7 +105,20 @@ class RobotCameraWrapper:
             self.env.sim.data.qvel[qpos_addr] = 0.0
         self.env.sim.forward()
 
+    def solve_ik_to_target_pose(self, target_pose=None, min_threshold=0.003, max_threshold=0.02, num_iter_max=50):
+        """Same contract as drive_robot_to_target_pose, but via site-Jacobian IK."""
+        assert len(target_pose) == 7, "Target pose should be 7DOF"
+        if self._ik is None:
+            robot = self.env.robots[0]
+            self._ik = SiteIK(self.env.sim, robot.robot_joints, robot.controller.eef_name)
+        error = self._ik.solve(target_pose, tol=min_threshold, max_iters=num_iter_max)
+        self.some_safe_joint_angles = self.env.sim.data.qpos[self.env.robots[0]._ref_joint_pos_indexes].copy()
+        current_pose = self.compute_eef_pose()
+        return error < max_threshold, current_pose, error
+
     def drive_robot_to_target_pose(self, target_pose=None, min_threshold=0.003, max_threshold=0.02, num_iter_max=100):
+        if self.ik_mode:
+            return self.solve_ik_to_target_pose(target_pose, min_threshold=min_threshold, max_threshold=max_threshold)
         self.env.robots[0].controller.use_delta = False # change to absolute pose for setting the initial state
         assert len(target_pose) == 7, "Target pose should be 7DOF"
         current_pose = self.compute_eef_pose()
@@ -152,21 +202,19 @@ class RobotCameraWrapper:
         sim = self.env.sim
         sim.forward()                                           # 同步姿态
 
-        rgb = sim.render(width=width, height=height,
-                        camera_name=camera)[::-1]
-        seg = sim.render(width=width, height=height,
-                        camera_name=camera,
-                        segmentation=True)[::-1]               # (H,W,2)
-
-        objtype_img = seg[..., 0]
-        objid_img   = seg[..., 1]
+        # one scene update, RGB + segmentation into reused buffers (sim/render.py)
+        renderer = self._renderers.get((width, height))
+        if renderer is None:
+            renderer = self._renderers[(width, height)] = FrameRenderer(sim, width, height)
+        rgb, geom_img = renderer.render(sim.model.camera_name2id(camera))
 
-        robot_body_ids = _robot_geom_ids(self.env)
-        mask = (np.isin(objid_img, list(robot_body_ids))).astype(np.uint8)
+        # robot geoms don't change after construction: build the lookup once
+        if self._robot_geom_lut is None:
+            self._robot_geom_lut = robot_geom_lut(self.env)
+        mask = self._robot_geom_lut[geom_img]                  # (H, W) uint8
         if white_background:
-            rgb_out = rgb.copy()
-            rgb_out[mask == 0] = 255
+            rgb_out = np.where(mask[..., None] != 0, rgb, np.uint8(255))
         else:
             rgb_out = (rgb * mask[..., None]).astype(np.uint8)
 
-        return rgb_out, mask
\ No newline at end of file
+        return rgb_out, mask
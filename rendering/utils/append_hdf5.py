@@ -1,8 +1,11 @@
 import os
+import sys
 import glob
 import h5py
 import numpy as np
-from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.ingest import ingest_images
 
 # ---------------------------
 # 1. 配置部分：修改为你自己的路径
@@ -37,34 +40,23 @@ def numeric_prefix_sort_key(filename):
     # 3) Convert to integer (assuming the entire name_without_ext is numeric)
     return int(name_without_ext)
 # ---------------------------
-# 2. 定义一个函数，用于从某个文件夹里顺序读图并拼成四维数组
+# 2. 列出某个文件夹里按序号排好的图像文件（解码在写入时按批进行）
 # ---------------------------
-def load_images_as_array(folder_path, sort_key=None):
+def list_image_files(folder_path, sort_key=numeric_prefix_sort_key):
     """
-    从folder_path读取全部图像文件，并拼成 (N, H, W, 3) 的numpy数组。
-    可选 sort_key 来进行特殊排序；默认会按文件名升序排序。
+    返回 folder_path 下全部 jpg/png 文件（按 sort_key 排序），没有则返回 None。
+    图像本身由 ingest_images 分批解码、缩放后直接写进预分配的 HDF5 数据集，
+    不再先拼成整段 (N, H, W, 3) 数组。
     """
-    # 找出该文件夹下的所有图片(根据实际情况改后缀，如 *.jpg, *.png)
     image_files = glob.glob(os.path.join(folder_path, "*.jpg"))
     image_files += glob.glob(os.path.join(folder_path, "*.png"))
     # 去重并排序
-    image_files = list(set(image_files))
-    image_files.sort(key=numeric_prefix_sort_key)
-    
+    image_files = sorted(set(image_files), key=sort_key)
+
     if len(image_files) == 0:
         print(f"警告：文件夹 {folder_path} 下未找到任何图像。")
         return None
-
-    arrays = []
-    for img_file in image_files:
-        img = Image.open(img_file).convert("RGB")  # 确保是3通道RGB
-        if RESIZE_TO_84x84:
-            img = img.resize((84, 84), resample=Image.BILINEAR)
-        arr = np.array(img, dtype=np.uint8)  # (H, W, 3)
-        arrays.append(arr)
-    
-    data = np.stack(arrays, axis=0)  # (num_frames, H, W, 3)
-    return data
+    return image_files
 
 def load_eef_states_into_dict(eef_folder, robot_dataset):
     """
@@ -140,77 +132,31 @@ with h5py.File(hdf5_path, "a") as f:  # 以 'a' 模式打开，允许写入
         panda_folder  = os.path.join(path_panda, str(episode_id))
 
         
-        sawyer_data = load_images_as_array(sawyer_folder)
-        iiwa_data    = load_images_as_array(iiwa_folder)
-        jaco_data  = load_images_as_array(jaco_folder)
-        ur5e_data  = load_images_as_array(ur5e_folder)
-        kinova3_data = load_images_as_array(kinova3_folder)
-        panda_data  = load_images_as_array(panda_folder)
+        image_files = {
+            "sawyer": list_image_files(sawyer_folder),
+            "iiwa": list_image_files(iiwa_folder),
+            "jaco": list_image_files(jaco_folder),
+            "ur5e": list_image_files(ur5e_folder),
+            "kinova3": list_image_files(kinova3_folder),
+            "panda": list_image_files(panda_folder),
+        }
 
-        
         # 如果某个文件夹为空或不存在，你要么跳过，要么给个警告
-        if (sawyer_data is None) or (iiwa_data is None) or (jaco_data is None) or (ur5e_data is None) or (kinova3_data is None) or (panda_data is None):
+        if any(files is None for files in image_files.values()):
             print(f"警告：Episode {demokey_pairing[episode_id]} 四类视角中有数据加载失败，跳过创建。")
             continue
-        
-        # 3.3 如果之前已存在同名数据集，先删除
-        if "agentview_image_sawyer" in obs_group:
-            del obs_group["agentview_image_sawyer"]
-        if "agentview_image_iiwa" in obs_group:
-            del obs_group["agentview_image_iiwa"]
-        if "agentview_image_jaco" in obs_group:
-            del obs_group["agentview_image_jaco"]
-        if "agentview_image_ur5e" in obs_group:
-            del obs_group["agentview_image_ur5e"]
-        if "agentview_image_kinova3" in obs_group:
-            del obs_group["agentview_image_kinova3"]
-        if "agentview_image_panda" in obs_group:
-            del obs_group["agentview_image_panda"]
-        
-        # 3.4 创建新的 dataset
-        #    可以考虑 compression、chunks 等参数，示例如下：
-        obs_group.create_dataset(
-            "agentview_image_sawyer", 
-            data=sawyer_data,
-            compression="gzip",
-            compression_opts=4,
-            chunks=True
-        )
-        obs_group.create_dataset(
-            "agentview_image_iiwa", 
-            data=iiwa_data,
-            compression="gzip",
-            compression_opts=4,
-            chunks=True
-        )
-        obs_group.create_dataset(
-            "agentview_image_jaco", 
-            data=jaco_data,
-            compression="gzip",
-            compression_opts=4,
-            chunks=True
-        )
-        obs_group.create_dataset(
-            "agentview_image_ur5e", 
-            data=ur5e_data,
-            compression="gzip",
-            compression_opts=4,
-            chunks=True
-        )
-        obs_group.create_dataset(
-            "agentview_image_kinova3", 
-            data=kinova3_data,
-            compression="gzip",
-            compression_opts=4,
-            chunks=True
-        )
-        obs_group.create_dataset(
-            "agentview_image_panda", 
-            data=panda_data,
-            compression="gzip",
-            compression_opts=4,
-            chunks=True
-        )
+
+        # 3.3 + 3.4 分批解码并写入预分配的 dataset（同名数据集会先被删除）
+        for robot, files in image_files.items():
+            ingest_images(
+                files,
+                obs_group,
+                f"agentview_image_{robot}",
+                size=(84, 84) if RESIZE_TO_84x84 else None,
+                chunk_frames=16,
+                compression="gzip",
+                compression_opts=4,
+            )
 
         # Sawyer
         if episode_id in sawyer_eef_dict:
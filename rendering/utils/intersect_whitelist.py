@@ -1,11 +1,27 @@
 import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from core.ledger import LEDGER_NAME, JobLedger
+
 whitelist_path = "/home/guanhuaji/mirage/robot2robot/rendering/paired_images"
 dataset        = "kaist"
 robots         = ["Panda", "IIWA", "Sawyer", "Jaco", "Kinova3"]
 
 whitelists = []
+json_sets = {}
+
+ledger_path = Path(whitelist_path) / dataset / LEDGER_NAME
+ledger_sets = ledger_common = None
+if ledger_path.exists():
+    with JobLedger(ledger_path, readonly=True) as ledger:
+        # robots the ledger has never seen are skipped, like a missing whitelist.json
+        present = [robot for robot in robots if ledger.has(dataset, robot)]
+        for robot in sorted(set(robots) - set(present)):
+            print(f"[WARN] {robot} not in {ledger_path} – skipping.")
+        ledger_sets = {robot: set(ledger.episodes(dataset, robot)) for robot in present}
+        ledger_common = set(ledger.intersection(dataset, present)) if present else None
 
 for robot in robots:
     whitelist_file = Path(whitelist_path) / dataset / robot / "whitelist.json"
@@ -21,12 +37,21 @@ for robot in robots:
             frames = next(iter(data.values()))  
 
         whitelists.append(set(frames))
+        json_sets[robot] = set(frames)
 
     except FileNotFoundError:
         print(f"[WARN] {whitelist_file} not found – skipping.")
     except json.JSONDecodeError:
         print(f"[ERROR] Invalid JSON in {whitelist_file} – skipping.")
 
+# ---- Prefer the ledger unless a whitelist.json knows episodes it does not ----
+if ledger_common is not None:
+    stale = [robot for robot, frames in json_sets.items() if not frames <= ledger_sets.get(robot, set())]
+    if stale:
+        print(f"[WARN] {ledger_path} is behind whitelist.json for {stale} – using the JSON files.")
+    else:
+        whitelists = [ledger_common]
+
 # ---- Intersection across all robots ----------------------------------------
 if whitelists:
     common_indices = sorted(set.intersection(*whitelists))